@@ -0,0 +1,157 @@
+# 檔名: asr_cpu_bench.py
+# 說明: ASR CPU 後端的準確度/延遲比較。對本地音檔集合，以各後端（fp32、int8 動態量化）
+#       載入同一個模型逐檔辨識，回報延遲、即時率（RTF）、模型大小與字元錯誤率（CER）。
+#       音檔旁有同名 .txt 時以其為參考答案；沒有時以第一個後端（通常是 fp32）的輸出為基準。
+#       解碼設定與線上相同，依音檔長度套用 decode_profiles.py 的 short / medium / long。
+#
+# 用法（於 services/ai-worker 目錄下）:
+#   python benchmarks/asr_cpu_bench.py --fixtures /data/asr-fixtures
+#   python benchmarks/asr_cpu_bench.py --fixtures /data/asr-fixtures --backends fp32,int8 --threads 4 --json
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "worker"))
+
+import torch  # noqa: E402
+from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor  # noqa: E402
+
+from stt_app.audio_decode import FFMPEG_AVAILABLE, TARGET_SAMPLE_RATE, decode_in_memory, stream_decode  # noqa: E402
+from stt_app.cpu_backend import configure_cpu_threads, model_size_bytes, prepare_cpu_model  # noqa: E402
+from stt_app.decode_profiles import profiles_from_env, run_profiled  # noqa: E402
+from stt_app.stt_service import build_asr_pipeline  # noqa: E402
+
+AUDIO_EXTENSIONS = (".wav", ".m4a", ".mp3", ".flac", ".ogg", ".aac")
+
+
+def _normalize(text: str) -> str:
+    # 只比較文字本身：去掉標點與空白，全形半形統一
+    text = unicodedata.normalize("NFKC", text or "")
+    return "".join(ch for ch in text if not (ch.isspace() or unicodedata.category(ch).startswith("P")))
+
+
+def char_error_rate(reference: str, hypothesis: str) -> float:
+    """字元層級的編輯距離 / 參考長度（中文逐字比較）。"""
+    ref, hyp = _normalize(reference), _normalize(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        current = [i]
+        for j, h in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def load_fixtures(directory: str) -> list:
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        if not path.lower().endswith(AUDIO_EXTENSIONS):
+            continue
+        with open(path, "rb") as f:
+            if FFMPEG_AVAILABLE:
+                audio = stream_decode(iter(lambda: f.read(64 * 1024), b""), TARGET_SAMPLE_RATE)
+            else:
+                audio = decode_in_memory(f.read(), TARGET_SAMPLE_RATE)
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                reference = f.read().strip()
+        fixtures.append({"name": os.path.basename(path), "audio": audio, "reference": reference})
+    return fixtures
+
+
+def run_backend(model_name: str, backend: str, fixtures: list, repeat: int) -> dict:
+    processor = AutoProcessor.from_pretrained(model_name)
+    model = AutoModelForSpeechSeq2Seq.from_pretrained(
+        model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True, use_safetensors=True
+    )
+    started = time.perf_counter()
+    model = prepare_cpu_model(model, backend)
+    prepare_s = time.perf_counter() - started
+    asr_pipe = build_asr_pipeline(model, processor, "cpu", torch.float32)
+    profiles = profiles_from_env()
+
+    # 預熱一次，排除第一次呼叫的配置成本
+    run_profiled(asr_pipe, [fixtures[0]["audio"][:TARGET_SAMPLE_RATE]], profiles, TARGET_SAMPLE_RATE)
+
+    files = []
+    for fixture in fixtures:
+        samples = []
+        text = ""
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = run_profiled(asr_pipe, [fixture["audio"]], profiles, TARGET_SAMPLE_RATE)[0]
+            text = (result.get("text", "") or "").strip()
+            samples.append(time.perf_counter() - started)
+        latency = statistics.median(samples)
+        files.append({
+            "name": fixture["name"],
+            "latency_s": latency,
+            "rtf": latency / (len(fixture["audio"]) / TARGET_SAMPLE_RATE),
+            "text": text,
+        })
+    latencies = sorted(row["latency_s"] for row in files)
+    return {
+        "backend": backend,
+        "prepare_s": prepare_s,
+        "model_mb": model_size_bytes(model) / 1024 / 1024,
+        "mean_latency_s": statistics.fmean(latencies),
+        "p95_latency_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "mean_rtf": statistics.fmean(row["rtf"] for row in files),
+        "files": files,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="ASR CPU 後端準確度/延遲比較")
+    parser.add_argument("--fixtures", required=True, help="音檔目錄（同名 .txt 為參考逐字稿）")
+    parser.add_argument("--model", default=os.environ.get(
+        "ASR_MODEL_NAME", "shaobai880824/breeze-asr-25-local-hokkien_v1"), help="ASR 模型 (默認: ASR_MODEL_NAME)")
+    parser.add_argument("--backends", default="fp32,int8", help="以逗號分隔的後端 (默認: fp32,int8)")
+    parser.add_argument("--threads", type=int, default=0, help="intra-op 執行緒數 (默認: PyTorch 預設)")
+    parser.add_argument("--repeat", type=int, default=1, help="每個音檔的量測次數，取中位數 (默認: 1)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出報表")
+    args = parser.parse_args(argv)
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"在 {args.fixtures} 找不到音檔", file=sys.stderr)
+        return 1
+    threads = configure_cpu_threads(args.threads or None)
+
+    results = [run_backend(args.model, backend.strip(), fixtures, args.repeat) for backend in args.backends.split(",")]
+    baseline = results[0]
+    for result in results:
+        errors = []
+        for fixture, row, base in zip(fixtures, result["files"], baseline["files"]):
+            reference = fixture["reference"] if fixture["reference"] is not None else base["text"]
+            row["cer"] = char_error_rate(reference, row["text"])
+            errors.append(row["cer"])
+        result["mean_cer"] = statistics.fmean(errors)
+        result["speedup"] = baseline["mean_latency_s"] / result["mean_latency_s"] if result["mean_latency_s"] else 0.0
+
+    report = {"model": args.model, "threads": threads, "files": len(fixtures), "results": results}
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 0
+    has_reference = all(fixture["reference"] is not None for fixture in fixtures)
+    print(f"model={args.model} threads={threads} files={len(fixtures)} "
+          f"cer_vs={'reference' if has_reference else baseline['backend']}")
+    print(f"{'backend':<10}{'model MB':>10}{'mean s':>10}{'p95 s':>10}{'RTF':>8}{'CER':>8}{'speedup':>9}")
+    for row in results:
+        print(f"{row['backend']:<10}{row['model_mb']:>10.1f}{row['mean_latency_s']:>10.3f}"
+              f"{row['p95_latency_s']:>10.3f}{row['mean_rtf']:>8.3f}{row['mean_cer']:>8.3f}{row['speedup']:>8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+# 檔名: pipeline_bench.py
+# 說明: 離線端到端管道壓測。以假 STT/LLM/TTS 與本地 MinIO/Redis/RabbitMQ 替身驅動真實的
+#       任務處理程式碼，輸出吞吐量、各階段延遲與佇列等待的百分位數，
+#       用來比較併發、分段管道、批次等調整的效果，不需要 GPU 或 OpenAI 金鑰。
+#
+# 用法（於 services/ai-worker 目錄下）:
+#   python benchmarks/pipeline_bench.py --target inline --tasks 40 --concurrency 4
+#   python benchmarks/pipeline_bench.py --target staged --tasks 40 --rate 2 --time-scale 0.1
+#   python benchmarks/pipeline_bench.py --target refactored --tts-latency lognormal:6,0.3 --json
+#
+# 目標：
+#   inline      main.handle_task（process_audio_task / process_text_task）
+#   refactored  AIServiceRefactored.process_task
+#   staged      pipeline.stages.StagePipeline，各階段以 AI_<STAGE>_CONCURRENCY 個 worker 消費
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "worker"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import (  # noqa: E402
+    InMemoryBroker,
+    InMemoryObjectStore,
+    InMemoryRedis,
+    LatencyModel,
+    StageRecorder,
+    StubBackends,
+    install_stub_modules,
+)
+
+AUDIO_BUCKET = "audio-uploads"
+
+# 報表中各階段的顯示順序
+REPORT_ORDER = [
+    "queue_wait",
+    "queue_wait_stt",
+    "queue_wait_llm",
+    "queue_wait_tts",
+    "minio_download",
+    "gpu_wait",
+    "stt_inference",
+    "llm",
+    "tts_inference",
+    "minio_upload",
+    "queue_publish",
+    "notification_publish",
+    "end_to_end",
+]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for stage, values in samples.items():
+        ordered = sorted(values)
+        summary[stage] = {
+            "count": len(ordered),
+            "mean_ms": sum(ordered) / len(ordered) * 1000,
+            "p50_ms": percentile(ordered, 50) * 1000,
+            "p95_ms": percentile(ordered, 95) * 1000,
+            "p99_ms": percentile(ordered, 99) * 1000,
+            "max_ms": ordered[-1] * 1000,
+        }
+    return summary
+
+
+def build_tasks(args, backends: StubBackends) -> List[Dict[str, Any]]:
+    rng = random.Random(args.seed)
+    tasks = []
+    for i in range(args.tasks):
+        patient_id = 1000 + (i % args.patients)
+        if rng.random() < args.text_ratio:
+            tasks.append({"patient_id": patient_id, "text": f"第 {i} 則文字訊息：今天咳嗽比較多"})
+        else:
+            object_name = f"bench-{i}.m4a"
+            backends.store.seed(AUDIO_BUCKET, object_name, bytes(args.audio_kb * 1024))
+            tasks.append({
+                "patient_id": patient_id,
+                "bucket_name": AUDIO_BUCKET,
+                "object_name": object_name,
+                "duration_ms": 5000,
+            })
+    return tasks
+
+
+def drive(tasks, handler: Callable[[Dict[str, Any]], None], args, recorder: StageRecorder,
+          sync_end_to_end: bool) -> int:
+    """以 KeyedTaskExecutor 模擬 ConcurrentTaskConsumer：同一病患依序、最多 concurrency 個併發。"""
+    from messaging.consumer import KeyedTaskExecutor
+
+    executor = KeyedTaskExecutor(args.concurrency, thread_name_prefix="bench")
+    errors = [0]
+    errors_lock = threading.Lock()
+    rng = random.Random(args.seed + 1)
+
+    def job(task, enqueued_at):
+        started = time.perf_counter()
+        recorder.record("queue_wait", started - enqueued_at)
+        try:
+            handler(dict(task))
+        except Exception as e:
+            with errors_lock:
+                errors[0] += 1
+            print(f" [!] 任務失敗: {e}", flush=True)
+        finally:
+            if sync_end_to_end:
+                recorder.record("end_to_end", time.perf_counter() - enqueued_at)
+
+    for task in tasks:
+        if args.rate > 0:
+            # Poisson 到達
+            time.sleep(rng.expovariate(args.rate))
+        task["_enqueued_at"] = time.perf_counter()
+        executor.submit(task["patient_id"], partial(job, task, task["_enqueued_at"]))
+    executor.shutdown(wait=True)
+    return errors[0]
+
+
+def run_inline(args, backends, tasks) -> int:
+    import main
+
+    main.get_publisher = lambda: backends.broker
+    return drive(tasks, main.handle_task, args, backends.recorder, sync_end_to_end=True)
+
+
+def run_refactored(args, backends, tasks) -> int:
+    from ai_service_refactored import AIServiceRefactored
+
+    service = AIServiceRefactored()
+    failed = [0]
+
+    def handler(task_data):
+        result = service.process_task(task_data)
+        # 通知步驟由呼叫端負責，成功的任務此時仍是 processing
+        if result.get("status") == "failed":
+            failed[0] += 1
+    errors = drive(tasks, handler, args, backends.recorder, sync_end_to_end=True)
+    return errors + failed[0]
+
+
+def run_staged(args, backends, tasks) -> int:
+    from messaging.consumer import KeyedTaskExecutor
+    from pipeline.stages import ALL_STAGES, LLM_STAGE, STT_STAGE, TTS_STAGE, StagePipeline, stage_concurrency, stage_queue_name
+
+    recorder = backends.recorder
+    enqueued_by_patient: Dict[Any, List[float]] = {}
+    pending = [len(tasks)]
+    done = threading.Event()
+    failures = [0]
+    lock = threading.Lock()
+
+    executors = {stage: KeyedTaskExecutor(stage_concurrency(stage), thread_name_prefix=f"bench-{stage}")
+                 for stage in ALL_STAGES}
+    queue_to_stage = {stage_queue_name(stage): stage for stage in ALL_STAGES}
+
+    def publish(queue_name, message, **kwargs):
+        backends.broker.publish(queue_name, message)
+        stage = queue_to_stage[queue_name]
+        enqueued_at = time.perf_counter()
+
+        def run():
+            recorder.record(f"queue_wait_{stage}", time.perf_counter() - enqueued_at)
+            pipeline.handle_stage(stage, message)
+        executors[stage].submit(str(message["task"]["patient_id"]), run)
+
+    def notify(payload, patient_id):
+        backends.broker.publish("notifications_queue", payload)
+        if payload.get("event") not in (None, "final"):
+            return
+        with lock:
+            enqueued_at = enqueued_by_patient[str(patient_id)].pop(0)
+            recorder.record("end_to_end", time.perf_counter() - enqueued_at)
+            if payload.get("status") != "completed":
+                failures[0] += 1
+            pending[0] -= 1
+            if pending[0] == 0:
+                done.set()
+
+    pipeline = StagePipeline(
+        publish=publish,
+        notify=notify,
+        service_factories={STT_STAGE: lambda: backends.stt, LLM_STAGE: lambda: backends.llm,
+                           TTS_STAGE: lambda: backends.tts},
+    )
+
+    for task in tasks:
+        enqueued_by_patient.setdefault(str(task["patient_id"]), [])
+
+    def dispatch(task_data):
+        with lock:
+            enqueued_by_patient[str(task_data["patient_id"])].append(task_data["_enqueued_at"])
+        try:
+            pipeline.dispatch(task_data)
+        except Exception:
+            # 分派失敗就不會有 final 通知，自行結算避免一直等待
+            with lock:
+                enqueued_by_patient[str(task_data["patient_id"])].remove(task_data["_enqueued_at"])
+                pending[0] -= 1
+                if pending[0] == 0:
+                    done.set()
+            raise
+
+    errors = drive(tasks, dispatch, args, recorder, sync_end_to_end=False)
+    done.wait()
+    for executor in executors.values():
+        executor.shutdown(wait=True)
+    return errors + failures[0]
+
+
+TARGETS = {
+    "inline": run_inline,
+    "refactored": run_refactored,
+    "staged": run_staged,
+}
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print("")
+    print(f"target={report['target']} tasks={report['tasks']} concurrency={report['concurrency']} "
+          f"text_ratio={report['text_ratio']} gpu_slots={report['gpu_slots']} time_scale={report['time_scale']}")
+    print(f"wall={report['wall_s']:.2f}s throughput={report['throughput_per_s']:.2f} tasks/s "
+          f"errors={report['errors']}")
+    print(f"{'stage':<22}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    stages = report["stages"]
+    for stage in REPORT_ORDER + sorted(set(stages) - set(REPORT_ORDER)):
+        if stage not in stages:
+            continue
+        row = stages[stage]
+        print(f"{stage:<22}{row['count']:>7}{row['mean_ms']:>10.1f}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="AI Worker 離線管道壓測（假模型）")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="inline", help="要驅動的處理流程 (默認: inline)")
+    parser.add_argument("--tasks", type=int, default=40, help="任務數 (默認: 40)")
+    parser.add_argument("--concurrency", type=int, default=4, help="消費者併發數 (默認: 4)")
+    parser.add_argument("--rate", type=float, default=0.0, help="每秒到達任務數，0 代表一次全部入列 (默認: 0)")
+    parser.add_argument("--patients", type=int, default=1000, help="不同病患數；同一病患的任務依序處理 (默認: 1000)")
+    parser.add_argument("--text-ratio", type=float, default=0.0, help="文字任務比例 (默認: 0)")
+    parser.add_argument("--audio-kb", type=int, default=64, help="每個輸入音檔大小 KB (默認: 64)")
+    parser.add_argument("--gpu-slots", type=int, default=1, help="STT/TTS 可同時推論的數量 (默認: 1)")
+    parser.add_argument("--stt-latency", default="lognormal:1.5,0.3", help="STT 推論延遲分佈（秒）")
+    parser.add_argument("--llm-latency", default="lognormal:2.0,0.4", help="LLM 延遲分佈（秒）")
+    parser.add_argument("--tts-latency", default="lognormal:6.0,0.3", help="TTS 推論延遲分佈（秒）")
+    parser.add_argument("--minio-get-latency", default="uniform:0.01,0.04", help="MinIO 下載延遲分佈（秒）")
+    parser.add_argument("--minio-put-latency", default="uniform:0.02,0.06", help="MinIO 上傳延遲分佈（秒）")
+    parser.add_argument("--redis-latency", default="0.001", help="Redis 操作延遲分佈（秒）")
+    parser.add_argument("--publish-latency", default="0.002", help="RabbitMQ 發佈延遲分佈（秒）")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="所有延遲乘上此倍率，用來加速試跑 (默認: 1)")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子 (默認: 42)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出報表")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+
+    def latency(spec):
+        return LatencyModel(spec, random.Random(rng.random()), args.time_scale)
+
+    recorder = StageRecorder()
+    backends = StubBackends(
+        recorder=recorder,
+        store=InMemoryObjectStore(recorder, latency(args.minio_get_latency), latency(args.minio_put_latency)),
+        redis=InMemoryRedis(latency(args.redis_latency)),
+        broker=InMemoryBroker(recorder, latency(args.publish_latency)),
+        stt_latency=latency(args.stt_latency),
+        llm_latency=latency(args.llm_latency),
+        tts_latency=latency(args.tts_latency),
+        gpu_slots=args.gpu_slots,
+    )
+    install_stub_modules(backends)
+    tasks = build_tasks(args, backends)
+
+    started = time.perf_counter()
+    errors = TARGETS[args.target](args, backends, tasks)
+    wall_s = time.perf_counter() - started
+
+    report = {
+        "target": args.target,
+        "tasks": args.tasks,
+        "concurrency": args.concurrency,
+        "text_ratio": args.text_ratio,
+        "gpu_slots": args.gpu_slots,
+        "time_scale": args.time_scale,
+        "wall_s": wall_s,
+        "throughput_per_s": args.tasks / wall_s if wall_s > 0 else 0.0,
+        "errors": errors,
+        "stages": summarize(recorder.samples),
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# 檔名: snac_codes_bench.py
+# 說明: SNAC code 重新分配的微基準。比較原本逐 token 的 Python 迴圈與張量化實作，
+#       輸入為模擬 Orpheus 輸出的 token（預設 1200 個新 token，與 synthesize 的 max_new_tokens 相同）。
+#
+# 用法（於 services/ai-worker 目錄下）:
+#   python benchmarks/snac_codes_bench.py
+#   python benchmarks/snac_codes_bench.py --batch 4 --new-tokens 1200 --repeat 50
+#   python benchmarks/snac_codes_bench.py --device cuda --json
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "worker"))
+
+from tts_app.snac_codes import (  # noqa: E402
+    AUDIO_TOKEN_OFFSET,
+    END_OF_SPEECH_TOKEN,
+    START_OF_AUDIO_TOKEN,
+    redistribute_codes,
+    redistribute_codes_loop,
+)
+
+
+def build_generated_ids(batch: int, prompt_len: int, new_tokens: int, seed: int) -> torch.Tensor:
+    """產生 (batch, prompt_len + 1 + new_tokens + 1) 的假生成結果：提示、起始 token、音訊 token、結束 token。"""
+    generator = torch.Generator().manual_seed(seed)
+    prompt = torch.randint(0, 128000, (batch, prompt_len), generator=generator)
+    positions = torch.arange(new_tokens) % 7
+    audio = AUDIO_TOKEN_OFFSET + positions * 4096 + torch.randint(0, 4096, (batch, new_tokens), generator=generator)
+    start = torch.full((batch, 1), START_OF_AUDIO_TOKEN)
+    end = torch.full((batch, 1), END_OF_SPEECH_TOKEN)
+    return torch.cat([prompt, start, audio, end], dim=1)
+
+
+def time_ms(fn, generated_ids: torch.Tensor, repeat: int, device: str) -> list:
+    samples = []
+    for _ in range(repeat):
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+        started = time.perf_counter()
+        fn(generated_ids)
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="SNAC code 重新分配微基準（迴圈 vs 張量化）")
+    parser.add_argument("--batch", type=int, default=1, help="批次列數 (默認: 1)")
+    parser.add_argument("--prompt-len", type=int, default=64, help="提示 token 數 (默認: 64)")
+    parser.add_argument("--new-tokens", type=int, default=1200, help="生成的音訊 token 數 (默認: 1200)")
+    parser.add_argument("--repeat", type=int, default=30, help="每種實作的量測次數 (默認: 30)")
+    parser.add_argument("--device", default="cpu", help="生成結果所在的裝置 (默認: cpu)")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子 (默認: 0)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出報表")
+    args = parser.parse_args(argv)
+
+    generated_ids = build_generated_ids(args.batch, args.prompt_len, args.new_tokens, args.seed).to(args.device)
+    # 預熱一次，排除第一次呼叫的配置成本
+    redistribute_codes(generated_ids)
+    redistribute_codes_loop(generated_ids)
+
+    report = {"batch": args.batch, "new_tokens": args.new_tokens, "device": args.device, "results": {}}
+    for name, fn in (("loop", redistribute_codes_loop), ("vectorized", redistribute_codes)):
+        samples = time_ms(fn, generated_ids, args.repeat, args.device)
+        report["results"][name] = {
+            "mean_ms": statistics.fmean(samples),
+            "p50_ms": statistics.median(samples),
+            "min_ms": min(samples),
+        }
+    loop_ms = report["results"]["loop"]["p50_ms"]
+    vectorized_ms = report["results"]["vectorized"]["p50_ms"]
+    report["speedup"] = loop_ms / vectorized_ms if vectorized_ms > 0 else float("inf")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"batch={args.batch} new_tokens={args.new_tokens} device={args.device} repeat={args.repeat}")
+    print(f"{'impl':<12}{'mean ms':>10}{'p50 ms':>10}{'min ms':>10}")
+    for name, row in report["results"].items():
+        print(f"{name:<12}{row['mean_ms']:>10.3f}{row['p50_ms']:>10.3f}{row['min_ms']:>10.3f}")
+    print(f"speedup (p50): {report['speedup']:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+# 檔名: stubs.py
+# 說明: 離線壓測用的假模型與本地替身。
+#       - FakeSTT / FakeLLM / FakeTTS：依可設定的延遲分佈 sleep，介面與真實服務相同。
+#       - InMemoryObjectStore / InMemoryRedis / InMemoryBroker：MinIO、Redis、RabbitMQ 的行程內替身。
+#       - install_stub_modules()：把 llm_app / stt_app / tts_app 換成假模組，
+#         讓 main.py 與 ai_service_refactored.py 不需要 GPU、模型權重或 OpenAI 金鑰即可匯入。
+
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+
+class LatencyModel:
+    """
+    延遲分佈（秒）。規格字串：
+      "0.5" 或 "const:0.5"      固定值
+      "uniform:0.2,0.8"         均勻分佈
+      "normal:0.5,0.1"          常態分佈（平均, 標準差），下限 0
+      "lognormal:0.5,0.3"       對數常態（中位數, sigma），適合長尾的模型推論
+    """
+
+    def __init__(self, spec: str, rng: random.Random, time_scale: float = 1.0):
+        self.spec = spec
+        self.time_scale = time_scale
+        self._rng = rng
+        kind, _, params = spec.partition(":")
+        if not params:
+            kind, params = "const", kind
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",")]
+        if self.kind not in ("const", "uniform", "normal", "lognormal"):
+            raise ValueError(f"未知的延遲分佈: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "const":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = self._rng.uniform(self.params[0], self.params[1])
+        elif self.kind == "normal":
+            value = self._rng.normalvariate(self.params[0], self.params[1])
+        else:
+            median, sigma = self.params
+            value = self._rng.lognormvariate(0.0, sigma) * median
+        return max(0.0, value) * self.time_scale
+
+    def sleep(self) -> float:
+        seconds = self.sample()
+        time.sleep(seconds)
+        return seconds
+
+
+class StageRecorder:
+    """收集每個階段的原始耗時樣本，用來計算百分位數。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    @contextmanager
+    def track(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+
+# --- 本地替身 ---
+
+class InMemoryObjectStore:
+    """MinIO 替身：物件存在 dict 中，讀寫時加上設定的延遲。"""
+
+    def __init__(self, recorder: StageRecorder, get_latency: LatencyModel, put_latency: LatencyModel):
+        self.recorder = recorder
+        self.get_latency = get_latency
+        self.put_latency = put_latency
+        self._objects: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def seed(self, bucket: str, name: str, data: bytes) -> None:
+        with self._lock:
+            self._objects[f"{bucket}/{name}"] = data
+
+    def get_object(self, bucket: str, name: str) -> bytes:
+        with self.recorder.track("minio_download"):
+            self.get_latency.sleep()
+            with self._lock:
+                return self._objects[f"{bucket}/{name}"]
+
+    def put_object(self, bucket: str, name: str, data: bytes) -> None:
+        with self.recorder.track("minio_upload"):
+            self.put_latency.sleep()
+            with self._lock:
+                self._objects[f"{bucket}/{name}"] = data
+
+
+class InMemoryRedis:
+    """Redis 替身：只實作 LLM 替身用到的 list 操作。"""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self._lists: Dict[str, deque] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def rpush(self, key: str, *values) -> int:
+        self.latency.sleep()
+        with self._lock:
+            self._lists[key].extend(values)
+            return len(self._lists[key])
+
+    def lrange(self, key: str, start: int, end: int) -> List[Any]:
+        self.latency.sleep()
+        with self._lock:
+            items = list(self._lists[key])
+        end = len(items) if end == -1 else end + 1
+        return items[start:end]
+
+
+class InMemoryBroker:
+    """RabbitMQ 替身：介面與 RabbitPublisher.publish 相同，訊息放進各佇列的 deque。"""
+
+    def __init__(self, recorder: StageRecorder, latency: LatencyModel):
+        self.recorder = recorder
+        self.latency = latency
+        self.queues: Dict[str, deque] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def publish(self, queue_name: str, message: Dict[str, Any], properties=None, wait: bool = True,
+                queue_arguments=None) -> Future:
+        stage = "notification_publish" if "notification" in queue_name else "queue_publish"
+        with self.recorder.track(stage):
+            self.latency.sleep()
+        with self._lock:
+            self.queues[queue_name].append(message)
+        future: Future = Future()
+        future.set_result(True)
+        return future
+
+
+# --- 假模型 ---
+
+@dataclass
+class StubBackends:
+    """一組共用的假服務；STT 與 TTS 共用 `gpu_slots` 個執行槽，模擬單張 GPU 的競爭。"""
+    recorder: StageRecorder
+    store: InMemoryObjectStore
+    redis: InMemoryRedis
+    broker: InMemoryBroker
+    stt_latency: LatencyModel
+    llm_latency: LatencyModel
+    tts_latency: LatencyModel
+    gpu_slots: int = 1
+    stt: Any = field(init=False)
+    llm: Any = field(init=False)
+    tts: Any = field(init=False)
+
+    def __post_init__(self):
+        gpu = threading.BoundedSemaphore(max(1, self.gpu_slots))
+        self.stt = FakeSTT(self, gpu)
+        self.llm = FakeLLM(self)
+        self.tts = FakeTTS(self, gpu)
+
+
+class FakeSTT:
+    def __init__(self, backends: StubBackends, gpu: threading.BoundedSemaphore):
+        self.backends = backends
+        self.gpu = gpu
+
+    def transcribe_audio(self, bucket_name: str, object_name: str) -> str:
+        audio = self.backends.store.get_object(bucket_name, object_name)
+        with self.backends.recorder.track("gpu_wait"):
+            self.gpu.acquire()
+        try:
+            with self.backends.recorder.track("stt_inference"):
+                self.backends.stt_latency.sleep()
+        finally:
+            self.gpu.release()
+        return f"我今天有點喘（{len(audio)} bytes）"
+
+
+class FakeLLM:
+    def __init__(self, backends: StubBackends):
+        self.backends = backends
+
+    def generate_response(self, task_data: Dict[str, Any]) -> str:
+        history_key = f"history:{task_data.get('patient_id')}"
+        history = self.backends.redis.lrange(history_key, -6, -1)
+        with self.backends.recorder.track("llm"):
+            self.backends.llm_latency.sleep()
+        reply = f"建議您先休息一下，慢慢深呼吸。（參考 {len(history)} 則對話）"
+        self.backends.redis.rpush(history_key, task_data.get("text", ""), reply)
+        return reply
+
+    def finalize_user_session_now(self, user_id: str) -> None:
+        pass
+
+
+class FakeTTS:
+    def __init__(self, backends: StubBackends, gpu: threading.BoundedSemaphore):
+        self.backends = backends
+        self.gpu = gpu
+
+    def synthesize_text(self, text: str):
+        with self.backends.recorder.track("gpu_wait"):
+            self.gpu.acquire()
+        try:
+            with self.backends.recorder.track("tts_inference"):
+                self.backends.tts_latency.sleep()
+        finally:
+            self.gpu.release()
+        # 約 5 字/秒的語速，產生 16kHz 16-bit 大小相當的假音訊
+        duration_ms = max(1000, len(text) * 200)
+        object_name = f"{uuid.uuid4()}.m4a"
+        self.backends.store.put_object("audio-bucket", object_name, bytes(duration_ms * 32))
+        return object_name, duration_ms
+
+
+def install_stub_modules(backends: StubBackends) -> None:
+    """
+    以假模組取代 llm_app / stt_app / tts_app，讓 main.py 與 ai_service_refactored.py 可以直接匯入。
+    服務類別被替換成回傳共用假服務的工廠，因此每次 `STTService()` 都拿到同一個 FakeSTT。
+    """
+    def module(name: str, package: bool = False, **attrs) -> types.ModuleType:
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attrs)
+        if package:
+            mod.__path__ = []
+        sys.modules[name] = mod
+        return mod
+
+    class _Scheduler:
+        def start(self):
+            pass
+
+    module("llm_app", package=True)
+    module(
+        "llm_app.llm_service",
+        LLMService=lambda: backends.llm,
+        llm_service_instance=backends.llm,
+        get_llm_service=lambda: backends.llm,
+    )
+    module("llm_app.ProactiveCare", package=True)
+    module(
+        "llm_app.ProactiveCare.scheduler",
+        scheduler=_Scheduler(),
+        initialize_scheduler=lambda: None,
+    )
+    module("llm_app.models", package=True)
+    module("llm_app.models.chat_profile", ChatUserProfile=object)
+    module("stt_app", package=True)
+    module(
+        "stt_app.stt_service",
+        STTService=lambda: backends.stt,
+        get_stt_service=lambda: backends.stt,
+    )
+    module("tts_app", package=True)
+    module(
+        "tts_app.tts_service",
+        TTSService=lambda: backends.tts,
+        get_tts_service=lambda: backends.tts,
+    )
@@ -0,0 +1,9 @@
+"""
+Test configuration for the ai-worker service
+"""
+
+import os
+import sys
+
+# worker/ 是執行時的根目錄（main.py 以 `python worker/main.py` 啟動）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "worker"))
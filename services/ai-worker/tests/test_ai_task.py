@@ -0,0 +1,45 @@
+"""
+Tests for AITask serialization between pipeline stages
+"""
+
+import json
+
+from domain.ai_task import AITask, ProcessingStep, TaskStatus
+
+
+def _task_mid_pipeline() -> AITask:
+    task = AITask.create_audio_task("7", "audio-uploads", "in.m4a", audio_duration_ms=3200, line_user_id="U1")
+    task.start_processing()
+    task.start_step(ProcessingStep.STT)
+    task.complete_step(ProcessingStep.STT, "我今天有點喘", {"model": "breeze-asr"})
+    task.start_step(ProcessingStep.LLM)
+    return task
+
+
+def test_round_trip_through_json_preserves_task_state():
+    task = _task_mid_pipeline()
+
+    restored = AITask.from_dict(json.loads(json.dumps(task.to_dict())))
+
+    assert restored.task_id == task.task_id
+    assert restored.task_type == task.task_type
+    assert restored.status == TaskStatus.PROCESSING
+    assert restored.input_text == "我今天有點喘"
+    assert restored.created_at == task.created_at
+    assert restored.started_at == task.started_at
+    assert [s.to_dict() for s in restored.processing_steps] == [s.to_dict() for s in task.processing_steps]
+    # 還原後可以接著完成同一個步驟
+    assert restored.complete_step(ProcessingStep.LLM, "建議您先休息一下")
+    assert restored.task_metadata["ai_response"] == "建議您先休息一下"
+
+
+def test_get_step_result_finds_the_step_regardless_of_status():
+    task = _task_mid_pipeline()
+
+    stt = task.get_step_result(ProcessingStep.STT)
+    llm = task.get_step_result(ProcessingStep.LLM)
+
+    assert stt.status == TaskStatus.COMPLETED and stt.output == "我今天有點喘"
+    assert stt.metadata == {"model": "breeze-asr"}
+    assert llm.status == TaskStatus.PROCESSING
+    assert AITask.create_text_task("7", "你好").get_step_result(ProcessingStep.STT) is None
@@ -0,0 +1,35 @@
+"""
+Tests for the int8 CPU ASR backend
+"""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+# stt_app 套件的 __init__ 會匯入 stt_service（依賴 minio）
+pytest.importorskip("minio")
+
+from stt_app.cpu_backend import model_size_bytes, prepare_cpu_model  # noqa: E402
+
+
+def _model():
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Linear(256, 256), torch.nn.GELU(), torch.nn.Linear(256, 32))
+
+
+def test_int8_backend_quantizes_linear_layers_and_stays_close_to_fp32():
+    model = _model()
+    x = torch.randn(8, 256)
+    expected = model(x)
+
+    quantized = prepare_cpu_model(_model(), "int8")
+
+    assert all(type(layer) is not torch.nn.Linear for layer in quantized if hasattr(layer, "weight"))
+    assert model_size_bytes(quantized) < model_size_bytes(model) / 3
+    assert torch.allclose(quantized(x), expected, atol=0.05)
+
+
+def test_fp32_backend_keeps_the_model_and_unknown_backends_fail():
+    model = _model()
+    assert prepare_cpu_model(model, "fp32") is model
+    with pytest.raises(ValueError, match="onnx"):
+        prepare_cpu_model(model, "onnx")
@@ -0,0 +1,83 @@
+"""
+Tests for the streaming STT audio decoder
+"""
+
+import shutil
+import time
+
+import numpy as np
+import pytest
+
+# stt_app 套件的 __init__ 會匯入 stt_service（依賴 minio）
+pytest.importorskip("minio")
+
+from stt_app import audio_decode  # noqa: E402
+from stt_app.audio_decode import DecodeError, TimedChunks, stream_decode  # noqa: E402
+
+
+def _chunks(data: bytes, size: int):
+    for offset in range(0, len(data), size):
+        yield data[offset : offset + size]
+
+
+def test_chunks_are_streamed_through_the_decoder():
+    # `cat` 當作解碼器：輸出即為輸入的 float32 PCM，可驗證分塊寫入與讀回
+    waveform = np.linspace(-1, 1, 300_000, dtype=np.float32)
+
+    decoded = stream_decode(_chunks(waveform.tobytes(), 7000), command=["cat"])
+
+    assert decoded.dtype == np.float32
+    assert np.array_equal(decoded, waveform)
+
+
+def test_decoder_failure_raises_decode_error():
+    with pytest.raises(DecodeError, match="invalid data"):
+        stream_decode(
+            _chunks(b"\0" * 10_000, 1000),
+            command=["sh", "-c", "cat >/dev/null; echo invalid data >&2; exit 1"],
+        )
+
+
+def test_source_errors_propagate_to_the_caller():
+    def broken_source():
+        yield b"\0" * 4096
+        raise ConnectionError("connection reset")
+
+    with pytest.raises(ConnectionError, match="connection reset"):
+        stream_decode(broken_source(), command=["cat"])
+
+
+def test_resamplers_are_cached_per_source_rate():
+    pytest.importorskip("torchaudio")
+    assert audio_decode.get_resampler(44100) is audio_decode.get_resampler(44100)
+    assert audio_decode.get_resampler(44100) is not audio_decode.get_resampler(48000)
+    assert len(audio_decode.resample(np.zeros(44100, dtype=np.float32), 44100)) == 16000
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_ffmpeg_decodes_to_16khz_mono():
+    wav = np.zeros(48000, dtype=np.float32).tobytes()
+    decoded = stream_decode(
+        _chunks(wav, 4096),
+        command=["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "f32le", "-ar", "48000", "-ac", "2",
+                 "-i", "pipe:0", "-f", "f32le", "-ac", "1", "-ar", "16000", "pipe:1"],
+    )
+    assert len(decoded) == 8000
+
+
+def test_timed_chunks_counts_only_time_spent_waiting_for_data():
+    def slow_source():
+        time.sleep(0.05)
+        yield b"a"
+        time.sleep(0.05)
+        yield b"b"
+
+    chunks = TimedChunks(slow_source())
+    received = []
+    for chunk in chunks:
+        received.append(chunk)
+        time.sleep(0.1)  # 消費端（解碼）的時間不計入
+
+    assert received == [b"a", b"b"]
+    assert 0.09 <= chunks.seconds < 0.19
+
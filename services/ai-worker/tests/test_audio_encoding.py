@@ -0,0 +1,46 @@
+"""
+Tests for in-memory TTS encoding piped into a streaming upload
+"""
+
+import shutil
+
+import numpy as np
+import pytest
+
+from tts_app.audio_encoding import EncodeError, samples_to_ms, stream_encoded_upload
+
+
+def test_duration_comes_from_sample_count():
+    assert samples_to_ms(36000, 24000) == 1500
+
+
+def test_encoder_output_is_streamed_to_upload():
+    # `cat` 當作編碼器：輸出即為輸入的 float32 PCM，可驗證串流與位元組計數
+    waveform = np.linspace(-1, 1, 200_000, dtype=np.float32)
+    uploaded = []
+
+    size = stream_encoded_upload(waveform, lambda stream: uploaded.append(stream.read(-1)), command=["cat"])
+
+    assert size == waveform.nbytes
+    assert np.array_equal(np.frombuffer(uploaded[0], dtype="<f4"), waveform)
+
+
+def test_encoder_failure_raises_after_upload():
+    waveform = np.zeros(1000, dtype=np.float32)
+
+    with pytest.raises(EncodeError, match="bad codec"):
+        stream_encoded_upload(
+            waveform,
+            lambda stream: stream.read(-1),
+            command=["sh", "-c", "cat >/dev/null; echo bad codec >&2; exit 3"],
+        )
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_ffmpeg_produces_fragmented_mp4():
+    waveform = (0.2 * np.sin(np.arange(24000) / 24000 * 2 * np.pi * 440)).astype(np.float32)
+    uploaded = []
+
+    stream_encoded_upload(waveform, lambda stream: uploaded.append(stream.read(-1)))
+
+    assert uploaded[0][4:8] == b"ftyp"
@@ -0,0 +1,50 @@
+"""
+Tests for the micro-batcher used by ASR
+"""
+
+import threading
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def test_concurrent_requests_share_one_batch_and_get_their_own_result():
+    batches = []
+    release = threading.Event()
+
+    def process(items):
+        release.wait(1)
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(4)]
+    release.set()
+
+    assert [future.result(timeout=2) for future in futures] == [0, 10, 20, 30]
+    assert batches == [[0, 1, 2, 3]]
+    batcher.close()
+
+
+def test_batch_failure_is_raised_to_every_caller():
+    def process(items):
+        raise ValueError("decode failed")
+
+    batcher = MicroBatcher(process, max_batch_size=2, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(2)]
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=2)
+    batcher.close()
+
+
+def test_close_drains_pending_requests():
+    batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_batch_size=1, max_wait_ms=0)
+    futures = [batcher.submit(i) for i in range(5)]
+    batcher.close(timeout=2)
+
+    assert [future.result(timeout=2) for future in futures] == [1, 2, 3, 4, 5]
+    with pytest.raises(RuntimeError):
+        batcher.submit(0)
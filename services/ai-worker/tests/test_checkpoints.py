@@ -0,0 +1,50 @@
+"""
+Tests for the inline pipeline's step checkpoints
+"""
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from messaging.consumer import RETRY_KEY_FIELD, ensure_retry_key  # noqa: E402
+from pipeline.checkpoints import StepCheckpoints  # noqa: E402
+
+
+def test_retry_key_is_added_once_and_kept():
+    task_data = {"patient_id": 7, "text": "你好"}
+
+    assert ensure_retry_key(task_data)
+    key = task_data[RETRY_KEY_FIELD]
+    assert not ensure_retry_key(task_data)
+    assert task_data[RETRY_KEY_FIELD] == key
+
+
+def test_completed_steps_are_visible_to_the_retry():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    first_attempt = StepCheckpoints(client, "abc", ttl_s=60)
+    first_attempt.put("llm", "建議您先休息一下")
+    first_attempt.put("tts", ["reply.m4a", 1200])
+
+    retry = StepCheckpoints(client, "abc", ttl_s=60)
+    assert retry.get("stt") is None
+    assert retry.get("llm") == "建議您先休息一下"
+    assert retry.get("tts") == ["reply.m4a", 1200]
+    assert 0 < client.ttl(retry.key) <= 60
+    assert StepCheckpoints(client, "other").get("llm") is None
+
+
+def test_missing_key_or_redis_errors_mean_the_step_runs():
+    class BrokenRedis:
+        def hget(self, *args):
+            raise ConnectionError("redis down")
+
+        def pipeline(self):
+            raise ConnectionError("redis down")
+
+    no_key = StepCheckpoints(fakeredis.FakeRedis(decode_responses=True), None)
+    no_key.put("llm", "reply")
+    assert no_key.get("llm") is None
+
+    broken = StepCheckpoints(BrokenRedis(), "abc")
+    broken.put("llm", "reply")
+    assert broken.get("llm") is None
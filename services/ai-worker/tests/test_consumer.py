@@ -0,0 +1,154 @@
+"""
+Tests for the concurrent task consumer's keyed executor
+"""
+
+import json
+import threading
+import time
+
+from messaging import consumer as consumer_module
+from messaging.consumer import ConcurrentTaskConsumer, KeyedTaskExecutor, patient_key, task_lanes_from_env
+
+
+def test_same_key_runs_in_submission_order():
+    executor = KeyedTaskExecutor(max_workers=4)
+    seen = []
+    done = threading.Event()
+
+    def make_job(i):
+        def job():
+            time.sleep(0.01 * (5 - i))  # 先提交的工作反而比較慢
+            seen.append(i)
+            if i == 4:
+                done.set()
+        return job
+
+    for i in range(5):
+        executor.submit("patient-1", make_job(i))
+
+    assert done.wait(timeout=5)
+    executor.shutdown()
+    assert seen == [0, 1, 2, 3, 4]
+
+
+def test_different_keys_run_concurrently():
+    executor = KeyedTaskExecutor(max_workers=2)
+    barrier = threading.Barrier(2, timeout=5)
+    results = []
+
+    def job(name):
+        barrier.wait()  # 兩個工作必須同時在執行才能通過
+        results.append(name)
+
+    executor.submit("patient-1", lambda: job("a"))
+    executor.submit("patient-2", lambda: job("b"))
+    executor.shutdown(wait=True)
+
+    assert sorted(results) == ["a", "b"]
+    assert executor.active_keys() == 0
+
+
+def test_failed_job_does_not_block_key():
+    executor = KeyedTaskExecutor(max_workers=1)
+    seen = []
+
+    def boom():
+        raise RuntimeError("boom")
+
+    executor.submit("patient-1", boom)
+    executor.submit("patient-1", lambda: seen.append("next"))
+    executor.shutdown(wait=True)
+
+    assert seen == ["next"]
+
+
+def test_patient_key_groups_by_patient_id():
+    assert patient_key({"patient_id": 7}) == patient_key({"patient_id": "7"})
+    assert patient_key({}) == "unknown"
+
+
+class FakeLaneChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.is_open = True
+
+    def queue_declare(self, queue, durable, passive=False):
+        pass
+
+    def basic_qos(self, prefetch_count):
+        pass
+
+    def basic_consume(self, queue, on_message_callback):
+        self.connection.callbacks[queue] = (self, on_message_callback)
+
+    def basic_ack(self, delivery_tag):
+        self.connection.acked.append(delivery_tag)
+
+    def start_consuming(self):
+        self.connection.deliver()
+
+
+class FakeLaneConnection:
+    """依序把 `messages` [(queue, task_data), ...] 投遞給對應 lane 的 callback，等全部 ack 後返回。"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.callbacks = {}
+        self.acked = []
+        self._lock = threading.Lock()
+        self.is_open = True
+
+    def channel(self):
+        return FakeLaneChannel(self)
+
+    def add_callback_threadsafe(self, fn):
+        with self._lock:
+            fn()
+
+    def deliver(self):
+        for tag, (queue_name, task_data) in enumerate(self.messages, 1):
+            channel, callback = self.callbacks[queue_name]
+            method = type("Method", (), {"delivery_tag": tag})()
+            callback(channel, method, None, json.dumps(task_data).encode("utf-8"))
+        deadline = time.monotonic() + 5
+        while len(self.acked) < len(self.messages) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+def test_text_lane_is_not_blocked_by_audio_backlog(monkeypatch):
+    monkeypatch.setenv("AI_WORKER_CONCURRENCY", "1")
+    text_done = threading.Event()
+    seen = []
+    messages = [
+        ("task_queue", {"patient_id": 1, "object_name": "a1.m4a"}),
+        ("task_queue", {"patient_id": 1, "object_name": "a2.m4a"}),
+        ("text_task_queue", {"patient_id": 1, "text": "你好"}),
+        ("task_queue", {"patient_id": 1, "object_name": "a3.m4a"}),
+    ]
+    connection = FakeLaneConnection(messages)
+    monkeypatch.setattr(consumer_module.pika, "BlockingConnection", lambda parameters: connection)
+
+    def handler(task_data):
+        if "text" in task_data:
+            seen.append(("text", threading.current_thread().name))
+            text_done.set()
+            return
+        if task_data["object_name"] == "a1.m4a":
+            # 音訊 lane 唯一的 worker 卡在第一筆，直到同一位病患的文字任務先完成
+            assert text_done.wait(timeout=5)
+        seen.append((task_data["object_name"], threading.current_thread().name))
+
+    consumer = ConcurrentTaskConsumer(
+        rabbitmq_host="rabbitmq",
+        handler=handler,
+        lanes=task_lanes_from_env("task_queue", "text_task_queue"),
+        depth_poll_s=0,
+    )
+    consumer.start_consuming()
+    for executor in consumer.executors.values():
+        executor.shutdown(wait=True)
+
+    assert [name for name, _ in seen] == ["text", "a1.m4a", "a2.m4a", "a3.m4a"]
+    assert seen[0][1].startswith("ai-text")
+    assert all(thread.startswith("ai-audio") for _, thread in seen[1:])
+    assert sorted(connection.acked) == [1, 2, 3, 4]
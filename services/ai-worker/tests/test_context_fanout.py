@@ -0,0 +1,74 @@
+"""
+Tests for the parallel context fan-out used by handle_user_message
+"""
+
+import time
+
+from llm_app.fanout import FanOut
+
+
+def _sleep_then(value, seconds):
+    time.sleep(seconds)
+    return value
+
+
+def test_independent_calls_run_concurrently():
+    fan = FanOut()
+    started = time.perf_counter()
+    for name in ("profile", "summary", "history", "embedding"):
+        fan.submit(name, _sleep_then, name, 0.2, timeout_s=2)
+
+    assert [fan.result(name) for name in ("profile", "summary", "history", "embedding")] == [
+        "profile", "summary", "history", "embedding"
+    ]
+    assert time.perf_counter() - started < 0.6
+
+
+def test_timeouts_and_errors_fall_back_to_defaults():
+    def boom():
+        raise ConnectionError("milvus down")
+
+    fan = FanOut()
+    fan.submit("slow", _sleep_then, "late", 1.0, timeout_s=0.1, default="")
+    fan.submit("broken", boom, timeout_s=1, default="SKIP")
+
+    started = time.perf_counter()
+    assert fan.result("slow") == ""
+    assert time.perf_counter() - started < 0.5
+    assert fan.result("broken") == "SKIP"
+    assert "slow=" in fan.report() and "[timeout]" in fan.report()
+
+
+def test_critical_path_follows_dependencies():
+    fan = FanOut()
+    fan.submit("guardrail", _sleep_then, "OK", 0.05, timeout_s=2)
+    fan.submit("memory_gate", _sleep_then, "USE", 0.15, timeout_s=2)
+    fan.submit("embedding", _sleep_then, [0.1], 0.05, timeout_s=2)
+    fan.submit("history", _sleep_then, "", 0.01, timeout_s=2)
+    fan.result("guardrail")
+    fan.result("memory_gate")
+    fan.result("embedding")
+    fan.submit("memory", _sleep_then, "pack", 0.1, timeout_s=2, deps=("memory_gate", "embedding"))
+    fan.result("memory")
+    fan.result("history")
+
+    assert [call.name for call in fan.critical_path()] == ["memory_gate", "memory"]
+    assert "關鍵路徑: memory_gate(" in fan.report()
+
+
+def test_a_guardrail_fallback_extends_the_critical_path():
+    fan = FanOut()
+    fan.submit("guardrail", _sleep_then, "OK", 1.0, timeout_s=0.05, default=None)
+    fan.submit("history", _sleep_then, "", 0.01, timeout_s=2)
+
+    assert fan.result("guardrail") is None
+    assert "guardrail_fallback" not in fan
+    fan.submit("guardrail_fallback", _sleep_then, "OK", 0.05, timeout_s=2, deps=("guardrail",))
+    assert "guardrail_fallback" in fan
+    fan.result("guardrail_fallback")
+    fan.submit("memory_gate", _sleep_then, "SKIP", 0.05, timeout_s=2, deps=("guardrail_fallback",))
+    fan.result("memory_gate")
+    fan.result("history")
+
+    assert [call.name for call in fan.critical_path()] == ["guardrail", "guardrail_fallback", "memory_gate"]
+
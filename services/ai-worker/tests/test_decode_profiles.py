@@ -0,0 +1,48 @@
+"""
+Tests for length-aware ASR decode profiles
+"""
+
+import numpy as np
+import pytest
+
+# stt_app 套件的 __init__ 會匯入 stt_service（依賴 minio）
+pytest.importorskip("minio")
+
+from stt_app.decode_profiles import profiles_from_env, run_profiled, select_profile  # noqa: E402
+
+RATE = 16000
+
+
+def test_profiles_are_selected_by_duration(monkeypatch):
+    monkeypatch.setenv("ASR_SHORT_MAX_S", "5")
+    profiles = profiles_from_env()
+
+    assert select_profile(1.0, profiles).name == "short"
+    assert select_profile(5.0, profiles).name == "short"
+    assert select_profile(12.0, profiles).name == "medium"
+    assert select_profile(120.0, profiles).name == "long"
+    assert profiles[0].pipeline_kwargs == {"return_timestamps": False}
+    assert "chunk_length_s" not in profiles[1].pipeline_kwargs
+    assert profiles[2].pipeline_kwargs["stride_length_s"] == 5
+
+
+def test_each_profile_group_gets_one_pipeline_call_and_order_is_kept():
+    calls = []
+
+    def fake_pipe(inputs, **kwargs):
+        calls.append((len(inputs), kwargs))
+        return [{"text": str(len(audio) // RATE)} for audio in inputs]
+
+    durations = [2, 60, 3, 20, 1]
+    inputs = [np.zeros(seconds * RATE, dtype=np.float32) for seconds in durations]
+
+    results = run_profiled(fake_pipe, inputs, profiles_from_env(), RATE)
+
+    assert [result["text"] for result in results] == [str(seconds) for seconds in durations]
+    assert [(size, kwargs.get("chunk_length_s"), kwargs["return_timestamps"]) for size, kwargs in calls] == [
+        (3, None, False),
+        (1, None, True),
+        (1, 30.0, True),
+    ]
+    assert calls[0][1]["batch_size"] == 3
+    assert calls[2][1]["batch_size"] == 8
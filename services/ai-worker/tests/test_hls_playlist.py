@@ -0,0 +1,62 @@
+"""
+Tests for the HLS media playlist written by streaming TTS
+"""
+
+from tts_app.audio_encoding import ffmpeg_ts_command
+from tts_app.hls_playlist import media_playlist, target_duration
+
+
+def parse_media_playlist(text):
+    """依 RFC 8216 的媒體播放清單規則解析，違反規則時 AssertionError。"""
+    lines = text.splitlines()
+    assert lines[0] == "#EXTM3U"
+    tags, segments, pending = {}, [], None
+    for line in lines[1:]:
+        if line.startswith("#EXTINF:"):
+            assert pending is None, "兩個 #EXTINF 之間缺少片段 URI"
+            pending = float(line[len("#EXTINF:"):].split(",", 1)[0])
+        elif line.startswith("#EXT-X-ENDLIST"):
+            tags["ENDLIST"] = True
+        elif line.startswith("#EXT-X-"):
+            name, _, value = line[len("#EXT-X-"):].partition(":")
+            assert not segments, f"{name} 必須出現在第一個片段之前"
+            tags[name] = value
+        else:
+            assert pending is not None, f"片段 {line} 缺少 #EXTINF"
+            segments.append((line, pending))
+            pending = None
+    assert pending is None
+    assert {"VERSION", "TARGETDURATION"} <= tags.keys()
+    assert "MAP" not in tags  # MPEG-TS 片段不需要 init segment
+    for _, duration in segments:
+        assert round(duration) <= int(tags["TARGETDURATION"])
+    return tags, segments
+
+
+def test_live_playlist_is_a_valid_event_playlist_without_endlist():
+    entries = [("seg-0000.ts", 1109), ("seg-0001.ts", 1024)]
+
+    tags, segments = parse_media_playlist(media_playlist(entries, target_duration([1109])))
+
+    assert tags["PLAYLIST-TYPE"] == "EVENT"
+    assert tags["MEDIA-SEQUENCE"] == "0"
+    assert "ENDLIST" not in tags
+    assert segments == [("seg-0000.ts", 1.109), ("seg-0001.ts", 1.024)]
+
+
+def test_finished_playlist_ends_with_endlist():
+    entries = [("seg-0000.ts", 1109), ("seg-0001.ts", 2600)]
+
+    text = media_playlist(entries, target_duration([1109, 2600]), ended=True)
+    tags, _ = parse_media_playlist(text)
+
+    assert tags["ENDLIST"]
+    assert text.rstrip().splitlines()[-1] == "#EXT-X-ENDLIST"
+    assert tags["TARGETDURATION"] == "3"
+
+
+def test_segments_are_mpegts_with_continuous_timestamps():
+    command = ffmpeg_ts_command(2.048)
+
+    assert command[command.index("-f", command.index("pipe:0")) + 1] == "mpegts"
+    assert command[command.index("-output_ts_offset") + 1] == "2.048"
@@ -0,0 +1,56 @@
+"""
+Tests for per-stage latency metrics
+"""
+
+import pytest
+
+import metrics
+from mappers.task_mapper import TaskMapper
+
+pytestmark = pytest.mark.skipif(
+    not metrics.PROMETHEUS_AVAILABLE, reason="prometheus_client not installed"
+)
+
+
+def _count(stage, task_type, status):
+    from prometheus_client import REGISTRY
+
+    value = REGISTRY.get_sample_value(
+        "ai_worker_stage_seconds_count",
+        {"stage": stage, "task_type": task_type, "status": status},
+    )
+    return value or 0.0
+
+
+def test_track_stage_records_outcome_and_task_type():
+    before_ok = _count("stt", "audio_stt_llm_tts", "ok")
+    before_error = _count("stt", "audio_stt_llm_tts", "error")
+
+    with metrics.track_stage("stt", "audio_stt_llm_tts"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.track_stage("stt", "audio_stt_llm_tts"):
+            raise RuntimeError("boom")
+
+    assert _count("stt", "audio_stt_llm_tts", "ok") == before_ok + 1
+    assert _count("stt", "audio_stt_llm_tts", "error") == before_error + 1
+
+
+def test_nested_stage_inherits_task_type():
+    before = _count("minio_download", "text_only", "ok")
+
+    with metrics.task_type_context("text_only"):
+        with metrics.track_stage("minio_download"):
+            pass
+
+    assert _count("minio_download", "text_only", "ok") == before + 1
+    assert metrics.current_task_type() == "unknown"
+
+
+def test_task_type_label_for_raw_and_stage_messages():
+    assert TaskMapper.task_type_label({"patient_id": 1, "text": "hi"}) == "text_only"
+    assert TaskMapper.task_type_label(
+        {"patient_id": 1, "bucket_name": "b", "object_name": "o"}
+    ) == "audio_stt_llm_tts"
+    assert TaskMapper.task_type_label({"task": {"task_type": "llm_tts"}}) == "llm_tts"
+    assert TaskMapper.task_type_label({"patient_id": 1}) == "unknown"
@@ -0,0 +1,49 @@
+"""
+Tests for the process-wide model registry
+"""
+
+import threading
+
+from model_registry import STATE_LOADED, STATE_UNLOADED, ModelRegistry
+
+
+class Model:
+    pass
+
+
+def test_concurrent_get_loads_once():
+    loads = []
+    gate = threading.Event()
+
+    def loader():
+        gate.wait(1)
+        loads.append(1)
+        return Model()
+
+    registry = ModelRegistry()
+    registry.register("stt", loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("stt"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert all(instance is results[0] for instance in results)
+    assert registry.status()["models"]["stt"]["state"] == STATE_LOADED
+
+
+def test_idle_models_unload_but_not_while_in_use():
+    unloaded = []
+    registry = ModelRegistry(default_idle_ttl_s=10)
+    registry.register("tts", Model, unloader=unloaded.append)
+
+    with registry.use("tts") as first:
+        assert registry.unload_idle(now=float("inf")) == []
+
+    assert registry.unload_idle(now=float("inf")) == ["tts"]
+    assert unloaded == [first]
+    assert registry.status()["models"]["tts"]["state"] == STATE_UNLOADED
+    assert registry.get("tts") is not first
@@ -0,0 +1,88 @@
+"""
+Tests for the TTS voice-prefix KV cache, using a tiny random-weight causal LM
+"""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from tts_app.prefix_cache import PrefixKVCache, configured_voices  # noqa: E402
+
+
+@pytest.fixture
+def tiny_lm():
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=64,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=128,
+    )
+    model = transformers.LlamaForCausalLM(config).eval()
+    prefill_lengths = []
+    model.model.register_forward_pre_hook(
+        lambda module, args, kwargs: prefill_lengths.append(kwargs["input_ids"].shape[1]), with_kwargs=True
+    )
+    return model, prefill_lengths
+
+
+def _generate_without_cache(model, input_ids):
+    with torch.no_grad():
+        return model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=12,
+            do_sample=False,
+            pad_token_id=0,
+        )
+
+
+def test_cached_prefix_generates_the_same_tokens(tiny_lm):
+    model, _ = tiny_lm
+    prefix = torch.tensor([[60, 1, 17, 23, 9]])
+    cache = PrefixKVCache(model)
+
+    for suffix in ([[30, 31, 32]], [[41, 42, 43, 44, 45, 61, 62]]):
+        suffix = torch.tensor(suffix)
+        expected = _generate_without_cache(model, torch.cat([prefix, suffix], dim=1))
+
+        actual = cache.generate(prefix, suffix, max_new_tokens=12, do_sample=False, pad_token_id=0)
+
+        assert torch.equal(actual, expected)
+
+
+def test_prefix_is_computed_once_and_only_the_suffix_is_prefilled(tiny_lm):
+    model, prefill_lengths = tiny_lm
+    prefix = torch.tensor([[60, 1, 17, 23, 9]])
+    suffix = torch.tensor([[30, 31, 32]])
+    cache = PrefixKVCache(model)
+
+    cache.generate(prefix, suffix, max_new_tokens=2, do_sample=False, pad_token_id=0)
+    cache.generate(prefix, suffix, max_new_tokens=2, do_sample=False, pad_token_id=0)
+
+    # 前綴 5 個 token 只跑一次；之後每次生成只 prefill 後綴 3 個 token，再逐 token 解碼
+    assert prefill_lengths == [5, 3, 1, 3, 1]
+    assert len(cache) == 1
+
+
+def test_least_recently_used_prefix_is_evicted(tiny_lm):
+    model, _ = tiny_lm
+    cache = PrefixKVCache(model, max_entries=2)
+
+    for voice_token in (10, 11, 10, 12):
+        cache.cache_for(torch.tensor([[60, voice_token]]))
+
+    assert len(cache) == 2
+    assert (60, 11) not in cache._entries
+
+
+def test_configured_voices_are_the_default_plus_tts_voices(monkeypatch):
+    monkeypatch.setenv("TTS_VOICES", "小美, 湘湘,,阿明")
+    assert configured_voices("湘湘") == ["湘湘", "小美", "阿明"]
+
+    monkeypatch.delenv("TTS_VOICES")
+    assert configured_voices("湘湘") == ["湘湘"]
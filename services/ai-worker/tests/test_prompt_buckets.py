@@ -0,0 +1,47 @@
+"""
+Tests for TTS prompt-length bucketing
+"""
+
+from tts_app.prompt_buckets import (
+    bucket_length,
+    buckets_from_env,
+    parse_buckets,
+    segment_max_new_tokens,
+    warmup_batch_sizes,
+)
+
+
+def test_lengths_round_up_to_the_next_bucket():
+    buckets = [32, 64, 128]
+
+    assert [bucket_length(n, buckets) for n in (1, 32, 33, 100, 128)] == [32, 32, 64, 128, 128]
+
+
+def test_lengths_beyond_the_largest_bucket_are_unchanged():
+    assert bucket_length(300, [32, 64]) == 300
+    assert bucket_length(17, []) == 17
+
+
+def test_bucket_spec_parsing(monkeypatch):
+    assert parse_buckets("128, 32,64,32") == [32, 64, 128]
+
+    monkeypatch.setenv("TTS_PROMPT_BUCKETS", "")
+    assert buckets_from_env() == []
+
+
+def test_warmup_covers_every_segment_batch_size(monkeypatch):
+    monkeypatch.delenv("TTS_WARMUP_BATCH_SIZES", raising=False)
+    monkeypatch.setenv("TTS_SEGMENT_BATCH_SIZE", "3")
+    assert warmup_batch_sizes() == (1, 2, 3)
+
+    monkeypatch.setenv("TTS_WARMUP_BATCH_SIZES", "4,1")
+    assert warmup_batch_sizes() == (1, 4)
+
+
+def test_segment_token_limit_is_read_from_one_setting(monkeypatch):
+    monkeypatch.delenv("TTS_SEGMENT_MAX_NEW_TOKENS", raising=False)
+    assert segment_max_new_tokens() == 1200
+
+    monkeypatch.setenv("TTS_SEGMENT_MAX_NEW_TOKENS", "800")
+    assert segment_max_new_tokens() == 800
+
@@ -0,0 +1,148 @@
+"""
+Tests for the long-lived RabbitMQ publisher (with a fake pika connection)
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import pytest
+from pika.exceptions import AMQPConnectionError, NackError
+
+from messaging import publisher as publisher_module
+from messaging.publisher import RabbitPublisher
+
+
+class FakeChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.is_closed = False
+
+    def confirm_delivery(self):
+        self.connection.confirms = True
+
+    def queue_declare(self, queue, durable, arguments=None):
+        self.connection.declared.append(queue)
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.connection.on_publish(routing_key, json.loads(body))
+        self.connection.published.append((routing_key, json.loads(body)))
+
+
+class FakeConnection:
+    """`on_publish` / `on_flush` 可替換成會拋例外或阻塞的函式來模擬 broker 的行為。"""
+
+    def __init__(self):
+        self.is_closed = False
+        self.confirms = False
+        self.declared = []
+        self.published = []
+        self.flushes = []
+        self.on_publish = lambda queue_name, message: None
+        self.on_flush = lambda: None
+
+    @property
+    def is_open(self):
+        return not self.is_closed
+
+    def channel(self):
+        return FakeChannel(self)
+
+    def process_data_events(self, time_limit=None):
+        self.on_flush()
+        self.flushes.append(len(self.published))
+
+    def close(self):
+        self.is_closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """每次 BlockingConnection() 取出下一個預先準備的 FakeConnection（不夠時自動補上）。"""
+    created = []
+    prepared = []
+
+    def connect(parameters):
+        connection = prepared.pop(0) if prepared else FakeConnection()
+        created.append(connection)
+        return connection
+
+    monkeypatch.setattr(publisher_module.pika, "BlockingConnection", connect)
+    return created, prepared
+
+
+def test_nack_surfaces_as_an_error(connections):
+    _, prepared = connections
+    connection = FakeConnection()
+
+    def nack(queue_name, message):
+        raise NackError([message])
+
+    connection.on_publish = nack
+    prepared.append(connection)
+    publisher = RabbitPublisher("rabbitmq", confirm_delivery=True)
+    try:
+        with pytest.raises(NackError):
+            publisher.publish("notifications", {"id": 1})
+        assert connection.confirms
+    finally:
+        publisher.close()
+
+
+def test_confirm_timeout_surfaces_as_an_error(connections):
+    _, prepared = connections
+    connection = FakeConnection()
+    release = threading.Event()
+    connection.on_publish = lambda queue_name, message: release.wait(timeout=5)
+    prepared.append(connection)
+    publisher = RabbitPublisher("rabbitmq", confirm_delivery=True, publish_timeout_s=0.1)
+    try:
+        with pytest.raises(FutureTimeout):
+            publisher.publish("notifications", {"id": 1})
+    finally:
+        release.set()
+        publisher.close()
+
+
+def test_channel_error_reconnects_and_resends_unflushed_messages(connections):
+    created, prepared = connections
+    broken = FakeConnection()
+
+    def drop():
+        raise AMQPConnectionError("connection reset")
+
+    broken.on_flush = drop
+    prepared.append(broken)
+    publisher = RabbitPublisher(
+        "rabbitmq", confirm_delivery=False, batch_size=2, batch_window_ms=200, reconnect_delay_s=0
+    )
+    try:
+        futures = [publisher.publish("notifications", {"id": i}, wait=False) for i in range(2)]
+        assert [future.result(timeout=5) for future in futures] == [True, True]
+    finally:
+        publisher.close()
+
+    assert len(created) == 2
+    assert broken.is_closed
+    # 第一個連線寫出但沒能 flush 的兩則訊息，在新連線上依序重送
+    assert created[1].published == [("notifications", {"id": 0}), ("notifications", {"id": 1})]
+    assert created[1].declared == ["notifications"]
+
+
+def test_batch_window_flushes_a_partial_batch_once(connections):
+    created, _ = connections
+    publisher = RabbitPublisher("rabbitmq", confirm_delivery=False, batch_size=8, batch_window_ms=100)
+    try:
+        started = time.monotonic()
+        futures = [publisher.publish("notifications", {"id": i}, wait=False) for i in range(3)]
+        assert [future.result(timeout=5) for future in futures] == [True] * 3
+        elapsed = time.monotonic() - started
+    finally:
+        publisher.close()
+
+    # 批次未滿，等到視窗結束才送出；三則訊息只 flush 一次
+    assert elapsed >= 0.09
+    assert len(created) == 1
+    assert [message["id"] for _, message in created[0].published] == [0, 1, 2]
+    assert created[0].flushes[0] == 3
@@ -0,0 +1,73 @@
+"""
+Tests for delayed retry and dead-lettering
+"""
+
+from messaging.retry import (
+    LAST_ERROR_HEADER,
+    RETRY_COUNT_HEADER,
+    NonRetryableError,
+    RetryPolicy,
+)
+
+
+class RecordingPublisher:
+    def __init__(self):
+        self.published = []
+
+    def __call__(self, queue_name, message, properties=None, queue_arguments=None):
+        self.published.append((queue_name, message, properties.headers, queue_arguments))
+
+
+def test_backoff_grows_and_is_capped():
+    policy = RetryPolicy(publish=None, base_delay_ms=1000, multiplier=3, max_delay_ms=5000)
+
+    assert [policy.delay_ms(n) for n in (1, 2, 3, 4)] == [1000, 3000, 5000, 5000]
+
+
+def test_failure_goes_to_delayed_retry_queue_that_dead_letters_back():
+    publish = RecordingPublisher()
+    policy = RetryPolicy(publish=publish, max_attempts=3, base_delay_ms=2000)
+
+    outcome = policy.handle_failure("task_queue", {"patient_id": 1}, None, TimeoutError("openai"))
+
+    assert outcome == "retry"
+    queue_name, message, headers, arguments = publish.published[0]
+    assert queue_name == "task_queue.retry.2000ms"
+    assert message == {"patient_id": 1}
+    assert headers[RETRY_COUNT_HEADER] == 1
+    assert "openai" in headers[LAST_ERROR_HEADER]
+    assert arguments == {
+        "x-message-ttl": 2000,
+        "x-dead-letter-exchange": "",
+        "x-dead-letter-routing-key": "task_queue",
+    }
+
+
+def test_exhausted_attempts_go_to_dlq_and_notify_once():
+    publish = RecordingPublisher()
+    dead = []
+    policy = RetryPolicy(
+        publish=publish, max_attempts=3, on_dead_letter=lambda task, error: dead.append(task)
+    )
+
+    outcome = policy.handle_failure(
+        "task_queue", {"patient_id": 1}, {RETRY_COUNT_HEADER: 2, "x-death": [{}]}, RuntimeError("boom")
+    )
+
+    assert outcome == "dead_letter"
+    queue_name, _, headers, arguments = publish.published[0]
+    assert queue_name == "task_queue.dlq"
+    assert headers[RETRY_COUNT_HEADER] == 3
+    assert "x-death" not in headers
+    assert arguments is None
+    assert dead == [{"patient_id": 1}]
+
+
+def test_non_retryable_error_skips_retries():
+    publish = RecordingPublisher()
+    policy = RetryPolicy(publish=publish, max_attempts=5)
+
+    outcome = policy.handle_failure("task_queue", {}, None, NonRetryableError("bad format"))
+
+    assert outcome == "dead_letter"
+    assert publish.published[0][0] == "task_queue.dlq"
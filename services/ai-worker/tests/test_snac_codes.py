@@ -0,0 +1,117 @@
+"""
+Equivalence tests for the vectorized SNAC code redistribution
+"""
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from tts_app.snac_codes import (  # noqa: E402
+    AUDIO_TOKEN_OFFSET,
+    END_OF_SPEECH_TOKEN,
+    START_OF_AUDIO_TOKEN,
+    WindowedSnacDecoder,
+    decode_batch,
+    redistribute_codes,
+    redistribute_codes_loop,
+)
+
+
+def _generated_row(generator, prompt_len, frames, extra=0, restart=False):
+    prompt = torch.randint(0, 128000, (prompt_len,), generator=generator)
+    body = []
+    for _ in range(frames * 7 + extra):
+        position = len(body) % 7
+        body.append(AUDIO_TOKEN_OFFSET + position * 4096 + int(torch.randint(0, 4096, (1,), generator=generator)))
+    row = [*prompt.tolist(), START_OF_AUDIO_TOKEN]
+    if restart:
+        # 第二個起始 token 之前的內容要被丟掉
+        row += body[:10] + [START_OF_AUDIO_TOKEN]
+    row += body + [END_OF_SPEECH_TOKEN, END_OF_SPEECH_TOKEN]
+    return row
+
+
+def _assert_same(actual, expected):
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        if want is None:
+            assert got is None
+            continue
+        for got_layer, want_layer in zip(got, want):
+            assert got_layer.dtype == want_layer.dtype == torch.int32
+            assert torch.equal(got_layer, want_layer)
+
+
+@pytest.mark.parametrize("frames,extra,restart", [(1, 0, False), (40, 3, False), (12, 6, True), (0, 5, False)])
+def test_matches_loop_for_single_rows(frames, extra, restart):
+    generator = torch.Generator().manual_seed(frames + extra)
+    row = torch.tensor([_generated_row(generator, 9, frames, extra, restart)])
+
+    _assert_same(redistribute_codes(row), redistribute_codes_loop(row))
+
+
+def test_matches_loop_for_left_padded_batch():
+    generator = torch.Generator().manual_seed(0)
+    rows = [
+        _generated_row(generator, 5, 20),
+        _generated_row(generator, 12, 3, extra=2, restart=True),
+        _generated_row(generator, 7, 0),
+    ]
+    width = max(len(row) for row in rows)
+    # generate() 的批次輸出以 pad token 靠左補齊
+    batch = torch.tensor([[128263] * (width - len(row)) + row for row in rows])
+
+    _assert_same(redistribute_codes(batch), redistribute_codes_loop(batch))
+
+
+def test_row_without_start_token_uses_whole_row():
+    row = torch.tensor([[AUDIO_TOKEN_OFFSET + p * 4096 for p in range(7)]])
+
+    codes = redistribute_codes(row)[0]
+
+    assert [layer.tolist() for layer in codes] == [[[0]], [[0, 0]], [[0, 0, 0, 0]]]
+    _assert_same(redistribute_codes(row), redistribute_codes_loop(row))
+
+
+def _fake_snac_decode(codes, samples_per_frame=4):
+    # 每個 frame 輸出 samples_per_frame 個樣本，值為該 frame 的第一層 code
+    return codes[0].to(torch.float32).repeat_interleave(samples_per_frame, dim=1).unsqueeze(1)
+
+
+def test_windowed_decoder_streams_the_same_audio_as_a_full_decode():
+    generator = torch.Generator().manual_seed(3)
+    row = _generated_row(generator, 6, 30, extra=4)
+    decoder = WindowedSnacDecoder(
+        _fake_snac_decode, window_frames=8, context_frames=2, lookahead_frames=1, samples_per_frame=4
+    )
+
+    segments = []
+    first_segment_at = None
+    for position, token in enumerate(row):
+        produced = decoder.feed([token])
+        if produced and first_segment_at is None:
+            first_segment_at = position
+        segments.extend(produced)
+    segments.extend(decoder.flush())
+
+    full = _fake_snac_decode(redistribute_codes(torch.tensor([row]))[0]).reshape(-1).numpy()
+    assert first_segment_at is not None and first_segment_at < len(row) // 2
+    assert len(segments) > 1
+    assert np.array_equal(np.concatenate(segments), full)
+
+
+def test_decode_batch_matches_individual_decodes():
+    generator = torch.Generator().manual_seed(4)
+    items = [redistribute_codes(torch.tensor([_generated_row(generator, 0, frames)]))[0] for frames in (5, 2, 9)]
+    calls = []
+
+    def decode(codes):
+        calls.append(codes[0].shape[0])
+        return _fake_snac_decode(codes)
+
+    outputs = decode_batch(decode, items, samples_per_frame=4)
+
+    assert calls == [3]
+    for codes, output in zip(items, outputs):
+        assert torch.equal(output, _fake_snac_decode(codes))
@@ -0,0 +1,155 @@
+"""
+Tests for the stage-split pipeline's notifications
+"""
+
+from collections import deque
+from contextlib import nullcontext
+
+import pytest
+
+from messaging.retry import NonRetryableError
+from pipeline.stages import LLM_STAGE, STT_STAGE, TTS_STAGE, StagePipeline, stage_queue_name
+
+
+class FakeSTT:
+    def transcribe_audio(self, bucket, obj):
+        return "我今天有點喘"
+
+
+class FakeLLM:
+    def generate_response(self, task_data):
+        return "建議您先休息一下"
+
+
+class FakeTTS:
+    def synthesize_text(self, text):
+        return "reply.m4a", 1200
+
+
+def _factories(STT):
+    return {
+        STT_STAGE: lambda: nullcontext(STT()),
+        LLM_STAGE: lambda: nullcontext(FakeLLM()),
+        TTS_STAGE: lambda: nullcontext(FakeTTS()),
+    }
+
+
+def _run(progressive):
+    queue = deque()
+    notifications = []
+    pipeline = StagePipeline(
+        publish=lambda queue_name, message: queue.append((queue_name, message)),
+        notify=lambda payload, patient_id: notifications.append(payload),
+        service_factories=_factories(STT=FakeSTT),
+        progressive=progressive,
+    )
+    stages = {stage_queue_name(stage): stage for stage in (STT_STAGE, LLM_STAGE, TTS_STAGE)}
+
+    pipeline.dispatch({"patient_id": 7, "bucket_name": "audio", "object_name": "in.m4a"})
+    while queue:
+        queue_name, message = queue.popleft()
+        pipeline.handle_stage(stages[queue_name], message)
+    return notifications
+
+
+def test_progressive_mode_sends_partial_events_before_final():
+    notifications = _run(progressive=True)
+
+    assert [n["event"] for n in notifications] == ["transcript", "reply", "final"]
+    assert len({n["task_id"] for n in notifications}) == 1
+    assert notifications[0]["status"] == "partial"
+    assert "ai_response" not in notifications[0]
+    assert notifications[1]["ai_response"] == "建議您先休息一下"
+    assert notifications[2]["response_audio_url"] == "reply.m4a"
+    assert notifications[2]["audio_duration_ms"] == 1200
+
+
+def test_default_mode_sends_only_final_event():
+    notifications = _run(progressive=False)
+
+    assert [n["event"] for n in notifications] == ["final"]
+    assert notifications[0]["status"] == "completed"
+
+
+class FlakySTT:
+    def transcribe_audio(self, bucket, obj):
+        raise ConnectionError("minio unavailable")
+
+
+class EmptySTT:
+    def transcribe_audio(self, bucket, obj):
+        return ""
+
+
+def _stt_message(stt_factory):
+    queue = deque()
+    notifications = []
+    pipeline = StagePipeline(
+        publish=lambda queue_name, message: queue.append((queue_name, message)),
+        notify=lambda payload, patient_id: notifications.append(payload),
+        service_factories=_factories(STT=stt_factory),
+    )
+    pipeline.dispatch({"patient_id": 7, "bucket_name": "audio", "object_name": "in.m4a"})
+    return pipeline, queue.popleft()[1], notifications
+
+
+def test_transient_stage_error_propagates_to_the_retry_policy():
+    pipeline, message, notifications = _stt_message(FlakySTT)
+
+    with pytest.raises(ConnectionError):
+        pipeline.handle_stage(STT_STAGE, message)
+    assert notifications == []
+
+    # 重試用盡後才通知使用者
+    pipeline.notify_dead_letter(message, ConnectionError("minio unavailable"))
+    assert [n["event"] for n in notifications] == ["final"]
+    assert notifications[0]["status"] == "failed"
+    assert "minio unavailable" in notifications[0]["error_message"]
+
+
+def test_unknown_task_format_is_dead_lettered_instead_of_dropped():
+    published = []
+    pipeline = StagePipeline(
+        publish=lambda queue_name, message: published.append(queue_name),
+        notify=lambda payload, patient_id: None,
+        service_factories=_factories(STT=FakeSTT),
+    )
+
+    with pytest.raises(NonRetryableError, match="未知的任務格式"):
+        pipeline.dispatch({"patient_id": 7, "kind": "video"})
+    assert published == []
+
+
+def test_empty_transcript_fails_without_retrying():
+    pipeline, message, notifications = _stt_message(EmptySTT)
+
+    pipeline.handle_stage(STT_STAGE, message)
+
+    assert [n["status"] for n in notifications] == ["failed"]
+
+
+def test_stage_holds_the_model_for_the_whole_call():
+    from model_registry import ModelRegistry
+
+    registry = ModelRegistry(default_idle_ttl_s=0.01)
+    unloaded_during_call = []
+
+    class ReaperRacingSTT(FakeSTT):
+        def transcribe_audio(self, bucket, obj):
+            # 閒置時間早已超過；模型使用中，卸載必須被拒絕
+            unloaded_during_call.append(registry.unload_idle(now=float("inf")))
+            return super().transcribe_audio(bucket, obj)
+
+    registry.register("stt", ReaperRacingSTT)
+    queue = deque()
+    pipeline = StagePipeline(
+        publish=lambda queue_name, message: queue.append((queue_name, message)),
+        notify=lambda payload, patient_id: None,
+        service_factories={STT_STAGE: lambda: registry.use("stt")},
+    )
+    pipeline.dispatch({"patient_id": 7, "bucket_name": "audio", "object_name": "in.m4a"})
+    pipeline.handle_stage(STT_STAGE, queue.popleft()[1])
+
+    assert unloaded_during_call == [[]]
+    assert queue[0][0] == stage_queue_name(LLM_STAGE)
+    assert registry.unload_idle(now=float("inf")) == ["stt"]
@@ -0,0 +1,147 @@
+"""
+Tests for incremental (streaming) transcription over buffered audio segments
+"""
+
+import numpy as np
+import pytest
+
+# stt_app 套件的 __init__ 會匯入 stt_service（依賴 minio）
+pytest.importorskip("minio")
+
+from stt_app.streaming import StreamingTranscriber, StreamSessions, pcm16_to_float  # noqa: E402
+
+RATE = 16000
+
+
+def _tone(seconds):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def _silence(seconds):
+    return (np.random.default_rng(0).standard_normal(int(seconds * RATE)) * 1e-4).astype(np.float32)
+
+
+def _fake_transcribe(audio):
+    # 每段輸出其語音長度（十分之一秒），方便驗證切段位置
+    return f"<{np.count_nonzero(np.abs(audio) > 1e-2) * 10 // RATE}>"
+
+
+def _speech(text):
+    return int(text.strip("<>"))
+
+
+def _feed_in_chunks(stream, waveform, chunk_s=0.25):
+    step = int(chunk_s * RATE)
+    for offset in range(0, len(waveform), step):
+        stream.feed(waveform[offset : offset + step])
+
+
+def test_pauses_commit_partials_and_finish_returns_only_the_tail():
+    sunk = []
+    stream = StreamingTranscriber(_fake_transcribe, sunk.append, RATE)
+    _feed_in_chunks(
+        stream,
+        np.concatenate([_tone(3), _silence(1), _tone(2), _silence(1.2), _tone(1.5), _silence(0.3)]),
+    )
+    tail = stream.finish()
+
+    # 兩個停頓各提交一段 partial，結束時只剩最後一句需要辨識
+    assert sunk == stream.partials
+    assert [_speech(text) for text in sunk] == pytest.approx([30, 20], abs=1)
+    assert _speech(tail) == pytest.approx(15, abs=1)
+
+
+def test_long_speech_without_pauses_is_committed_at_the_window_limit():
+    sunk = []
+    stream = StreamingTranscriber(_fake_transcribe, sunk.append, RATE, max_window_s=5)
+    _feed_in_chunks(stream, _tone(12))
+    stream.finish()
+
+    assert len(sunk) == 2
+
+
+def test_silence_only_never_reaches_asr():
+    calls = []
+    stream = StreamingTranscriber(lambda audio: calls.append(audio) or "", lambda text: None, RATE, max_window_s=3)
+    _feed_in_chunks(stream, _silence(10))
+
+    assert calls == []
+    assert stream.buffered_seconds < 3
+
+
+def test_errors_in_partials_surface_on_finish():
+    def transcribe(audio):
+        raise RuntimeError("asr failed")
+
+    stream = StreamingTranscriber(transcribe, lambda text: None, RATE)
+    _feed_in_chunks(stream, np.concatenate([_tone(3), _silence(1)]))
+
+    with pytest.raises(RuntimeError, match="asr failed"):
+        stream.finish()
+    with pytest.raises(RuntimeError):
+        stream.feed(_tone(1))
+
+
+class _FakeSTTService:
+    def __init__(self, partials):
+        self.partials = partials
+
+    def open_stream(self, user_id, audio_id):
+        sink = lambda text: self.partials.append((user_id, audio_id, text))  # noqa: E731
+        return StreamingTranscriber(_fake_transcribe, sink, sample_rate=RATE)
+
+
+class _Held:
+    """記錄 STT 服務被持有的次數，模擬 model_registry.use("stt")。"""
+
+    def __init__(self, service):
+        self.service = service
+        self.in_use = 0
+
+    def __call__(self):
+        held = self
+
+        class _Use:
+            def __enter__(self):
+                held.in_use += 1
+                return held.service
+
+            def __exit__(self, *exc):
+                held.in_use -= 1
+
+        return _Use()
+
+
+def test_sessions_hold_the_model_until_finish_and_buffer_partials_per_audio_id():
+    partials = []
+    held = _Held(_FakeSTTService(partials))
+    sessions = StreamSessions(held)
+    pcm = (np.concatenate([_tone(3), _silence(1), _tone(1)]) * 32767).astype("<i2").tobytes()
+
+    for offset in range(0, len(pcm), 8000):
+        sessions.feed("7", "voice-1", pcm16_to_float(pcm[offset : offset + 8000]))
+    assert held.in_use == 1 and len(sessions) == 1
+
+    tail = sessions.finish("7", "voice-1")
+
+    assert [(user, audio) for user, audio, _ in partials] == [("7", "voice-1")]
+    assert _speech(partials[0][2]) == pytest.approx(30, abs=1)
+    assert _speech(tail) == pytest.approx(10, abs=1)
+    assert held.in_use == 0 and len(sessions) == 0
+    with pytest.raises(KeyError):
+        sessions.finish("7", "voice-1")
+
+
+def test_idle_sessions_are_released():
+    now = [0.0]
+    held = _Held(_FakeSTTService([]))
+    sessions = StreamSessions(held, idle_timeout_s=60, clock=lambda: now[0])
+    sessions.feed("7", "voice-1", _tone(0.5))
+
+    now[0] = 61.0
+    assert sessions.expire_idle() == 1
+    assert held.in_use == 0
+    with pytest.raises(KeyError):
+        sessions.finish("7", "voice-1")
+
@@ -0,0 +1,65 @@
+"""
+Tests for sentence-split TTS planning and crossfaded concatenation
+"""
+
+import numpy as np
+
+from tts_app.synthesis_plan import crossfade_concat, pipelined, split_sentences
+
+
+def test_splits_at_sentence_punctuation_and_keeps_all_text():
+    text = "您好，今天感覺怎麼樣？如果有點喘，請先坐下休息。記得按時用藥！"
+
+    segments = split_sentences(text, max_chars=15, min_chars=2)
+
+    assert segments == ["您好，今天感覺怎麼樣？", "如果有點喘，請先坐下休息。", "記得按時用藥！"]
+    assert "".join(segments) == text
+
+
+def test_long_sentence_is_split_at_commas_then_hard_cut():
+    text = "呼吸訓練" * 5 + "，" + "慢慢吐氣" * 20 + "。"
+
+    segments = split_sentences(text, max_chars=30)
+
+    assert all(len(segment) <= 30 for segment in segments)
+    assert "".join(segments) == text
+
+
+def test_short_tail_is_merged_into_previous_segment():
+    assert split_sentences("請多喝水，保持室內通風。好。", max_chars=20, min_chars=4) == ["請多喝水，保持室內通風。好。"]
+
+
+def test_short_text_is_a_single_segment():
+    assert split_sentences("早安！", max_chars=60) == ["早安！"]
+    assert split_sentences("  ") == []
+
+
+def test_crossfade_overlaps_neighbouring_segments():
+    a = np.ones(1000, dtype=np.float32)
+    b = np.ones(1000, dtype=np.float32) * 0.5
+
+    joined = crossfade_concat([a, None, b], sample_rate=10000, crossfade_ms=10)
+
+    assert len(joined) == 2000 - 100
+    assert joined[0] == 1.0 and joined[-1] == 0.5
+    assert np.all(joined[900:1000] <= 1.0 * np.sqrt(2) + 1e-6)
+
+
+def test_pipelined_collects_each_batch_after_the_next_one_starts():
+    events = []
+
+    def start(batch):
+        events.append(("generate", batch))
+        return lambda: events.append(("collect", batch)) or [f"wave-{batch}"]
+
+    assert pipelined([1, 2, 3], start) == ["wave-1", "wave-2", "wave-3"]
+    assert events == [
+        ("generate", 1),
+        ("generate", 2),
+        ("collect", 1),
+        ("generate", 3),
+        ("collect", 2),
+        ("collect", 3),
+    ]
+    assert pipelined([], start) == []
+
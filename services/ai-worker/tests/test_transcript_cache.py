@@ -0,0 +1,86 @@
+"""
+Tests for the content-hash transcript cache
+"""
+
+import hashlib
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+# stt_app 套件的 __init__ 會匯入 stt_service（依賴 minio）
+pytest.importorskip("minio")
+
+from stt_app.transcript_cache import HashingStream, TranscriptCache, etag_content_hash  # noqa: E402
+
+
+def test_hash_is_computed_while_the_stream_is_consumed():
+    chunks = [b"voice", b"-note", b"-bytes"]
+    stream = HashingStream(iter(chunks))
+
+    assert b"".join(stream) == b"voice-note-bytes"
+    assert stream.hexdigest() == hashlib.md5(b"voice-note-bytes").hexdigest()
+
+
+def test_only_single_part_etags_are_content_hashes():
+    md5 = hashlib.md5(b"x").hexdigest()
+    assert etag_content_hash(f'"{md5}"') == md5
+    assert etag_content_hash(f"{md5}-3") is None
+    assert etag_content_hash(None) is None
+
+
+def test_transcripts_expire_and_are_scoped_to_the_model():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    cache = TranscriptCache(client, "breeze-asr", ttl_s=60)
+    other_model = TranscriptCache(client, "whisper", ttl_s=60)
+    content_hash = hashlib.md5(b"audio").hexdigest()
+
+    assert cache.lookup(content_hash) is None
+    cache.store(content_hash, "今天有點喘")
+
+    assert cache.lookup(content_hash) == "今天有點喘"
+    assert other_model.lookup(content_hash) is None
+    assert 0 < client.ttl(cache._key(content_hash)) <= 60
+
+
+def test_redis_errors_are_treated_as_misses():
+    class BrokenRedis:
+        def get(self, key):
+            raise ConnectionError("redis down")
+
+        def set(self, *args, **kwargs):
+            raise ConnectionError("redis down")
+
+    cache = TranscriptCache(BrokenRedis(), "breeze-asr")
+    cache.store("0" * 32, "text")
+    assert cache.lookup("0" * 32) is None
+
+
+def test_service_serves_cache_hits_without_running_asr(monkeypatch):
+    from stt_app import stt_service, transcript_cache
+
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(transcript_cache.redis.Redis, "from_url", lambda *args, **kwargs: client)
+    monkeypatch.setenv("ASR_BATCH_WINDOW_MS", "0")
+    asr_calls = []
+
+    def fake_load(self):
+        self.asr_pipe = lambda *args, **kwargs: asr_calls.append(args) or [{"text": "不該被呼叫"}]
+
+    monkeypatch.setattr(stt_service.STTService, "_maybe_load_asr", fake_load)
+    service = stt_service.STTService()
+    assert service.transcript_cache is not None
+
+    content_hash = hashlib.md5(b"voice-note").hexdigest()
+    service.transcript_cache.store(content_hash, "今天有點喘")
+
+    class FakeMinio:
+        def stat_object(self, bucket, name):
+            return type("Stat", (), {"etag": f'"{content_hash}"'})()
+
+        def get_object(self, bucket, name):
+            raise AssertionError("快取命中時不應下載物件")
+
+    service.minio_client = FakeMinio()
+
+    assert service.transcribe_audio("audio-uploads", "voice.m4a") == "今天有點喘"
+    assert asr_calls == []
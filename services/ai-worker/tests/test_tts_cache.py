@@ -0,0 +1,80 @@
+"""
+Tests for the content-addressed TTS audio cache
+"""
+
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from tts_app.audio_cache import TTSAudioCache, cache_key  # noqa: E402
+
+
+def make_cache(max_bytes=1000, entry_ttl_s=None):
+    return TTSAudioCache(fakeredis.FakeRedis(decode_responses=True), max_bytes=max_bytes, entry_ttl_s=entry_ttl_s)
+
+
+def test_key_ignores_whitespace_and_width_but_not_voice_or_speed():
+    assert cache_key("您好， 今天 還好嗎？", "voice", 1.0) == cache_key(" 您好,  今天 還好嗎? ", "voice", 1.0)
+    assert cache_key("您好", "voice", 1.0) != cache_key("您好", "other", 1.0)
+    assert cache_key("您好", "voice", 1.0) != cache_key("您好", "voice", 1.2)
+
+
+def test_key_changes_with_model_sample_rate_and_encoding():
+    base = cache_key("您好", "voice", 1.0, model_id="orpheus-a", sample_rate=24000, encoding="aac 64k")
+    assert base != cache_key("您好", "voice", 1.0, model_id="orpheus-b", sample_rate=24000, encoding="aac 64k")
+    assert base != cache_key("您好", "voice", 1.0, model_id="orpheus-a", sample_rate=16000, encoding="aac 64k")
+    assert base != cache_key("您好", "voice", 1.0, model_id="orpheus-a", sample_rate=24000, encoding="aac 96k")
+
+
+def test_hit_returns_stored_object_and_counts_hit_rate():
+    cache = make_cache()
+    key = cache_key("早安", "voice", 1.0)
+
+    assert cache.lookup(key) is None
+    cache.store(key, cache.object_name(key), 1200, 100)
+
+    assert cache.lookup(key) == (cache.object_name(key), 1200)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+    assert stats["bytes"] == 100
+
+
+def test_evicts_least_recently_used_entries_over_the_size_bound():
+    cache = make_cache(max_bytes=250)
+    keys = [cache_key(text, "voice", 1.0) for text in ("一", "二", "三")]
+    cache.store(keys[0], "a.m4a", 1000, 100)
+    cache.store(keys[1], "b.m4a", 1000, 100)
+    cache.lookup(keys[0])  # "一" 變成最近使用
+
+    cache.store(keys[2], "c.m4a", 1000, 100)
+
+    # 只移除索引，物件保留給已發出的 URL，由 lifecycle 規則到期刪除
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[0]) == ("a.m4a", 1000)
+    assert cache.stats()["bytes"] == 200
+
+
+def test_duplicate_store_is_counted_once():
+    cache = make_cache()
+    key = cache_key("謝謝", "voice", 1.0)
+
+    cache.store(key, cache.object_name(key), 800, 100)
+    cache.store(key, cache.object_name(key), 800, 100)
+
+    assert cache.stats()["bytes"] == 100
+
+
+def test_entries_older_than_the_ttl_miss_and_leave_the_index():
+    cache = make_cache(entry_ttl_s=60)
+    key = cache_key("晚安", "voice", 1.0)
+    cache.store(key, cache.object_name(key), 900, 100)
+    assert cache.lookup(key) == (cache.object_name(key), 900)
+
+    cache.redis.hset(cache._entry_key(key), "created_at", time.time() - 61)
+
+    assert cache.lookup(key) is None
+    assert cache.stats()["bytes"] == 0
+    cache.store(key, cache.object_name(key), 900, 100)
+    assert cache.lookup(key) == (cache.object_name(key), 900)
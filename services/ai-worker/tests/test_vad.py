@@ -0,0 +1,68 @@
+"""
+Tests for VAD silence trimming, chunk planning and timestamp stitching
+"""
+
+import numpy as np
+import pytest
+
+# stt_app 套件的 __init__ 會匯入 stt_service（依賴 minio）
+pytest.importorskip("minio")
+
+from stt_app.vad import detect_speech, plan_chunks, stitch_results  # noqa: E402
+
+RATE = 16000
+
+
+def _tone(seconds, amplitude=0.3):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def _silence(seconds, generator):
+    return (generator.standard_normal(int(seconds * RATE)) * 1e-4).astype(np.float32)
+
+
+def test_leading_trailing_and_long_inner_silence_is_trimmed():
+    generator = np.random.default_rng(0)
+    waveform = np.concatenate(
+        [_silence(3, generator), _tone(2), _silence(6, generator), _tone(1.5), _silence(4, generator)]
+    )
+
+    segments = detect_speech(waveform, RATE, pad_ms=100)
+
+    assert len(segments) == 2
+    (s1, e1), (s2, e2) = segments
+    assert abs(s1 / RATE - 2.9) < 0.1 and abs(e1 / RATE - 5.1) < 0.1
+    assert abs(s2 / RATE - 10.9) < 0.1 and abs(e2 / RATE - 12.6) < 0.1
+    speech = sum(end - start for start, end in segments) / RATE
+    assert speech < len(waveform) / RATE / 3
+
+
+def test_pure_silence_has_no_speech():
+    assert detect_speech(_silence(5, np.random.default_rng(1)), RATE) == []
+
+
+def test_continuous_speech_is_kept_whole():
+    segments = detect_speech(_tone(4), RATE)
+    assert segments == [(0, 4 * RATE)]
+
+
+def test_chunks_merge_short_pauses_and_split_long_speech():
+    segments = [(0, 5 * RATE), (5 * RATE + 8000, 9 * RATE), (20 * RATE, 80 * RATE)]
+
+    chunks = plan_chunks(segments, RATE, max_chunk_s=25, max_gap_s=1)
+
+    assert chunks == [(0, 9 * RATE), (20 * RATE, 45 * RATE), (45 * RATE, 70 * RATE), (70 * RATE, 80 * RATE)]
+
+
+def test_stitched_timestamps_follow_the_original_recording():
+    chunks = [(RATE, 3 * RATE), (10 * RATE, 12 * RATE)]
+    results = [
+        {"text": " 你好", "chunks": [{"text": "你好", "timestamp": (0.2, 1.0)}]},
+        {"text": "今天 OK ", "chunks": [{"text": "今天 OK", "timestamp": (0.0, None)}]},
+    ]
+
+    stitched = stitch_results(chunks, results, RATE)
+
+    assert stitched["text"] == "你好今天 OK"
+    assert [c["timestamp"] for c in stitched["chunks"]] == [(1.2, 2.0), (10.0, None)]
@@ -10,13 +10,15 @@ while this service orchestrates the AI pipeline workflow.
 
 import json
 from typing import Dict, Any, Optional
-from domain.ai_task import AITask, ProcessingStep, TaskStatus
+from domain.ai_task import AITask, TaskStatus
 from domain.chat_session import ChatSession, MessageType
 from mappers.task_mapper import TaskMapper
 from mappers.chat_mapper import ChatMapper
-from llm_app.llm_service import LLMService
-from stt_app.stt_service import STTService
-from tts_app.tts_service import TTSService
+from pipeline.stages import convert_to_llm_format, run_llm_step, run_stt_step, run_tts_step
+from llm_app.llm_service import LLMService, get_llm_service
+from model_registry import get_model_registry
+from stt_app.stt_service import STTService, get_stt_service
+from tts_app.tts_service import TTSService, get_tts_service
 
 
 class AIServiceRefactored:
@@ -27,10 +29,18 @@ class AIServiceRefactored:
     business logic to domain objects and maintains clean separation of concerns.
     """
 
-    def __init__(self):
-        self.llm_service = LLMService()
-        self.stt_service = STTService()
-        self.tts_service = TTSService()
+    @property
+    def llm_service(self) -> LLMService:
+        return get_llm_service()
+
+    @property
+    def stt_service(self) -> STTService:
+        # Resolved on each use so the model registry owns the one loaded instance
+        return get_stt_service()
+
+    @property
+    def tts_service(self) -> TTSService:
+        return get_tts_service()
 
     def process_task(self, task_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -74,21 +84,10 @@ class AIServiceRefactored:
         """Process audio task pipeline: STT -> LLM -> TTS -> Notification"""
 
         # Step 1: Speech to Text
-        stt_step = ai_task.start_step(ProcessingStep.STT)
-        if stt_step:
-            try:
-                transcript = self.stt_service.transcribe_audio(
-                    ai_task.audio_bucket, ai_task.audio_object
-                )
-                if not transcript:
-                    ai_task.fail_step(ProcessingStep.STT, "STT service returned empty transcript")
-                    return
-
-                ai_task.complete_step(ProcessingStep.STT, transcript)
-
-            except Exception as e:
-                ai_task.fail_step(ProcessingStep.STT, f"STT processing failed: {str(e)}")
-                return
+        with get_model_registry().use("stt") as stt_service:
+            run_stt_step(ai_task, stt_service)
+        if ai_task.has_failed_steps():
+            return
 
         # Step 2: LLM Processing
         self._process_llm_step(ai_task)
@@ -103,75 +102,16 @@ class AIServiceRefactored:
 
     def _process_llm_step(self, ai_task: AITask) -> None:
         """Process LLM step using domain task data"""
-        llm_step = ai_task.start_step(ProcessingStep.LLM)
-        if not llm_step:
-            return
-
-        try:
-            # Convert domain task to LLM service format
-            llm_task_data = self._convert_to_llm_format(ai_task)
-
-            # Generate AI response
-            ai_response = self.llm_service.generate_response(llm_task_data)
-            if not ai_response:
-                ai_task.fail_step(ProcessingStep.LLM, "LLM service returned empty response")
-                return
-
-            # Store response with metadata
-            llm_metadata = {
-                "input_length": len(ai_task.input_text or ""),
-                "output_length": len(ai_response),
-                "model_used": "health_bot"  # Could be extracted from LLM service
-            }
-
-            ai_task.complete_step(ProcessingStep.LLM, ai_response, llm_metadata)
-
-        except Exception as e:
-            ai_task.fail_step(ProcessingStep.LLM, f"LLM processing failed: {str(e)}")
+        run_llm_step(ai_task, self.llm_service)
 
     def _process_tts_step(self, ai_task: AITask) -> None:
         """Process TTS step using AI response from task"""
-        tts_step = ai_task.start_step(ProcessingStep.TTS)
-        if not tts_step:
-            return
-
-        try:
-            ai_response = ai_task.task_metadata.get('ai_response')
-            if not ai_response:
-                ai_task.fail_step(ProcessingStep.TTS, "No AI response available for TTS")
-                return
-
-            # Synthesize speech
-            audio_url, duration_ms = self.tts_service.synthesize_text(ai_response)
-            if not audio_url:
-                ai_task.fail_step(ProcessingStep.TTS, "TTS service returned empty audio URL")
-                return
-
-            # Store TTS result with metadata
-            tts_metadata = {
-                "audio_duration_ms": duration_ms,
-                "text_length": len(ai_response)
-            }
-
-            ai_task.complete_step(ProcessingStep.TTS, audio_url, tts_metadata)
-
-        except Exception as e:
-            ai_task.fail_step(ProcessingStep.TTS, f"TTS processing failed: {str(e)}")
+        with get_model_registry().use("tts") as tts_service:
+            run_tts_step(ai_task, tts_service)
 
     def _convert_to_llm_format(self, ai_task: AITask) -> Dict[str, Any]:
         """Convert domain AITask to LLM service format"""
-        llm_data = {
-            "patient_id": ai_task.patient_id,
-            "text": ai_task.input_text
-        }
-
-        if ai_task.line_user_id:
-            llm_data["line_user_id"] = ai_task.line_user_id
-
-        if ai_task.audio_object:
-            llm_data["object_name"] = ai_task.audio_object
-
-        return llm_data
+        return convert_to_llm_format(ai_task)
 
     def finalize_user_session(self, user_id: str) -> None:
         """
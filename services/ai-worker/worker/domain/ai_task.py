@@ -35,6 +35,12 @@ class ProcessingStep(Enum):
     NOTIFICATION = "notification"
 
 
+class NotificationEvent(Enum):
+    TRANSCRIPT = "transcript"  # Partial: STT finished
+    REPLY = "reply"  # Partial: LLM reply ready, audio still pending
+    FINAL = "final"  # Task finished (completed or failed)
+
+
 @dataclass
 class TaskResult:
     """Individual step result within a task"""
@@ -85,6 +91,24 @@ class TaskResult:
             "completed_at": self.completed_at.isoformat() if self.completed_at else None
         }
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TaskResult':
+        """Rebuild a step result from to_dict() output"""
+        return cls(
+            step=ProcessingStep(data["step"]),
+            status=TaskStatus(data["status"]),
+            output=data.get("output"),
+            metadata=data.get("metadata") or {},
+            error_message=data.get("error_message"),
+            processing_time_ms=data.get("processing_time_ms"),
+            started_at=_parse_datetime(data.get("started_at")),
+            completed_at=_parse_datetime(data.get("completed_at"))
+        )
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
 
 @dataclass
 class AITask:
@@ -185,6 +209,13 @@ class AITask:
                 return step_result
         return None
 
+    def get_step_result(self, step: ProcessingStep) -> Optional[TaskResult]:
+        """Get the result entry for a specific processing step"""
+        for step_result in self.processing_steps:
+            if step_result.step == step:
+                return step_result
+        return None
+
     def start_step(self, step: ProcessingStep) -> Optional[TaskResult]:
         """Start a specific processing step"""
         for step_result in self.processing_steps:
@@ -263,6 +294,7 @@ class AITask:
         base_payload = {
             "task_id": self.task_id,
             "patient_id": self.patient_id,
+            "event": NotificationEvent.FINAL.value,
             "status": self.status.value,
             "task_type": self.task_type.value,
             "created_at": self.created_at.isoformat(),
@@ -279,6 +311,9 @@ class AITask:
 
         if self.task_metadata.get('response_audio_url'):
             base_payload["response_audio_url"] = self.task_metadata['response_audio_url']
+            tts_result = self.get_step_result(ProcessingStep.TTS)
+            if tts_result and tts_result.metadata.get('audio_duration_ms'):
+                base_payload["audio_duration_ms"] = tts_result.metadata['audio_duration_ms']
 
         if self.audio_object:
             base_payload["original_file"] = self.audio_object
@@ -288,6 +323,24 @@ class AITask:
 
         return base_payload
 
+    def create_progress_payload(self, event: NotificationEvent) -> Dict[str, Any]:
+        """Create a partial notification sent before the task finishes"""
+        payload = {
+            "task_id": self.task_id,
+            "patient_id": self.patient_id,
+            "event": event.value,
+            "status": "partial",
+            "task_type": self.task_type.value,
+        }
+
+        if self.input_text:
+            payload["user_transcript"] = self.input_text
+
+        if self.task_metadata.get('ai_response'):
+            payload["ai_response"] = self.task_metadata['ai_response']
+
+        return payload
+
     def estimate_completion_time(self) -> Optional[int]:
         """Estimate remaining completion time in milliseconds"""
         if self.status in [TaskStatus.COMPLETED, TaskStatus.FAILED]:
@@ -328,4 +381,24 @@ class AITask:
             "completed_at": self.completed_at.isoformat() if self.completed_at else None,
             "task_metadata": self.task_metadata,
             "estimated_completion_time_ms": self.estimate_completion_time()
-        }
\ No newline at end of file
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'AITask':
+        """Rebuild a task from to_dict() output, e.g. when it is handed to the next pipeline stage"""
+        return cls(
+            task_id=data["task_id"],
+            patient_id=data["patient_id"],
+            task_type=TaskType(data["task_type"]),
+            status=TaskStatus(data["status"]),
+            input_text=data.get("input_text"),
+            audio_bucket=data.get("audio_bucket"),
+            audio_object=data.get("audio_object"),
+            audio_duration_ms=data.get("audio_duration_ms"),
+            line_user_id=data.get("line_user_id"),
+            processing_steps=[TaskResult.from_dict(step) for step in data.get("processing_steps", [])],
+            created_at=_parse_datetime(data.get("created_at")) or datetime.utcnow(),
+            started_at=_parse_datetime(data.get("started_at")),
+            completed_at=_parse_datetime(data.get("completed_at")),
+            task_metadata=data.get("task_metadata") or {}
+        )
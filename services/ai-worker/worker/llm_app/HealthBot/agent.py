@@ -66,10 +66,8 @@ def _render_session_transcript(user_id: str, k: int = 9999) -> str:
 
 
 # ========= 檢索接點 (Prompt Building) =========
-def build_prompt_from_redis(user_id: str, line_user_id: Optional[str] = None, k: int = 6, current_input: str = "") -> str:
-    parts: List[str] = []
-    
-    # 0) 取使用者Profile
+def profile_section(user_id: str, line_user_id: Optional[str] = None) -> str:
+    """使用者畫像（Postgres）。"""
     try:
         profile = ProfileRepository().get_or_create_by_user_id(int(user_id), line_user_id=line_user_id)
         profile_data = {
@@ -80,37 +78,43 @@ def build_prompt_from_redis(user_id: str, line_user_id: Optional[str] = None, k:
         profile_data = {k: v for k, v in profile_data.items() if v}
         if profile_data:
             profile_str = json.dumps(profile_data, ensure_ascii=False, indent=2)
-            parts.append(f"👤 使用者畫像 (Profile):\n{profile_str}")
+            return f"👤 使用者畫像 (Profile):\n{profile_str}"
     except (ValueError, TypeError) as e:
         print(f"⚠️ [Build Prompt] user '{user_id}' 處理 Profile 失敗: {e}，將使用空的 Profile。")
-    
-    # (1) 長期記憶（原話導向）
-    if current_input:
-        qv = safe_to_vector(current_input)
-        if qv:
-            try:
-                mem_pack = retrieve_memory_pack_v3(
-                    user_id=user_id,
-                    query_vec=qv,
-                    topk_groups=5,
-                    sim_thr=0.5,
-                    tau_days=45,
-                    include_raw_qa=False,
-                )
-                if mem_pack:
-                    parts.append(mem_pack)
-            except Exception as e:
-                print(f"[memory v3 retrieval warn] {e}")
-
-    # (2) 歷史摘要（可選）
+    return ""
+
+
+def memory_section(user_id: str, query_vec: Optional[List[float]]) -> str:
+    """長期記憶（原話導向，Milvus）；query_vec 為本輪輸入的 embedding。"""
+    if not query_vec:
+        return ""
+    try:
+        return retrieve_memory_pack_v3(
+            user_id=user_id,
+            query_vec=query_vec,
+            topk_groups=5,
+            sim_thr=0.5,
+            tau_days=45,
+            include_raw_qa=False,
+        ) or ""
+    except Exception as e:
+        print(f"[memory v3 retrieval warn] {e}")
+        return ""
+
+
+def summary_section(user_id: str) -> str:
+    """歷史摘要（Redis，可選）。"""
     try:
         summary_text, _ = get_summary(user_id)
         if summary_text:
-            parts.append("📌 歷史摘要：\n" + summary_text.strip())
+            return "📌 歷史摘要：\n" + summary_text.strip()
     except Exception:
         pass
+    return ""
+
 
-    # (3) 近期未摘要片段（可選）
+def history_section(user_id: str, k: int = 6) -> str:
+    """近期未摘要片段（Redis，可選）。"""
     try:
         rounds = fetch_all_history(user_id) or []
         tail = rounds[-k:]
@@ -121,11 +125,27 @@ def build_prompt_from_redis(user_id: str, line_user_id: Optional[str] = None, k:
                 a = (r.get("output") or "").strip()
                 lines.append(f"使用者：{q}")
                 lines.append(f"助手：{a}")
-            parts.append("🕓 近期對話（未摘要）：\n" + "\n".join(lines))
+            return "🕓 近期對話（未摘要）：\n" + "\n".join(lines)
     except Exception:
         pass
+    return ""
+
+
+def join_prompt_sections(sections: List[str]) -> str:
+    return "\n\n".join([p for p in sections if p and p.strip()]) or ""
 
-    return "\n\n".join([p for p in parts if p.strip()]) or ""
+
+def build_prompt_from_redis(user_id: str, line_user_id: Optional[str] = None, k: int = 6, current_input: str = "") -> str:
+    """
+    依序組出上下文：畫像 → 長期記憶（有 current_input 時）→ 歷史摘要 → 近期對話。
+    handle_user_message 以 chat_pipeline 的平行版本取得相同內容，這裡保留給 fallback 與其他呼叫端。
+    """
+    return join_prompt_sections([
+        profile_section(user_id, line_user_id),
+        memory_section(user_id, safe_to_vector(current_input)) if current_input else "",
+        summary_section(user_id),
+        history_section(user_id, k),
+    ])
 
 
 # ========= Profile 更新機制 =========
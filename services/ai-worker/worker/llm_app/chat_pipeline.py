@@ -14,7 +14,14 @@ from .HealthBot.agent import (
     create_guardrail_agent,
     create_health_companion,
     finalize_session,
+    history_section,
+    join_prompt_sections,
+    memory_section,
+    profile_section,
+    summary_section,
 )
+from .embedding import safe_to_vector
+from .fanout import FanOut
 from .toolkits.redis_store import (
     acquire_audio_lock,
     append_round,
@@ -38,6 +45,13 @@ from .repositories.profile_repository import ProfileRepository
 
 SUMMARY_CHUNK_SIZE = int(os.getenv("SUMMARY_CHUNK_SIZE", 5))
 
+# 上下文收集的逐呼叫逾時（秒）：guardrail（Crew）、記憶判斷 LLM、資料讀取（Postgres/embedding/Milvus/Redis）
+CONTEXT_GUARDRAIL_TIMEOUT_S = float(os.getenv("CONTEXT_GUARDRAIL_TIMEOUT_S", 20))
+CONTEXT_LLM_TIMEOUT_S = float(os.getenv("CONTEXT_LLM_TIMEOUT_S", 8))
+CONTEXT_FETCH_TIMEOUT_S = float(os.getenv("CONTEXT_FETCH_TIMEOUT_S", 4))
+# guardrail 與其備援都沒有在時限內回應時的判定：不經審查就放行是 fail open，一律攔截
+GUARDRAIL_TIMEOUT_VERDICT = "BLOCK: 安全檢查逾時"
+
 
 class AgentManager:
     def __init__(self):
@@ -69,6 +83,49 @@ def log_session(user_id: str, query: str, reply: str, request_id: Optional[str]
         summarize_chunk_and_commit(user_id, start_round=start, history_chunk=chunk)
 
 
+def _run_guardrail(agent_manager: AgentManager, full_text: str) -> str:
+    """回傳 "OK" 或 "BLOCK: <原因>"。優先用 CrewAI；失敗則 fallback 自行判斷。"""
+    try:
+        guard = agent_manager.get_guardrail()
+        guard_task = Task(
+            description=(
+                f"只判斷此輸入是否需要『攔截』：『{full_text}』。\n"
+                "務必使用 model_guardrail 工具進行判斷；僅輸出 OK 或 BLOCK: <原因>，不得回答內容本身。\n"
+                "【允許放行（OK）】症狀/感受描述、一般衛教/生活建議、求助訊息，"
+                "以及『自殺念頭/情緒表達（不含具體方法）』。\n"
+                "【必須攔截（BLOCK）】違法/危險行為之教學/交易/規避；成人/未成年不當內容；"
+                "自傷/他傷/自殺/自殘之『具體方法指導或鼓勵執行』；"
+                "醫療/用藥/劑量/診斷/處置等『具體、個案化、可執行』的專業指示；"
+                "法律/投資/稅務等之『具體、可執行』專業指導。\n"
+                "不確定時一律回 OK（讓後續 health agent 判斷緊急性）。"
+            ),
+            expected_output="OK 或 BLOCK: <原因>",
+            agent=guard,
+        )
+        guard_res = (
+            Crew(agents=[guard], tasks=[guard_task], verbose=False).kickoff().raw
+            or ""
+        ).strip()
+
+    except Exception:
+        guard_res = ModelGuardrailTool()._run(full_text)
+    return guard_res
+
+
+def _guardrail_verdict(fan: FanOut, full_text: str) -> str:
+    """
+    取 guardrail 結果。CrewAI 逾時或失敗時改用 ModelGuardrailTool 直接判斷（與 _run_guardrail 內出錯時相同）；
+    備援也逾時則回 GUARDRAIL_TIMEOUT_VERDICT 攔截本輪。
+    """
+    guard_res = fan.result("guardrail")
+    if guard_res is None:
+        fan.submit("guardrail_fallback", ModelGuardrailTool()._run, full_text,
+                   timeout_s=CONTEXT_LLM_TIMEOUT_S, default=GUARDRAIL_TIMEOUT_VERDICT,
+                   deps=("guardrail",))
+        guard_res = fan.result("guardrail_fallback")
+    return guard_res
+
+
 def handle_user_message(
     agent_manager: AgentManager,
     user_id: str,
@@ -103,31 +160,23 @@ def handle_user_message(
         # 4) 先 guardrail，再 health agent
         os.environ["CURRENT_USER_ID"] = user_id
 
-        # 優先用 CrewAI；失敗則 fallback 自行判斷
-        try:
-            guard = agent_manager.get_guardrail()
-            guard_task = Task(
-                description=(
-                    f"只判斷此輸入是否需要『攔截』：『{full_text}』。\n"
-                    "務必使用 model_guardrail 工具進行判斷；僅輸出 OK 或 BLOCK: <原因>，不得回答內容本身。\n"
-                    "【允許放行（OK）】症狀/感受描述、一般衛教/生活建議、求助訊息，"
-                    "以及『自殺念頭/情緒表達（不含具體方法）』。\n"
-                    "【必須攔截（BLOCK）】違法/危險行為之教學/交易/規避；成人/未成年不當內容；"
-                    "自傷/他傷/自殺/自殘之『具體方法指導或鼓勵執行』；"
-                    "醫療/用藥/劑量/診斷/處置等『具體、個案化、可執行』的專業指示；"
-                    "法律/投資/稅務等之『具體、可執行』專業指導。\n"
-                    "不確定時一律回 OK（讓後續 health agent 判斷緊急性）。"
-                ),
-                expected_output="OK 或 BLOCK: <原因>",
-                agent=guard,
-            )
-            guard_res = (
-                Crew(agents=[guard], tasks=[guard_task], verbose=False).kickoff().raw
-                or ""
-            ).strip()
-
-        except Exception:
-            guard_res = ModelGuardrailTool()._run(full_text)
+        # 彼此獨立的呼叫同時發出：guardrail、畫像、摘要、近期對話（後三者是便宜的 Postgres/Redis 讀取）。
+        # 記憶判斷（LLM）與 embedding 會把本輪輸入送到外部模型，等 guardrail 放行後才發出；
+        # 長期記憶檢索（Milvus）再等記憶判斷為 USE。
+        fan = FanOut()
+        fan.submit("guardrail", _run_guardrail, agent_manager, full_text,
+                   timeout_s=CONTEXT_GUARDRAIL_TIMEOUT_S, default=None)
+        fan.submit("profile", profile_section, user_id, line_user_id, timeout_s=CONTEXT_FETCH_TIMEOUT_S, default="")
+        fan.submit("summary", summary_section, user_id, timeout_s=CONTEXT_FETCH_TIMEOUT_S, default="")
+        fan.submit("history", history_section, user_id, 6, timeout_s=CONTEXT_FETCH_TIMEOUT_S, default="")
+
+        guard_res = _guardrail_verdict(fan, full_text)
+        if not guard_res.startswith("BLOCK:"):
+            guard_dep = "guardrail_fallback" if "guardrail_fallback" in fan else "guardrail"
+            fan.submit("memory_gate", MemoryGateTool()._run, full_text,
+                       timeout_s=CONTEXT_LLM_TIMEOUT_S, default="SKIP", deps=(guard_dep,))
+            fan.submit("embedding", safe_to_vector, full_text,
+                       timeout_s=CONTEXT_FETCH_TIMEOUT_S, default=None, deps=(guard_dep,))
 
             # 只保留攔截與否
         is_block = guard_res.startswith("BLOCK:")
@@ -148,16 +197,21 @@ def handle_user_message(
                 ctx = ""  # 不檢索記憶
                 print("⚠️ 因安全檢查攔截，跳過記憶檢索")
             else:
-                decision = MemoryGateTool()._run(full_text)
+                decision = fan.result("memory_gate")
                 print(f"🔍 MemoryGateTool 決策: {decision}")
+                memory = ""
                 if decision == "USE":
-                    ctx = build_prompt_from_redis(
-                        user_id, line_user_id=line_user_id, k=6, current_input=full_text
-                    )  # 檢索長期記憶
-                else:
-                    ctx = build_prompt_from_redis(
-                        user_id, line_user_id=line_user_id, k=6, current_input=""
-                    )  # 不檢索，只帶摘要/近期對話
+                    query_vec = fan.result("embedding")
+                    if query_vec:
+                        fan.submit("memory", memory_section, user_id, query_vec,
+                                   timeout_s=CONTEXT_FETCH_TIMEOUT_S, default="",
+                                   deps=("memory_gate", "embedding"))  # 檢索長期記憶
+                        memory = fan.result("memory")
+                # 不檢索時只帶畫像/摘要/近期對話
+                ctx = join_prompt_sections(
+                    [fan.result("profile"), memory, fan.result("summary"), fan.result("history")]
+                )
+            print(fan.report(), flush=True)
 
             task_description = f"""
 # ROLE & GOAL
@@ -0,0 +1,127 @@
+# 檔名: fanout.py
+# 說明: 平行發出彼此獨立的網路呼叫（LLM 判斷、Postgres、embedding、Milvus、Redis），
+#       每個呼叫有自己的逾時與預設值：逾時或失敗時回傳預設值，不讓單一慢呼叫拖住整輪對話。
+#       每輪結束後回報關鍵路徑（決定這輪等待時間的那串呼叫），並寫入 Prometheus。
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from metrics import CONTEXT_CALL_SECONDS, CONTEXT_CRITICAL_PATH
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # 行程共用的執行緒池；逾時的呼叫仍會在背景跑完，池子需留有餘裕
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("CONTEXT_FANOUT_WORKERS", 32)),
+                thread_name_prefix="context-fanout",
+            )
+        return _executor
+
+
+@dataclass
+class _Call:
+    name: str
+    timeout_s: float
+    default: Any
+    deps: Tuple[str, ...]
+    submitted: float
+    future: Any = None
+    finished: Optional[float] = None  # 呼叫實際結束的時間（由工作執行緒寫入）
+    resolved: Optional[float] = None  # 呼叫端拿到結果的時間；逾時則為放棄等待的時間
+    status: Optional[str] = None  # ok / timeout / error；None 表示尚未取用結果
+    value: Any = None
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (self.resolved - self.submitted) * 1000
+
+
+class FanOut:
+    """
+    `submit()` 立即在執行緒池上開始呼叫，`result()` 取結果（最多等到該呼叫自己的逾時）。
+    `deps` 只用於關鍵路徑：表示呼叫端等到這些結果才發出此呼叫。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._calls: Dict[str, _Call] = {}
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable,
+        *args,
+        timeout_s: float,
+        default: Any = None,
+        deps: Sequence[str] = (),
+    ) -> None:
+        call = _Call(name, timeout_s, default, tuple(deps), time.perf_counter())
+
+        def _run():
+            try:
+                return fn(*args)
+            finally:
+                call.finished = time.perf_counter()
+
+        call.future = _get_executor().submit(_run)
+        self._calls[name] = call
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._calls
+
+    def result(self, name: str) -> Any:
+        call = self._calls[name]
+        if call.status is not None:
+            return call.value
+        remaining = call.submitted + call.timeout_s - time.perf_counter()
+        try:
+            call.value = call.future.result(timeout=max(0.0, remaining))
+            call.status = "ok"
+        except FutureTimeout:
+            call.value, call.status = call.default, "timeout"
+            print(f"⚠️ [Context] {name} 超過 {call.timeout_s:g}s，改用預設值", flush=True)
+        except Exception as e:
+            call.value, call.status = call.default, "error"
+            print(f"⚠️ [Context] {name} 失敗，改用預設值: {e}", flush=True)
+        call.resolved = call.finished if call.status != "timeout" and call.finished else time.perf_counter()
+        CONTEXT_CALL_SECONDS.labels(call=name, status=call.status).observe(call.elapsed_ms / 1000)
+        return call.value
+
+    def critical_path(self) -> List[_Call]:
+        """從最晚完成的已取用呼叫往回，沿著最晚完成的依賴找出關鍵路徑（先發生的在前）。"""
+        awaited = {name: call for name, call in self._calls.items() if call.status is not None}
+        if not awaited:
+            return []
+        path = [max(awaited.values(), key=lambda call: call.resolved)]
+        while True:
+            deps = [awaited[dep] for dep in path[-1].deps if dep in awaited]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda call: call.resolved))
+        return list(reversed(path))
+
+    def report(self) -> str:
+        """回傳一行摘要（總耗時、關鍵路徑、各呼叫耗時），並累計關鍵路徑上各呼叫的次數。"""
+        total_ms = (time.perf_counter() - self.started) * 1000
+        path = self.critical_path()
+        for call in path:
+            CONTEXT_CRITICAL_PATH.labels(call=call.name).inc()
+        chain = " → ".join(f"{call.name}({call.elapsed_ms:.0f}ms)" for call in path)
+        calls = ", ".join(
+            f"{call.name}={call.elapsed_ms:.0f}ms"
+            + ("" if call.status == "ok" else f"[{call.status}]")
+            for call in self._calls.values()
+            if call.status is not None
+        )
+        return f"⏱️ [Context] {total_ms:.0f}ms 關鍵路徑: {chain or '-'} | {calls}"
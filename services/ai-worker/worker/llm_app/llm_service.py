@@ -108,6 +108,11 @@ class LLMService:
 
 llm_service_instance = LLMService()
 
+
+def get_llm_service() -> LLMService:
+    """工廠函式，用於獲取共用的 LLMService 實例。"""
+    return llm_service_instance
+
 def run_interactive_test():
     """互動式測試 - 固定用戶 test_user1，測試 5 分鐘釋放功能"""
     print("🏥 Beloved Grandson LLM Service - 互動測試模式")
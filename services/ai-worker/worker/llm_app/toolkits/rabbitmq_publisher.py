@@ -1,43 +1,31 @@
 # services/ai-worker/worker/llm_app/toolkits/rabbitmq_publisher.py
-import pika
 import os
-import json
 import logging
 
+from messaging.publisher import get_publisher
+
 def publish_alert(user_id: str, reason: str):
     """
     發布一個緊急警示訊息到 RabbitMQ 的 alert_queue。
 
+    透過行程共用的長駐發佈器送出，不再為每則警示建立新連線。
+
     Args:
         user_id (str): 觸發警示的使用者 ID。
         reason (str): 警示的原因或相關訊息。
     """
     try:
-        rabbitmq_host = os.environ.get("RABBITMQ_HOST", "rabbitmq")
         alert_queue = os.environ.get("RABBITMQ_ALERT_QUEUE", "alert_queue")
 
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=rabbitmq_host))
-        channel = connection.channel()
-
-        # 宣告佇列，確保它存在
-        channel.queue_declare(queue=alert_queue, durable=True)
-
         message = {
             "user_id": user_id,
             "reason": reason
         }
 
-        # 發布訊息
-        channel.basic_publish(
-            exchange='',
-            routing_key=alert_queue,
-            body=json.dumps(message),
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # 讓訊息持久化
-            ))
-        
+        # 發布訊息（持久化，等待 broker 確認）
+        get_publisher().publish(alert_queue, message)
+
         print(f" [x] 已發送警示到 RabbitMQ: {message}")
-        connection.close()
         return True
     except Exception as e:
         logging.error(f" [!] 發送警示到 RabbitMQ 失敗: {e}", exc_info=True)
@@ -3,10 +3,26 @@ import pika
 import json
 import time
 import logging
+import threading
+import uuid
+from contextlib import nullcontext
 from llm_app.llm_service import LLMService, llm_service_instance
 from llm_app.ProactiveCare.scheduler import scheduler, initialize_scheduler
-from stt_app.stt_service import STTService
-from tts_app.tts_service import TTSService
+from messaging.consumer import (
+    RETRY_KEY_FIELD,
+    ConcurrentTaskConsumer,
+    enqueued_at_ms,
+    ensure_retry_key,
+    task_lanes_from_env,
+)
+from messaging.publisher import get_publisher
+from messaging.retry import NonRetryableError, retry_policy_from_env
+from domain.ai_task import NotificationEvent
+from mappers.task_mapper import TaskMapper
+from metrics import observe_stage, start_metrics_server, task_type_context, track_stage
+from model_registry import get_model_registry, start_model_residency
+from pipeline.checkpoints import task_checkpoints
+from pipeline.stages import ALL_STAGES, LLM_STAGE, STT_STAGE, TTS_STAGE, StagePipeline, run_forever
 
 logging.getLogger('apscheduler').setLevel(logging.WARNING)
 
@@ -30,31 +46,41 @@ def initialize_database():
 
 def publish_notification(message: dict, patient_id: int):
     """將訊息發佈到通知佇列。"""
-    rabbitmq_host = os.environ.get("RABBITMQ_HOST", "rabbitmq")
     notification_queue = os.environ.get("RABBITMQ_NOTIFICATION_QUEUE", "notifications_queue")
     try:
         message_with_id = message.copy()
         message_with_id['patient_id'] = patient_id
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=rabbitmq_host))
-        channel = connection.channel()
-        channel.queue_declare(queue=notification_queue, durable=True)
-        channel.basic_publish(
-            exchange='',
-            routing_key=notification_queue,
-            body=json.dumps(message_with_id),
-            properties=pika.BasicProperties(delivery_mode=2)
-        )
+        with track_stage("notification_publish"):
+            get_publisher().publish(notification_queue, message_with_id)
         print(f"已發送通知: {message_with_id}", flush=True)
-        connection.close()
-    except pika.exceptions.AMQPConnectionError as e:
+    except pika.exceptions.AMQPError as e:
         print(f"連線到 RabbitMQ 以發送通知時出錯: {e}", flush=True)
         raise
 
 
+def progressive_notifications_enabled() -> bool:
+    """AI_WORKER_PROGRESSIVE_NOTIFY=true 時，逐字稿與 LLM 回覆會在 TTS 完成前先行推送。"""
+    return os.environ.get("AI_WORKER_PROGRESSIVE_NOTIFY", "false").lower() == "true"
+
+
+def publish_progress(message: dict, patient_id: int):
+    """發送進度通知；失敗只記錄，不影響後續的最終通知。"""
+    try:
+        publish_notification(message, patient_id)
+    except Exception as e:
+        print(f"發送進度通知失敗（將繼續處理）: {e}", flush=True)
+
+
 def process_text_task(task_data={}):
     """透過 llm-app 來處理文字訊息。"""
+    checkpoints = task_checkpoints(task_data)
+    response = checkpoints.get(LLM_STAGE)
+    if response is not None:
+        return response
     print("建立 LLM 服務...", flush=True)
-    response = llm_service_instance.generate_response(task_data=task_data)
+    with track_stage(LLM_STAGE):
+        response = llm_service_instance.generate_response(task_data=task_data)
+    checkpoints.put(LLM_STAGE, response)
     print(f"成功呼叫 LLM 服務。回應: {response}", flush=True)
     return response
 
@@ -62,34 +88,73 @@ def process_text_task(task_data={}):
 def process_audio_task(patient_id: int, audio_duration_ms=60000, task_data={}):
     """
     透過 STT -> LLM -> TTS 管道處理音訊檔案任務。
+    漸進模式下，逐字稿與文字回覆會先以 partial 事件送出，音訊完成後再送 final 事件。
+    重試時，已完成步驟的結果從檢查點取回，不會再呼叫一次 LLM 或重複寫入對話紀錄。
     """
+    # 同一任務的所有事件共用 task_id，web-app 以 (task_id, event) 去重
+    task_id = audio_task_id(task_data)
+    progressive = progressive_notifications_enabled()
+    checkpoints = task_checkpoints(task_data)
     try:
         # 步驟 1: STT - 語音轉文字
-        print(f"--- 開始 STT 處理: {task_data['object_name']} ---", flush=True)
-        user_transcript = STTService().transcribe_audio(task_data['bucket_name'], task_data['object_name'])
-        if not user_transcript:
-            raise ValueError("STT 服務未返回有效的轉錄文字")
+        user_transcript = checkpoints.get(STT_STAGE)
+        if user_transcript is None:
+            print(f"--- 開始 STT 處理: {task_data['object_name']} ---", flush=True)
+            with get_model_registry().use("stt") as stt_service, track_stage(STT_STAGE):
+                user_transcript = stt_service.transcribe_audio(task_data['bucket_name'], task_data['object_name'])
+            if not user_transcript:
+                raise ValueError("STT 服務未返回有效的轉錄文字")
+            checkpoints.put(STT_STAGE, user_transcript)
         task_data['text'] = user_transcript  # 將轉錄文字加入 task_data
         print(f"STT 結果: {user_transcript}", flush=True)
+        if progressive:
+            publish_progress({
+                "task_id": task_id,
+                "event": NotificationEvent.TRANSCRIPT.value,
+                "status": "partial",
+                "original_file": task_data['object_name'],
+                "user_transcript": user_transcript,
+            }, patient_id)
 
 
         # 步驟 2: LLM - 產生 AI 回應
-        print(f"--- 開始 LLM 處理 ---", flush=True)
-        ai_response = llm_service_instance.generate_response(task_data=task_data)
-        if not ai_response:
-            raise ValueError("LLM 服務未返回有效的 AI 回應")
+        ai_response = checkpoints.get(LLM_STAGE)
+        if ai_response is None:
+            print(f"--- 開始 LLM 處理 ---", flush=True)
+            with track_stage(LLM_STAGE):
+                ai_response = llm_service_instance.generate_response(task_data=task_data)
+            if not ai_response:
+                raise ValueError("LLM 服務未返回有效的 AI 回應")
+            checkpoints.put(LLM_STAGE, ai_response)
         print(f"LLM 結果: {ai_response}", flush=True)
+        if progressive:
+            publish_progress({
+                "task_id": task_id,
+                "event": NotificationEvent.REPLY.value,
+                "status": "partial",
+                "original_file": task_data['object_name'],
+                "user_transcript": user_transcript,
+                "ai_response": ai_response,
+            }, patient_id)
 
 
         # 步驟 3: TTS - 文字轉語音
-        print(f"--- 開始 TTS 處理 ---", flush=True)
-        response_audio_url, duration_ms = TTSService().synthesize_text(ai_response)
-        if not response_audio_url:
-            raise ValueError("TTS 服務未返回有效的音訊物件名稱")
+        tts_result = checkpoints.get(TTS_STAGE)
+        if tts_result is None:
+            print(f"--- 開始 TTS 處理 ---", flush=True)
+            with get_model_registry().use("tts") as tts_service, track_stage(TTS_STAGE):
+                response_audio_url, duration_ms = tts_service.synthesize_text(ai_response)
+            if not response_audio_url:
+                raise ValueError("TTS 服務未返回有效的音訊物件名稱")
+            checkpoints.put(TTS_STAGE, [response_audio_url, duration_ms])
+        else:
+            response_audio_url, duration_ms = tts_result
         print(f"TTS 結果: {response_audio_url}", flush=True)
 
         # 步驟 4: 發送成功通知
         notification_message = {
+            "task_id": task_id,
+            "event": NotificationEvent.FINAL.value,
             "status": "completed",
             "original_file": task_data['object_name'],
             "user_transcript": user_transcript,
@@ -100,15 +165,75 @@ def process_audio_task(patient_id: int, audio_duration_ms=60000, task_data={}):
         publish_notification(notification_message, patient_id)
 
     except Exception as e:
+        # 錯誤通知改由 notify_task_failed 在重試用盡後發送，避免每次重試都通知使用者
         print(f"音訊處理管道中發生錯誤: {e}", flush=True)
-        error_notification = {
-            "status": "error",
-            "original_file": task_data['object_name'],
-            "error_message": str(e)
-        }
-        publish_notification(error_notification, patient_id)
         raise
 
+
+def audio_task_id(task_data: dict) -> str:
+    """音訊任務的 task_id；以上傳的物件名稱推導，重試時保持不變。"""
+    return task_data.get('task_id') or f"audio:{task_data['object_name']}"
+
+
+def notify_task_failed(task_data: dict, error: Exception):
+    """任務重試用盡、移到 dead-letter 佇列時，通知使用者音訊處理失敗。"""
+    patient_id = task_data.get('patient_id')
+    if not patient_id or 'object_name' not in task_data:
+        return
+    error_notification = {
+        "task_id": audio_task_id(task_data),
+        "event": NotificationEvent.FINAL.value,
+        "status": "error",
+        "original_file": task_data['object_name'],
+        "error_message": str(error)
+    }
+    publish_notification(error_notification, patient_id)
+
+def handle_task(task_data: dict):
+    """處理單一任務；失敗時拋出例外，由消費者的重試策略決定重試或移到 dead-letter 佇列。"""
+    print(f"\n [x] 收到任務: {task_data}", flush=True)
+    try:
+        patient_id = task_data.get('patient_id')
+        if not patient_id:
+            raise NonRetryableError("任務資料缺少 'patient_id'")
+
+        if 'text' in task_data:
+            print(f" [*] 開始為病患 {patient_id} 處理文字任務...", flush=True)
+            llm_response = process_text_task(task_data=task_data)
+            notification = {
+                "task_id": task_data.get('task_id') or task_data.get(RETRY_KEY_FIELD) or str(uuid.uuid4()),
+                "event": NotificationEvent.FINAL.value,
+                "status": "completed",
+                "user_transcript": task_data['text'],
+                "ai_response": llm_response
+            }
+            publish_notification(notification, patient_id)
+        elif 'bucket_name' in task_data and 'object_name' in task_data:
+            audio_duration_ms = task_data.get('duration_ms')
+            print(f" [*] 開始為病患 {patient_id} 處理音訊任務...", flush=True)
+            process_audio_task(patient_id, audio_duration_ms, task_data=task_data)
+        else:
+            raise NonRetryableError(f"未知的任務格式: {task_data}")
+        print(f" [✔] 任務成功完成。", flush=True)
+    except Exception as e:
+        print(f" [!] 處理任務時出錯: {e}", flush=True)
+        raise
+
+def build_stage_pipeline() -> StagePipeline:
+    """建立分段管道：STT / LLM / TTS 各自一個佇列，模型只在需要的階段載入。"""
+    return StagePipeline(
+        publish=lambda queue_name, message: get_publisher().publish(queue_name, message),
+        notify=publish_notification,
+        service_factories={
+            # STT/TTS 在整個階段期間標記為使用中，閒置卸載不會在呼叫途中卸載模型
+            STT_STAGE: lambda: get_model_registry().use("stt"),
+            LLM_STAGE: lambda: nullcontext(llm_service_instance),
+            TTS_STAGE: lambda: get_model_registry().use("tts"),
+        },
+        progressive=progressive_notifications_enabled(),
+    )
+
+
 if __name__ == '__main__':
 
     # 帶有重試機制的啟動檢查，確保在 postgres 容器完全就緒後再繼續
@@ -136,44 +261,105 @@ if __name__ == '__main__':
     except Exception as e:
         print(f"❌ [AI Worker] 啟動排程服務失敗: {e}", flush=True)
 
+    try:
+        start_metrics_server()
+    except Exception as e:
+        print(f"⚠️ [AI Worker] 啟動指標端點失敗: {e}", flush=True)
+
+    # 模型預設在第一次使用時載入；可依環境變數預熱或卸載閒置模型
+    start_model_residency()
+
     rabbitmq_host = os.environ.get("RABBITMQ_HOST", "rabbitmq")
     task_queue = os.environ.get("RABBITMQ_QUEUE", "task_queue")
+    # 文字任務走獨立的 lane，避免排在音訊積壓之後
+    text_task_queue = os.environ.get("RABBITMQ_TEXT_QUEUE", "text_task_queue")
+
+    # 失敗的任務以指數退避重試，超過 AI_WORKER_MAX_ATTEMPTS 次後移到 <queue>.dlq
+    retry_policy = retry_policy_from_env(
+        publish=lambda queue_name, message, **kwargs: get_publisher().publish(queue_name, message, **kwargs),
+        on_dead_letter=notify_task_failed,
+    )
+
+    # inline：單一任務內跑完 STT→LLM→TTS；staged：任務分派到各階段佇列
+    task_handler = handle_task
+    if os.environ.get("AI_WORKER_PIPELINE_MODE", "inline").lower() == "staged":
+        stage_pipeline = build_stage_pipeline()
+        task_handler = stage_pipeline.dispatch
+        # AI_WORKER_STAGES 決定本行程執行哪些階段；"dispatch" 代表消費原始 task_queue
+        stages = [
+            stage.strip()
+            for stage in os.environ.get("AI_WORKER_STAGES", ",".join(("dispatch",) + ALL_STAGES)).split(",")
+            if stage.strip()
+        ]
+        # 階段訊息的重試用盡時，由分段管道發送最終的錯誤通知
+        stage_retry_policy = retry_policy_from_env(
+            publish=lambda queue_name, message, **kwargs: get_publisher().publish(queue_name, message, **kwargs),
+            on_dead_letter=stage_pipeline.notify_dead_letter,
+        )
+        for stage_consumer in stage_pipeline.stage_consumers(
+            rabbitmq_host, [stage for stage in stages if stage != "dispatch"], retry_policy=stage_retry_policy
+        ):
+            threading.Thread(
+                target=run_forever,
+                args=(stage_consumer.start_consuming, stage_consumer.queue_name),
+                daemon=True,
+            ).start()
+        if "dispatch" not in stages:
+            threading.Event().wait()
+
+    consumer_mode = os.environ.get("AI_WORKER_CONSUMER_MODE", "serial").lower()
+    consumer = None
+    if consumer_mode == "concurrent":
+        consumer = ConcurrentTaskConsumer(
+            rabbitmq_host=rabbitmq_host,
+            handler=task_handler,
+            lanes=task_lanes_from_env(task_queue, text_task_queue),
+            task_type_func=TaskMapper.task_type_label,
+            retry_policy=retry_policy,
+        )
 
     while True:
         try:
+            if consumer is not None:
+                consumer.start_consuming()
+                continue
+
             connection = pika.BlockingConnection(pika.ConnectionParameters(host=rabbitmq_host))
             channel = connection.channel()
             channel.queue_declare(queue=task_queue, durable=True)
+            channel.queue_declare(queue=text_task_queue, durable=True)
+            # prefetch=1：新到的文字任務會在下一輪就被派送，而不是排在已預取的音訊之後
+            channel.basic_qos(prefetch_count=1)
             print(' [*] AI Worker 正在等待訊息。按 CTRL+C 離開', flush=True)
 
             def callback(ch, method, properties, body):
-                task_data = json.loads(body)
-                print(f"\n [x] 收到任務: {task_data}", flush=True)
                 try:
-                    patient_id = task_data.get('patient_id')
-                    if not patient_id:
-                        raise ValueError("任務資料缺少 'patient_id'")
-
-                    if 'text' in task_data:
-                        print(f" [*] 開始為病患 {patient_id} 處理文字任務...", flush=True)
-                        llm_response = process_text_task(task_data=task_data)
-                        notification = {
-                            "status": "completed",
-                            "user_transcript": task_data['text'],
-                            "ai_response": llm_response
-                        }
-                        publish_notification(notification, patient_id)
-                    elif 'bucket_name' in task_data and 'object_name' in task_data:
-                        audio_duration_ms = task_data.get('duration_ms')
-                        print(f" [*] 開始為病患 {patient_id} 處理音訊任務...", flush=True)
-                        process_audio_task(patient_id, audio_duration_ms, task_data=task_data)
-                    else:
-                        print(f" [!] 未知的任務格式: {task_data}", flush=True)
-                    print(f" [✔] 任務成功完成。", flush=True)
+                    task_data = json.loads(body)
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    print(f" [!] 無法解析任務訊息，已丟棄: {e}", flush=True)
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                    return
+                if isinstance(task_data, dict) and ensure_retry_key(task_data):
+                    # 重試以原始訊息重送，先寫入重試鍵，後續嘗試才能沿用已完成的步驟
+                    body = json.dumps(task_data).encode("utf-8")
+                task_type = TaskMapper.task_type_label(task_data)
+                enqueued_ms = enqueued_at_ms(properties)
+                if enqueued_ms is not None:
+                    observe_stage("queue_wait", time.time() - enqueued_ms / 1000, task_type)
+                try:
+                    with task_type_context(task_type):
+                        task_handler(task_data)
                 except Exception as e:
-                    print(f" [!] 處理任務時出錯: {e}", flush=True)
+                    try:
+                        # 預設交換器下 routing_key 即為來源佇列（重試佇列 dead-letter 回來時亦同）
+                        retry_policy.handle_failure(method.routing_key, json.loads(body), properties.headers, e)
+                    except Exception as publish_error:
+                        print(f" [!] 無法排入重試佇列，訊息退回佇列: {publish_error}", flush=True)
+                        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                        return
                 ch.basic_ack(delivery_tag=method.delivery_tag)
 
+            channel.basic_consume(queue=text_task_queue, on_message_callback=callback)
             channel.basic_consume(queue=task_queue, on_message_callback=callback)
             channel.start_consuming()
         except pika.exceptions.AMQPConnectionError as e:
@@ -6,8 +6,8 @@ Converts between SQLAlchemy chat profile models and pure domain chat objects.
 
 from typing import Optional
 from datetime import datetime
-from ..domain.chat_session import UserProfile, ChatSession, ChatMessage, MessageType, SessionStatus
-from ..llm_app.models.chat_profile import ChatUserProfile
+from domain.chat_session import UserProfile, ChatSession, ChatMessage, MessageType, SessionStatus
+from llm_app.models.chat_profile import ChatUserProfile
 
 
 class ChatMapper:
@@ -5,7 +5,7 @@ Converts between RabbitMQ task data and domain AITask objects.
 """
 
 from typing import Dict, Any
-from ..domain.ai_task import AITask, TaskType
+from domain.ai_task import AITask, TaskType
 
 
 class TaskMapper:
@@ -40,4 +40,16 @@ class TaskMapper:
     @staticmethod
     def domain_to_notification(ai_task: AITask) -> Dict[str, Any]:
         """Convert domain AITask to notification payload"""
-        return ai_task.create_notification_payload()
\ No newline at end of file
+        return ai_task.create_notification_payload()
+
+    @staticmethod
+    def task_type_label(task_data: Dict[str, Any]) -> str:
+        """Task type value for metric labels, derived without building the domain object"""
+        # Stage-queue messages carry the serialized task
+        if isinstance(task_data.get('task'), dict):
+            return task_data['task'].get('task_type') or "unknown"
+        if task_data.get('text') and not task_data.get('bucket_name'):
+            return TaskType.TEXT_ONLY.value
+        if task_data.get('bucket_name') and task_data.get('object_name'):
+            return TaskType.AUDIO_STT_LLM_TTS.value
+        return "unknown"
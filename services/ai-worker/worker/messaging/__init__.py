@@ -0,0 +1,15 @@
+from .consumer import ConcurrentTaskConsumer, ConsumerLane, KeyedTaskExecutor, task_lanes_from_env
+from .publisher import RabbitPublisher, get_publisher
+from .retry import NonRetryableError, RetryPolicy, retry_policy_from_env
+
+__all__ = [
+    "ConcurrentTaskConsumer",
+    "ConsumerLane",
+    "KeyedTaskExecutor",
+    "NonRetryableError",
+    "RabbitPublisher",
+    "RetryPolicy",
+    "get_publisher",
+    "retry_policy_from_env",
+    "task_lanes_from_env",
+]
@@ -0,0 +1,299 @@
+# 檔名: consumer.py
+# 說明: 併發任務消費者。由連線執行緒接收訊息，交給有上限的執行緒池處理，
+#       處理完成後再把 ack 送回連線執行緒（pika 的連線物件不是執行緒安全的）。
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+import pika
+
+from metrics import LANE_DEPTH, LANE_WAIT_SECONDS, observe_stage, task_type_context
+
+logger = logging.getLogger(__name__)
+
+# 發佈端寫入的入列時間（epoch 毫秒），用於計算佇列等待時間
+ENQUEUED_AT_HEADER = "x-enqueued-at-ms"
+
+# 同一則任務在每次重試中保持不變的鍵：第一次收到時寫入訊息本文，重試訊息沿用
+RETRY_KEY_FIELD = "retry_key"
+
+
+def ensure_retry_key(task_data: Dict[str, Any]) -> bool:
+    """訊息沒有重試鍵時補上一個，回傳是否有新增（呼叫端需以補上後的內容作為重試訊息）。"""
+    if task_data.get(RETRY_KEY_FIELD):
+        return False
+    task_data[RETRY_KEY_FIELD] = uuid.uuid4().hex
+    return True
+
+
+def patient_key(task_data: Dict[str, Any]) -> Hashable:
+    """預設的排序鍵：同一位病患的任務依序處理。"""
+    return str(task_data.get("patient_id") or "unknown")
+
+
+class KeyedTaskExecutor:
+    """
+    有上限的執行緒池，並保證相同 key 的工作依提交順序逐一執行。
+
+    不同 key 的工作可以併發；相同 key 的後續工作會排在該 key 的佇列中，
+    直到前一個工作結束才送進執行緒池，因此不會佔用多餘的 worker。
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "ai-task"):
+        self.max_workers = max(1, int(max_workers))
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=thread_name_prefix
+        )
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending: Dict[Hashable, Deque[Callable[[], None]]] = {}
+
+    def submit(self, key: Hashable, fn: Callable[[], None]) -> None:
+        with self._lock:
+            waiting = self._pending.get(key)
+            if waiting is not None:
+                # 同一個 key 已有工作在執行，排隊等候
+                waiting.append(fn)
+                return
+            self._pending[key] = deque()
+        self._pool.submit(self._run, key, fn)
+
+    def _run(self, key: Hashable, fn: Callable[[], None]) -> None:
+        try:
+            fn()
+        except Exception:
+            logger.exception("任務執行失敗 (key=%s)", key)
+        finally:
+            with self._lock:
+                waiting = self._pending[key]
+                next_fn = waiting.popleft() if waiting else None
+                if next_fn is None:
+                    del self._pending[key]
+                    if not self._pending:
+                        self._idle.notify_all()
+            if next_fn is not None:
+                self._pool.submit(self._run, key, next_fn)
+
+    def active_keys(self) -> int:
+        """目前有工作在執行或排隊的 key 數量。"""
+        with self._lock:
+            return len(self._pending)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if wait:
+            # 等所有 key 的排隊工作都跑完，避免串接中的工作被拒絕
+            with self._idle:
+                self._idle.wait_for(lambda: not self._pending)
+        self._pool.shutdown(wait=wait)
+
+
+@dataclass
+class ConsumerLane:
+    """一條消費通道：獨立的佇列、prefetch 與執行緒池。"""
+    name: str
+    queue_name: str
+    prefetch_count: int = 8
+    max_workers: int = 4
+
+
+def task_lanes_from_env(task_queue: str, text_task_queue: str) -> List[ConsumerLane]:
+    """
+    ai-worker 的兩條 lane：文字任務（web-app 發到 RABBITMQ_TEXT_QUEUE）與音訊任務（RABBITMQ_QUEUE），
+    各自的 prefetch 與 worker 數由 AI_WORKER_TEXT_PREFETCH / AI_WORKER_TEXT_CONCURRENCY 與
+    AI_WORKER_PREFETCH / AI_WORKER_CONCURRENCY 設定。
+    """
+    return [
+        ConsumerLane(
+            name="text",
+            queue_name=text_task_queue,
+            prefetch_count=int(os.environ.get("AI_WORKER_TEXT_PREFETCH", 8)),
+            max_workers=int(os.environ.get("AI_WORKER_TEXT_CONCURRENCY", 4)),
+        ),
+        ConsumerLane(
+            name="audio",
+            queue_name=task_queue,
+            prefetch_count=int(os.environ.get("AI_WORKER_PREFETCH", 8)),
+            max_workers=int(os.environ.get("AI_WORKER_CONCURRENCY", 4)),
+        ),
+    ]
+
+
+def enqueued_at_ms(properties) -> Optional[int]:
+    """讀取發佈端寫入的入列時間（毫秒），沒有則回傳 None。"""
+    headers = getattr(properties, "headers", None) or {}
+    value = headers.get(ENQUEUED_AT_HEADER)
+    return int(value) if value is not None else None
+
+
+class ConcurrentTaskConsumer:
+    """
+    以 prefetch + 執行緒池併發消費任務佇列。
+
+    - `prefetch_count` 決定 broker 最多先送來幾筆未 ack 的訊息，也就是同時在記憶體中的上限。
+    - `max_workers` 決定同時執行的任務數。
+    - 相同 `key_func(task_data)` 的任務依到達順序處理（預設以 patient_id 分組）。
+    - handler 在 worker 執行緒中執行；ack 一律透過 `add_callback_threadsafe` 交回連線執行緒。
+    - 傳入 `lanes` 時每條 lane 使用自己的 channel 與執行緒池（加權消費），
+      例如文字 lane 保留專屬 worker，不會被音訊積壓卡住。
+    - `task_type_func(task_data)` 提供指標的 task_type 標籤，handler 執行期間也會設為目前任務類型。
+    - 設定 `retry_policy`（messaging.retry.RetryPolicy）時，handler 拋出的例外會觸發延遲重試，
+      超過次數後移到 dead-letter 佇列；未設定時維持失敗也 ack 的行為。
+    """
+
+    def __init__(
+        self,
+        rabbitmq_host: str,
+        queue_name: Optional[str] = None,
+        handler: Callable[[Dict[str, Any]], None] = None,
+        prefetch_count: int = 8,
+        max_workers: int = 4,
+        key_func: Callable[[Dict[str, Any]], Hashable] = patient_key,
+        lanes: Optional[List[ConsumerLane]] = None,
+        depth_poll_s: float = 5.0,
+        task_type_func: Optional[Callable[[Dict[str, Any]], str]] = None,
+        retry_policy=None,
+    ):
+        self.rabbitmq_host = rabbitmq_host
+        self.handler = handler
+        self.key_func = key_func
+        self.lanes = lanes or [
+            ConsumerLane(
+                name=queue_name,
+                queue_name=queue_name,
+                prefetch_count=prefetch_count,
+                max_workers=max_workers,
+            )
+        ]
+        self.queue_name = ",".join(lane.queue_name for lane in self.lanes)
+        self.depth_poll_s = depth_poll_s
+        self.task_type_func = task_type_func
+        self.retry_policy = retry_policy
+        self.executors: Dict[str, KeyedTaskExecutor] = {
+            lane.name: KeyedTaskExecutor(lane.max_workers, thread_name_prefix=f"ai-{lane.name}")
+            for lane in self.lanes
+        }
+        self._local_backlog: Dict[str, int] = {lane.name: 0 for lane in self.lanes}
+        self._backlog_lock = threading.Lock()
+        self.connection: Optional[pika.BlockingConnection] = None
+        self.channels: Dict[str, Any] = {}
+
+    def start_consuming(self) -> None:
+        """建立連線並開始消費；連線中斷時拋出例外，由呼叫端決定是否重試。"""
+        self.connection = pika.BlockingConnection(
+            pika.ConnectionParameters(host=self.rabbitmq_host)
+        )
+        self.channels = {}
+        for lane in self.lanes:
+            # 每條 lane 一個 channel，basic_qos 以 channel 為單位生效
+            channel = self.connection.channel()
+            channel.queue_declare(queue=lane.queue_name, durable=True)
+            channel.basic_qos(prefetch_count=max(1, int(lane.prefetch_count)))
+            channel.basic_consume(
+                queue=lane.queue_name,
+                on_message_callback=partial(self._on_message, lane),
+            )
+            self.channels[lane.name] = channel
+            print(
+                f" [*] 併發消費者啟動：lane={lane.name}, queue={lane.queue_name}, "
+                f"prefetch={lane.prefetch_count}, workers={lane.max_workers}",
+                flush=True,
+            )
+
+        if self.depth_poll_s > 0:
+            self.connection.call_later(self.depth_poll_s, self._poll_depth)
+        # start_consuming 會處理整條連線的事件，所有 lane 的 channel 都會被派送
+        next(iter(self.channels.values())).start_consuming()
+
+    def _poll_depth(self) -> None:
+        # 在連線執行緒中執行：以 passive declare 讀取 broker 端的待處理訊息數
+        for lane in self.lanes:
+            channel = self.channels.get(lane.name)
+            if channel is None or not channel.is_open:
+                continue
+            try:
+                frame = channel.queue_declare(queue=lane.queue_name, durable=True, passive=True)
+                LANE_DEPTH.labels(lane=lane.name, source="broker").set(frame.method.message_count)
+            except Exception as e:
+                print(f" [!] 讀取 lane {lane.name} 佇列深度失敗: {e}", flush=True)
+        if self.connection is not None and self.connection.is_open:
+            self.connection.call_later(self.depth_poll_s, self._poll_depth)
+
+    def _adjust_backlog(self, lane: ConsumerLane, delta: int) -> None:
+        with self._backlog_lock:
+            self._local_backlog[lane.name] += delta
+            LANE_DEPTH.labels(lane=lane.name, source="local").set(self._local_backlog[lane.name])
+
+    def _on_message(self, lane: ConsumerLane, ch, method, properties, body) -> None:
+        # 在連線執行緒中執行：只做解析與派工，不做任何耗時工作
+        try:
+            task_data = json.loads(body)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f" [!] 無法解析任務訊息，已丟棄: {e}", flush=True)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        if self.retry_policy is not None and isinstance(task_data, dict) and ensure_retry_key(task_data):
+            # 重試時以原始訊息重送，重試鍵要先寫進去，後續嘗試才能找到先前完成的步驟
+            body = json.dumps(task_data).encode("utf-8")
+        self._adjust_backlog(lane, 1)
+        key = self.key_func(task_data)
+        self.executors[lane.name].submit(
+            key,
+            partial(
+                self._process, lane, self.connection, ch, method.delivery_tag,
+                properties, body, task_data,
+            ),
+        )
+
+    def _process(self, lane, connection, ch, delivery_tag, properties, body, task_data: Dict[str, Any]) -> None:
+        # 在 worker 執行緒中執行
+        self._adjust_backlog(lane, -1)
+        task_type = self.task_type_func(task_data) if self.task_type_func else None
+        enqueued_ms = enqueued_at_ms(properties)
+        if enqueued_ms is not None:
+            waited_s = max(0.0, time.time() - enqueued_ms / 1000)
+            LANE_WAIT_SECONDS.labels(lane=lane.name).observe(waited_s)
+            observe_stage("queue_wait", waited_s, task_type)
+        requeue = False
+        try:
+            with task_type_context(task_type):
+                self.handler(task_data)
+        except Exception as e:
+            if self.retry_policy is None:
+                raise
+            try:
+                # 以原始訊息重送：handler 可能已經修改過 task_data
+                self.retry_policy.handle_failure(
+                    lane.queue_name, json.loads(body), getattr(properties, "headers", None), e
+                )
+            except Exception as publish_error:
+                # 重試訊息沒送出去：把原訊息退回佇列，不能 ack 掉
+                print(f" [!] 無法排入重試佇列，訊息退回 {lane.queue_name}: {publish_error}", flush=True)
+                requeue = True
+        finally:
+            self._ack_threadsafe(connection, ch, delivery_tag, requeue=requeue)
+
+    @staticmethod
+    def _ack_threadsafe(connection, ch, delivery_tag, requeue: bool = False) -> None:
+        def _ack():
+            if not ch.is_open:
+                return
+            if requeue:
+                ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
+            else:
+                ch.basic_ack(delivery_tag=delivery_tag)
+
+        try:
+            connection.add_callback_threadsafe(_ack)
+        except Exception as e:
+            # 連線已關閉：broker 會重新投遞這筆訊息
+            print(f" [!] 無法送出 ack (delivery_tag={delivery_tag}): {e}", flush=True)
@@ -0,0 +1,161 @@
+# 檔名: dlq.py
+# 說明: dead-letter 佇列的檢視與重送工具。
+#
+# 用法（於 worker/ 目錄下）:
+#   python -m messaging.dlq stats task_queue
+#   python -m messaging.dlq list task_queue --limit 20
+#   python -m messaging.dlq replay task_queue --limit 5
+#   python -m messaging.dlq purge task_queue --yes
+
+import argparse
+import datetime
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, Tuple
+
+import pika
+
+from .consumer import ENQUEUED_AT_HEADER
+from .retry import (
+    DEAD_LETTERED_AT_HEADER,
+    LAST_ERROR_HEADER,
+    ORIGINAL_QUEUE_HEADER,
+    RETRY_COUNT_HEADER,
+    dead_letter_queue_name,
+)
+
+# 重送時移除的重試紀錄，讓任務重新從第一次嘗試開始
+_RETRY_HEADERS = (
+    RETRY_COUNT_HEADER,
+    LAST_ERROR_HEADER,
+    DEAD_LETTERED_AT_HEADER,
+    ORIGINAL_QUEUE_HEADER,
+    "x-death",
+)
+
+
+def _connect(host: str):
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+    return connection, connection.channel()
+
+
+def _fetch(channel, queue_name: str, limit: int) -> Iterator[Tuple[Any, Any, bytes]]:
+    """以 basic_get 逐筆取出訊息（不自動 ack），最多 limit 筆。"""
+    for _ in range(limit):
+        method, properties, body = channel.basic_get(queue=queue_name, auto_ack=False)
+        if method is None:
+            return
+        yield method, properties, body
+
+
+def _format_ms(value) -> str:
+    if not value:
+        return "-"
+    return datetime.datetime.fromtimestamp(int(value) / 1000).isoformat(timespec="seconds")
+
+
+def cmd_stats(channel, args) -> int:
+    for queue_name in (args.queue, dead_letter_queue_name(args.queue)):
+        frame = channel.queue_declare(queue=queue_name, durable=True, passive=True)
+        print(f"{queue_name}: {frame.method.message_count} 筆待處理, {frame.method.consumer_count} 個消費者")
+    return 0
+
+
+def cmd_list(channel, args) -> int:
+    dlq = dead_letter_queue_name(args.queue)
+    count = 0
+    for method, properties, body in _fetch(channel, dlq, args.limit):
+        headers: Dict[str, Any] = properties.headers or {}
+        count += 1
+        print(f"--- #{count} ---")
+        print(f"  原佇列  : {headers.get(ORIGINAL_QUEUE_HEADER, args.queue)}")
+        print(f"  失敗次數: {headers.get(RETRY_COUNT_HEADER, '-')}")
+        print(f"  移入時間: {_format_ms(headers.get(DEAD_LETTERED_AT_HEADER))}")
+        print(f"  最後錯誤: {headers.get(LAST_ERROR_HEADER, '-')}")
+        text = body.decode("utf-8", errors="replace")
+        print(f"  內容    : {text if args.full else text[:300]}")
+    # 不 ack：關閉 channel 後訊息會回到 DLQ
+    print(f"共列出 {count} 筆（{dlq}）")
+    return 0
+
+
+def cmd_replay(channel, args) -> int:
+    dlq = dead_letter_queue_name(args.queue)
+    channel.confirm_delivery()
+    replayed = 0
+    for method, properties, body in _fetch(channel, dlq, args.limit):
+        headers = dict(properties.headers or {})
+        target = args.to or headers.get(ORIGINAL_QUEUE_HEADER) or args.queue
+        for key in _RETRY_HEADERS:
+            headers.pop(key, None)
+        headers[ENQUEUED_AT_HEADER] = int(time.time() * 1000)
+        channel.queue_declare(queue=target, durable=True)
+        # confirm 模式下 basic_publish 返回即代表 broker 已收下，之後才 ack DLQ 中的原訊息
+        channel.basic_publish(
+            exchange="",
+            routing_key=target,
+            body=body,
+            properties=pika.BasicProperties(
+                delivery_mode=2,
+                content_type=properties.content_type,
+                headers=headers,
+            ),
+        )
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        replayed += 1
+        print(f" [↺] 已重送到 {target}: {body[:120]!r}")
+    print(f"共重送 {replayed} 筆（{dlq}）")
+    return 0
+
+
+def cmd_purge(channel, args) -> int:
+    dlq = dead_letter_queue_name(args.queue)
+    if not args.yes:
+        print(f"將清空 {dlq}，請加上 --yes 確認。")
+        return 1
+    frame = channel.queue_purge(queue=dlq)
+    print(f"已清空 {dlq}，刪除 {frame.method.message_count} 筆")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="AI Worker dead-letter 佇列工具")
+    parser.add_argument(
+        "--host",
+        default=os.environ.get("RABBITMQ_HOST", "rabbitmq"),
+        help="RabbitMQ 主機 (默認: $RABBITMQ_HOST 或 rabbitmq)"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stats = subparsers.add_parser("stats", help="顯示原佇列與 DLQ 的訊息數")
+    stats.add_argument("queue", help="原佇列名稱，例如 task_queue")
+    stats.set_defaults(func=cmd_stats)
+
+    listing = subparsers.add_parser("list", help="檢視 DLQ 中的訊息（不會移除）")
+    listing.add_argument("queue", help="原佇列名稱，例如 task_queue")
+    listing.add_argument("--limit", type=int, default=20, help="最多列出幾筆 (默認: 20)")
+    listing.add_argument("--full", action="store_true", help="顯示完整訊息內容")
+    listing.set_defaults(func=cmd_list)
+
+    replay = subparsers.add_parser("replay", help="把 DLQ 中的訊息重送回原佇列")
+    replay.add_argument("queue", help="原佇列名稱，例如 task_queue")
+    replay.add_argument("--limit", type=int, default=1, help="最多重送幾筆 (默認: 1)")
+    replay.add_argument("--to", help="改送到指定佇列（默認: 訊息記錄的原佇列）")
+    replay.set_defaults(func=cmd_replay)
+
+    purge = subparsers.add_parser("purge", help="清空 DLQ")
+    purge.add_argument("queue", help="原佇列名稱，例如 task_queue")
+    purge.add_argument("--yes", action="store_true", help="確認清空")
+    purge.set_defaults(func=cmd_purge)
+
+    args = parser.parse_args(argv)
+    connection, channel = _connect(args.host)
+    try:
+        return args.func(channel, args)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# 檔名: publisher.py
+# 說明: 長駐的 RabbitMQ 發佈器。所有發佈都交給同一條 I/O 執行緒，
+#       重複使用同一個連線與 channel，支援 publisher confirms、自動重連與微批次。
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+import pika
+from pika.exceptions import AMQPChannelError, AMQPConnectionError, AMQPError, NackError, UnroutableError
+
+from .consumer import ENQUEUED_AT_HEADER
+
+
+@dataclass
+class _OutgoingMessage:
+    queue_name: str
+    body: bytes
+    properties: pika.BasicProperties
+    queue_arguments: Optional[Dict[str, Any]] = None
+    future: Future = field(default_factory=Future)
+
+
+class RabbitPublisher:
+    """
+    執行緒安全的長駐發佈器。
+
+    `publish()` 可由任何執行緒呼叫：訊息放入內部佇列，由發佈執行緒統一送出。
+    - confirms：開啟時 broker 確認收到（或拒收）後 `publish()` 才返回。
+    - 重連：連線或 channel 失效時重建，已宣告的佇列快取一併清空。
+    - 微批次：`batch_size > 1` 時，在 `batch_window_ms` 內累積的訊息一起送出，
+      未開啟 confirms 時整批只 flush 一次。
+    """
+
+    def __init__(
+        self,
+        rabbitmq_host: str,
+        confirm_delivery: bool = True,
+        batch_size: int = 1,
+        batch_window_ms: int = 0,
+        publish_timeout_s: float = 10.0,
+        max_retries: int = 3,
+        reconnect_delay_s: float = 1.0,
+    ):
+        self.rabbitmq_host = rabbitmq_host
+        self.confirm_delivery = confirm_delivery
+        self.batch_size = max(1, int(batch_size))
+        self.batch_window_s = max(0, int(batch_window_ms)) / 1000
+        self.publish_timeout_s = publish_timeout_s
+        self.max_retries = max(1, int(max_retries))
+        self.reconnect_delay_s = reconnect_delay_s
+
+        self._outbox: "queue.Queue[Optional[_OutgoingMessage]]" = queue.Queue()
+        self._connection: Optional[pika.BlockingConnection] = None
+        self._channel = None
+        self._declared: Set[str] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    # --- 對外介面 ---
+    def publish(
+        self,
+        queue_name: str,
+        message: Dict[str, Any],
+        properties: Optional[pika.BasicProperties] = None,
+        wait: bool = True,
+        queue_arguments: Optional[Dict[str, Any]] = None,
+    ) -> Future:
+        """
+        發佈一則 JSON 訊息；`wait=True` 時阻塞到送出（或確認）為止，失敗則拋出例外。
+        未指定 properties 時為持久化訊息，並帶上入列時間 header 供消費端計算等待時間。
+        `queue_arguments` 用於宣告帶參數的佇列（例如延遲重試佇列的 TTL 與 dead-letter 設定）。
+        """
+        if self._closed:
+            raise RuntimeError("RabbitPublisher 已關閉")
+        self._ensure_thread()
+
+        outgoing = _OutgoingMessage(
+            queue_name=queue_name,
+            body=json.dumps(message).encode("utf-8"),
+            properties=properties or pika.BasicProperties(
+                delivery_mode=2,
+                headers={ENQUEUED_AT_HEADER: int(time.time() * 1000)},
+            ),
+            queue_arguments=queue_arguments,
+        )
+        self._outbox.put(outgoing)
+        if wait:
+            outgoing.future.result(timeout=self.publish_timeout_s)
+        return outgoing.future
+
+    def close(self) -> None:
+        """送完佇列中剩餘的訊息後關閉連線。"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread and self._thread.is_alive():
+            self._outbox.put(None)
+            self._thread.join(timeout=self.publish_timeout_s)
+
+    # --- 發佈執行緒 ---
+    def _ensure_thread(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="rabbit-publisher", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._outbox.get(timeout=1.0)
+            except queue.Empty:
+                # 閒置時處理 heartbeat，避免長駐連線被 broker 斷開
+                self._service_connection()
+                continue
+
+            if item is None:
+                break
+
+            batch = [item] + self._drain_batch()
+            stop = any(msg is None for msg in batch)
+            messages = [msg for msg in batch if msg is not None]
+            try:
+                self._publish_batch(messages)
+            except Exception as e:
+                # 非預期錯誤不能讓發佈執行緒結束，否則後續呼叫端會一直等到逾時
+                self._disconnect()
+                for msg in messages:
+                    if not msg.future.done():
+                        msg.future.set_exception(e)
+            if stop:
+                break
+
+        self._disconnect()
+
+    def _drain_batch(self) -> List[Optional[_OutgoingMessage]]:
+        batch: List[Optional[_OutgoingMessage]] = []
+        if self.batch_size <= 1:
+            return batch
+        deadline = time.monotonic() + self.batch_window_s
+        while len(batch) < self.batch_size - 1:
+            remaining = deadline - time.monotonic()
+            try:
+                msg = self._outbox.get(timeout=remaining) if remaining > 0 else self._outbox.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(msg)
+            if msg is None:
+                break
+        return batch
+
+    def _publish_batch(self, batch: List[_OutgoingMessage]) -> None:
+        pending = list(batch)
+        sent: List[_OutgoingMessage] = []
+        failures = 0
+
+        while pending or sent:
+            try:
+                channel = self._ensure_channel()
+                while pending:
+                    msg = pending[0]
+                    if msg.queue_name not in self._declared:
+                        channel.queue_declare(
+                            queue=msg.queue_name, durable=True, arguments=msg.queue_arguments
+                        )
+                        self._declared.add(msg.queue_name)
+                    try:
+                        channel.basic_publish(
+                            exchange="",
+                            routing_key=msg.queue_name,
+                            body=msg.body,
+                            properties=msg.properties,
+                        )
+                    except (NackError, UnroutableError) as e:
+                        # broker 拒收或無法路由：不重試，直接回報給呼叫端。
+                        # 兩者是 AMQPChannelError 的子類別，必須先於下面的重連處理攔下
+                        pending.pop(0).future.set_exception(e)
+                        continue
+                    except (AMQPConnectionError, AMQPChannelError):
+                        raise
+                    except AMQPError as e:
+                        pending.pop(0).future.set_exception(e)
+                        continue
+                    pending.pop(0)
+                    if self.confirm_delivery:
+                        # confirm 模式下 basic_publish 返回即代表 broker 已 ack
+                        msg.future.set_result(True)
+                    else:
+                        sent.append(msg)
+                if sent:
+                    # 非 confirm 模式：整批寫出後只 flush 一次
+                    self._connection.process_data_events(time_limit=0)
+                    for msg in sent:
+                        msg.future.set_result(True)
+                    sent = []
+            except (AMQPConnectionError, AMQPChannelError) as e:
+                failures += 1
+                # 尚未 flush 的訊息一併重送（至少一次）
+                pending = sent + pending
+                sent = []
+                self._disconnect()
+                if failures >= self.max_retries:
+                    for msg in pending:
+                        msg.future.set_exception(e)
+                    return
+                print(
+                    f" [!] 發佈到 RabbitMQ 失敗 (第 {failures}/{self.max_retries} 次)，準備重連: {e}",
+                    flush=True,
+                )
+                time.sleep(self.reconnect_delay_s * (2 ** (failures - 1)))
+
+    def _ensure_channel(self):
+        if self._connection is None or self._connection.is_closed:
+            self._connection = pika.BlockingConnection(
+                pika.ConnectionParameters(host=self.rabbitmq_host)
+            )
+            self._channel = None
+            self._declared.clear()
+        if self._channel is None or self._channel.is_closed:
+            self._channel = self._connection.channel()
+            self._declared.clear()
+            if self.confirm_delivery:
+                self._channel.confirm_delivery()
+        return self._channel
+
+    def _service_connection(self) -> None:
+        if self._connection is None or self._connection.is_closed:
+            return
+        try:
+            self._connection.process_data_events(time_limit=0)
+        except AMQPError as e:
+            print(f" [!] 發佈連線已中斷，下次發佈時重連: {e}", flush=True)
+            self._disconnect()
+
+    def _disconnect(self) -> None:
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+        self._channel = None
+        self._declared.clear()
+
+
+# --- 單例實例與工廠模式 ---
+_publisher_instance: Optional[RabbitPublisher] = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher() -> RabbitPublisher:
+    """工廠函式，用於獲取整個行程共用的 RabbitPublisher。"""
+    global _publisher_instance
+    if _publisher_instance is None:
+        with _publisher_lock:
+            if _publisher_instance is None:
+                _publisher_instance = RabbitPublisher(
+                    rabbitmq_host=os.environ.get("RABBITMQ_HOST", "rabbitmq"),
+                    confirm_delivery=os.environ.get("RABBITMQ_PUBLISHER_CONFIRMS", "true").lower() == "true",
+                    batch_size=int(os.environ.get("RABBITMQ_PUBLISH_BATCH_SIZE", 1)),
+                    batch_window_ms=int(os.environ.get("RABBITMQ_PUBLISH_BATCH_WINDOW_MS", 0)),
+                )
+                atexit.register(_publisher_instance.close)
+    return _publisher_instance
@@ -0,0 +1,137 @@
+# 檔名: retry.py
+# 說明: 任務失敗時的延遲重試與 dead-letter 處理。
+#       失敗的訊息會送到帶 TTL 的重試佇列，TTL 到期後由 broker dead-letter 回原佇列；
+#       超過最大嘗試次數則移到 `<queue>.dlq`，可用 `python -m messaging.dlq` 檢視或重送。
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+import pika
+
+from metrics import TASK_RETRIES
+
+from .consumer import ENQUEUED_AT_HEADER
+
+# 已失敗的次數（第一次失敗後為 1）
+RETRY_COUNT_HEADER = "x-retry-count"
+ORIGINAL_QUEUE_HEADER = "x-original-queue"
+LAST_ERROR_HEADER = "x-last-error"
+DEAD_LETTERED_AT_HEADER = "x-dead-lettered-at-ms"
+
+RETRY_OUTCOME = "retry"
+DEAD_LETTER_OUTCOME = "dead_letter"
+
+
+class NonRetryableError(Exception):
+    """重試也不會成功的錯誤（例如訊息格式錯誤），直接移到 dead-letter 佇列。"""
+
+
+def dead_letter_queue_name(queue_name: str) -> str:
+    return f"{queue_name}.dlq"
+
+
+def retry_queue_name(queue_name: str, delay_ms: int) -> str:
+    # 延遲寫進佇列名稱：TTL 是佇列參數，調整退避設定時不會和既有佇列衝突
+    return f"{queue_name}.retry.{delay_ms}ms"
+
+
+def retry_count(headers: Optional[Dict[str, Any]]) -> int:
+    return int((headers or {}).get(RETRY_COUNT_HEADER) or 0)
+
+
+@dataclass
+class RetryPolicy:
+    """
+    指數退避重試策略。
+
+    第 n 次失敗後等待 `base_delay_ms * multiplier ** (n - 1)`（上限 `max_delay_ms`）再重新投遞；
+    累計失敗 `max_attempts` 次後移到 dead-letter 佇列並呼叫 `on_dead_letter`。
+    """
+    publish: Callable[..., Any]
+    max_attempts: int = 3
+    base_delay_ms: int = 5000
+    multiplier: float = 3.0
+    max_delay_ms: int = 300000
+    on_dead_letter: Optional[Callable[[Dict[str, Any], Exception], None]] = None
+
+    def delay_ms(self, failures: int) -> int:
+        delay = self.base_delay_ms * (self.multiplier ** max(0, failures - 1))
+        return int(min(delay, self.max_delay_ms))
+
+    def handle_failure(
+        self,
+        queue_name: str,
+        task_data: Dict[str, Any],
+        headers: Optional[Dict[str, Any]],
+        error: Exception,
+    ) -> str:
+        """
+        把失敗的訊息送到重試佇列或 dead-letter 佇列，回傳 "retry" 或 "dead_letter"。
+        發佈失敗時拋出例外，呼叫端不應 ack 原訊息。
+        """
+        failures = retry_count(headers) + 1
+        out_headers = {
+            key: value for key, value in (headers or {}).items()
+            if key != "x-death"  # broker 的 dead-letter 紀錄會隨重試越來越長，不需要保留
+        }
+        out_headers.update({
+            RETRY_COUNT_HEADER: failures,
+            ORIGINAL_QUEUE_HEADER: queue_name,
+            LAST_ERROR_HEADER: f"{type(error).__name__}: {error}"[:1000],
+        })
+
+        if isinstance(error, NonRetryableError) or failures >= self.max_attempts:
+            out_headers[DEAD_LETTERED_AT_HEADER] = int(time.time() * 1000)
+            self.publish(
+                dead_letter_queue_name(queue_name),
+                task_data,
+                properties=pika.BasicProperties(delivery_mode=2, headers=out_headers),
+            )
+            TASK_RETRIES.labels(queue=queue_name, outcome=DEAD_LETTER_OUTCOME).inc()
+            print(
+                f" [✗] 任務失敗 {failures} 次，已移到 {dead_letter_queue_name(queue_name)}: {error}",
+                flush=True,
+            )
+            if self.on_dead_letter is not None:
+                try:
+                    self.on_dead_letter(task_data, error)
+                except Exception as e:
+                    print(f" [!] dead-letter 回呼失敗: {e}", flush=True)
+            return DEAD_LETTER_OUTCOME
+
+        delay = self.delay_ms(failures)
+        # 入列時間設為重新投遞的時間點，佇列等待指標不會把退避時間算進去
+        out_headers[ENQUEUED_AT_HEADER] = int(time.time() * 1000) + delay
+        self.publish(
+            retry_queue_name(queue_name, delay),
+            task_data,
+            properties=pika.BasicProperties(delivery_mode=2, headers=out_headers),
+            queue_arguments={
+                "x-message-ttl": delay,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": queue_name,
+            },
+        )
+        TASK_RETRIES.labels(queue=queue_name, outcome=RETRY_OUTCOME).inc()
+        print(
+            f" [↻] 任務第 {failures}/{self.max_attempts} 次失敗，{delay / 1000:.1f} 秒後重試: {error}",
+            flush=True,
+        )
+        return RETRY_OUTCOME
+
+
+def retry_policy_from_env(
+    publish: Callable[..., Any],
+    on_dead_letter: Optional[Callable[[Dict[str, Any], Exception], None]] = None,
+) -> RetryPolicy:
+    """依環境變數建立重試策略（AI_WORKER_MAX_ATTEMPTS / AI_WORKER_RETRY_*）。"""
+    return RetryPolicy(
+        publish=publish,
+        max_attempts=int(os.environ.get("AI_WORKER_MAX_ATTEMPTS", 3)),
+        base_delay_ms=int(os.environ.get("AI_WORKER_RETRY_BASE_DELAY_MS", 5000)),
+        multiplier=float(os.environ.get("AI_WORKER_RETRY_MULTIPLIER", 3.0)),
+        max_delay_ms=int(os.environ.get("AI_WORKER_RETRY_MAX_DELAY_MS", 300000)),
+        on_dead_letter=on_dead_letter,
+    )
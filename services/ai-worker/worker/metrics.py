@@ -0,0 +1,225 @@
+# 檔名: metrics.py
+# 說明: ai-worker 的 Prometheus 指標。未安裝 prometheus_client 時改用 no-op 實作，
+#       呼叫端不需要判斷套件是否存在。
+
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# 可選匯入：若環境未安裝則所有指標皆為 no-op
+try:
+    from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+    PROMETHEUS_AVAILABLE = True
+except Exception:
+    Counter = Gauge = Histogram = None
+    start_http_server = None
+    PROMETHEUS_AVAILABLE = False
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, *args, **kwargs):
+        pass
+
+    def inc(self, *args, **kwargs):
+        pass
+
+    def dec(self, *args, **kwargs):
+        pass
+
+    def set(self, *args, **kwargs):
+        pass
+
+
+def _metric(metric_cls, name, documentation, labelnames=(), **kwargs):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    return metric_cls(name, documentation, labelnames, **kwargs)
+
+
+# 從入列到開始處理的等待時間（秒），涵蓋 broker 佇列與本地 prefetch 佇列
+WAIT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LANE_DEPTH = _metric(
+    Gauge, "ai_worker_lane_depth",
+    "Messages waiting per lane (source=broker: ready in RabbitMQ, source=local: prefetched but not started)",
+    ["lane", "source"],
+)
+LANE_WAIT_SECONDS = _metric(
+    Histogram, "ai_worker_lane_wait_seconds",
+    "Time from enqueue to start of processing per lane",
+    ["lane"], buckets=WAIT_BUCKETS,
+)
+TASK_RETRIES = _metric(
+    Counter, "ai_worker_task_retries_total",
+    "Failed task attempts by queue and outcome (retry: re-queued with backoff, dead_letter: moved to the DLQ)",
+    ["queue", "outcome"],
+)
+
+MODEL_LOADED = _metric(
+    Gauge, "ai_worker_model_loaded",
+    "Whether a model is resident in this process (1 loaded, 0 unloaded)",
+    ["model"],
+)
+MODEL_MEMORY_BYTES = _metric(
+    Gauge, "ai_worker_model_memory_bytes",
+    "Approximate parameter and buffer memory held by a resident model",
+    ["model"],
+)
+
+# 微批次：每批筆數、佇列深度、請求在批次窗內等待的時間與每批處理時間（秒）
+BATCH_SIZE = _metric(
+    Histogram, "ai_worker_batch_size",
+    "Requests merged into one model call per batcher",
+    ["batcher"], buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32),
+)
+BATCH_QUEUE_DEPTH = _metric(
+    Gauge, "ai_worker_batch_queue_depth",
+    "Requests submitted to a batcher and not yet picked up by its worker thread",
+    ["batcher"],
+)
+BATCH_PROCESS_SECONDS = _metric(
+    Histogram, "ai_worker_batch_process_seconds",
+    "Time spent running one merged batch through the model",
+    ["batcher"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+BATCH_WAIT_SECONDS = _metric(
+    Histogram, "ai_worker_batch_wait_seconds",
+    "Time a request waited in the batch window before its batch started",
+    ["batcher"], buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+# TTS 音訊快取：命中率與淘汰
+TTS_CACHE_REQUESTS = _metric(
+    Counter, "ai_worker_tts_cache_requests_total",
+    "TTS cache lookups by result (hit, miss, error)",
+    ["result"],
+)
+TTS_CACHE_EVICTIONS = _metric(
+    Counter, "ai_worker_tts_cache_evictions_total",
+    "Cached TTS objects evicted to stay under TTS_CACHE_MAX_BYTES",
+)
+TTS_CACHE_BYTES = _metric(
+    Gauge, "ai_worker_tts_cache_bytes",
+    "Total size of cached TTS objects as last seen by this process",
+)
+
+# TTS torch.compile：啟動預熱各輸入形狀的耗時，以及預熱後在請求路徑上發生的重新編譯
+TTS_COMPILE_SECONDS = _metric(
+    Gauge, "ai_worker_tts_compile_seconds",
+    "Warmup (compile) time per TTS input shape, batch x prompt bucket",
+    ["shape"],
+)
+TTS_RECOMPILES = _metric(
+    Counter, "ai_worker_tts_recompiles_total",
+    "torch.compile recompilations triggered by requests after warmup",
+    ["shape"],
+)
+
+# ASR 解碼設定（short / medium / long）：每次 pipeline 呼叫的耗時（秒）
+ASR_DECODE_SECONDS = _metric(
+    Histogram, "ai_worker_asr_decode_seconds",
+    "ASR pipeline call latency per length-based decode profile",
+    ["profile"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+
+# STT 轉錄快取：以音檔內容雜湊查詢（bypass: 呼叫端要求略過快取）
+STT_CACHE_REQUESTS = _metric(
+    Counter, "ai_worker_stt_cache_requests_total",
+    "Transcript cache lookups by result (hit, miss, error, bypass)",
+    ["result"],
+)
+
+# STT 語音活動偵測：解碼後的錄音總長與實際送進 ASR 的語音長度（秒）
+STT_AUDIO_SECONDS = _metric(
+    Counter, "ai_worker_stt_audio_seconds_total",
+    "Audio seconds seen by STT (kind=decoded: after decode, kind=speech: sent to ASR after VAD trimming)",
+    ["kind"],
+)
+
+# 文字回覆的上下文收集（guardrail、記憶判斷、畫像、embedding、Milvus、Redis 平行發出）
+CONTEXT_CALL_SECONDS = _metric(
+    Histogram, "ai_worker_context_call_seconds",
+    "Latency of each context-gathering call in a chat turn, by outcome (ok, timeout, error)",
+    ["call", "status"], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30),
+)
+CONTEXT_CRITICAL_PATH = _metric(
+    Counter, "ai_worker_context_critical_path_total",
+    "Chat turns in which a context call was on the critical path",
+    ["call"],
+)
+
+# 各階段耗時（秒）：queue_wait / stt / llm / tts / audio_decode / stt_inference / minio_download / minio_upload / notification_publish
+# （STT 邊下載邊解碼：minio_download 是 audio_decode 之中等待 MinIO 的部分）
+STAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = _metric(
+    Histogram, "ai_worker_stage_seconds",
+    "Latency per pipeline stage, labelled by task type and outcome",
+    ["stage", "task_type", "status"], buckets=STAGE_BUCKETS,
+)
+
+
+# 目前任務的類型；由消費者在 worker 執行緒中設定，巢狀呼叫（例如 MinIO 下載）自動沿用
+_current_task_type: contextvars.ContextVar = contextvars.ContextVar(
+    "ai_worker_task_type", default="unknown"
+)
+
+
+def current_task_type() -> str:
+    return _current_task_type.get()
+
+
+@contextmanager
+def task_type_context(task_type: Optional[str]) -> Iterator[None]:
+    """在區塊內設定目前任務類型，供 `track_stage` 當作 task_type 標籤。"""
+    token = _current_task_type.set(task_type or "unknown")
+    try:
+        yield
+    finally:
+        _current_task_type.reset(token)
+
+
+def observe_stage(stage: str, seconds: float, task_type: Optional[str] = None, status: str = "ok") -> None:
+    STAGE_SECONDS.labels(
+        stage=stage, task_type=task_type or current_task_type(), status=status
+    ).observe(max(0.0, seconds))
+
+
+@contextmanager
+def track_stage(stage: str, task_type: Optional[str] = None) -> Iterator[None]:
+    """
+    計時一個階段並寫入 `ai_worker_stage_seconds`；區塊拋出例外時以 status="error" 記錄。
+    有指定 task_type 時，區塊內的巢狀階段也會沿用同一個標籤。
+    """
+    task_type = task_type or current_task_type()
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        with task_type_context(task_type):
+            yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started, task_type, status)
+
+
+_server_started = False
+
+
+def start_metrics_server() -> bool:
+    """依 AI_WORKER_METRICS_PORT 啟動 /metrics HTTP 端點；未設定或套件不存在時不啟動。"""
+    global _server_started
+    port = os.environ.get("AI_WORKER_METRICS_PORT")
+    if _server_started or not port or not PROMETHEUS_AVAILABLE:
+        return _server_started
+    start_http_server(int(port))
+    _server_started = True
+    print(f"📈 [AI Worker] Prometheus 指標端點已啟動於 :{port}/metrics", flush=True)
+    return True
@@ -0,0 +1,304 @@
+# 檔名: model_registry.py
+# 說明: 行程內共用的模型常駐管理。STT / TTS 等大型模型在每個行程只載入一次，
+#       可延遲載入或啟動時預熱，並提供載入狀態、記憶體用量與閒置卸載。
+#       所有入口（main、ai_service_refactored、voice_app）都透過這裡取得服務實例。
+
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from metrics import MODEL_LOADED, MODEL_MEMORY_BYTES
+
+# 可選匯入：沒有 torch 時不計算參數記憶體與 CUDA 用量
+try:
+    import torch
+
+    TORCH_AVAILABLE = True
+except Exception:
+    torch = None
+    TORCH_AVAILABLE = False
+
+STATE_UNLOADED = "unloaded"
+STATE_LOADING = "loading"
+STATE_LOADED = "loaded"
+STATE_FAILED = "failed"
+
+
+@dataclass
+class _ModelEntry:
+    name: str
+    loader: Callable[[], Any]
+    unloader: Optional[Callable[[Any], None]] = None
+    idle_ttl_s: Optional[float] = None
+    instance: Any = None
+    state: str = STATE_UNLOADED
+    error: Optional[str] = None
+    load_seconds: Optional[float] = None
+    loaded_at: Optional[float] = None
+    last_used: Optional[float] = None
+    in_use: int = 0
+    memory_bytes: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def _module_memory_bytes(obj: Any, depth: int = 2, seen: Optional[set] = None) -> int:
+    """估算物件持有的 torch 參數與 buffer 大小（位元組），會往下找兩層屬性。"""
+    if not TORCH_AVAILABLE or obj is None:
+        return 0
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, torch.nn.Module):
+        total = 0
+        for tensor in list(obj.parameters()) + list(obj.buffers()):
+            if id(tensor) not in seen:
+                seen.add(id(tensor))
+                total += tensor.numel() * tensor.element_size()
+        return total
+
+    if depth <= 0 or not hasattr(obj, "__dict__"):
+        return 0
+    return sum(
+        _module_memory_bytes(value, depth - 1, seen)
+        for value in vars(obj).values()
+        if not isinstance(value, (str, bytes, int, float, bool))
+    )
+
+
+def _process_memory() -> Dict[str, int]:
+    """行程層級的記憶體用量：RSS 與 CUDA 已配置/保留量（位元組）。"""
+    memory: Dict[str, int] = {}
+    try:
+        with open("/proc/self/statm") as f:
+            memory["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if TORCH_AVAILABLE and torch.cuda.is_available():
+        memory["cuda_allocated_bytes"] = int(torch.cuda.memory_allocated())
+        memory["cuda_reserved_bytes"] = int(torch.cuda.memory_reserved())
+    return memory
+
+
+class ModelRegistry:
+    """
+    以名稱註冊模型的載入函式；`get()` 第一次呼叫時載入，之後回傳同一個實例。
+
+    - 同一個模型的載入以鎖保護，併發呼叫只會載入一次。
+    - `warmup()` 於啟動時預先載入；載入失敗會記錄在狀態中，下次 `get()` 時重試。
+    - `use()` 標記使用中，閒置卸載不會卸載正在使用的模型。
+    - `unload_idle()` 卸載超過 `idle_ttl_s` 未使用的模型，下次使用時重新載入。
+    """
+
+    def __init__(self, default_idle_ttl_s: Optional[float] = None):
+        self.default_idle_ttl_s = default_idle_ttl_s
+        self._entries: Dict[str, _ModelEntry] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def register(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        unloader: Optional[Callable[[Any], None]] = None,
+        idle_ttl_s: Optional[float] = None,
+    ) -> None:
+        with self._lock:
+            if name in self._entries:
+                return
+            self._entries[name] = _ModelEntry(
+                name=name,
+                loader=loader,
+                unloader=unloader,
+                idle_ttl_s=idle_ttl_s if idle_ttl_s is not None else self.default_idle_ttl_s,
+            )
+            MODEL_LOADED.labels(model=name).set(0)
+
+    def _entry(self, name: str) -> _ModelEntry:
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise KeyError(f"未註冊的模型: {name}") from None
+
+    def get(self, name: str) -> Any:
+        """取得模型實例，尚未載入時在呼叫端執行緒中載入。"""
+        entry = self._entry(name)
+        instance = entry.instance
+        if instance is None:
+            with entry.lock:
+                if entry.instance is None:
+                    self._load(entry)
+                instance = entry.instance
+        entry.last_used = time.monotonic()
+        return instance
+
+    def _load(self, entry: _ModelEntry) -> None:
+        # 呼叫端持有 entry.lock
+        entry.state = STATE_LOADING
+        entry.error = None
+        print(f"📦 [ModelRegistry] 載入模型 {entry.name}...", flush=True)
+        started = time.perf_counter()
+        try:
+            entry.instance = entry.loader()
+        except Exception as e:
+            entry.state = STATE_FAILED
+            entry.error = str(e)
+            print(f"❌ [ModelRegistry] 模型 {entry.name} 載入失敗: {e}", flush=True)
+            raise
+        entry.load_seconds = time.perf_counter() - started
+        entry.loaded_at = time.time()
+        entry.state = STATE_LOADED
+        entry.memory_bytes = _module_memory_bytes(entry.instance)
+        MODEL_LOADED.labels(model=entry.name).set(1)
+        MODEL_MEMORY_BYTES.labels(model=entry.name).set(entry.memory_bytes)
+        print(
+            f"✅ [ModelRegistry] 模型 {entry.name} 載入完成，耗時 {entry.load_seconds:.1f}s，"
+            f"參數約 {entry.memory_bytes / 1024 ** 2:.0f} MiB",
+            flush=True,
+        )
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[Any]:
+        """在區塊內使用模型；使用期間不會被閒置卸載。"""
+        entry = self._entry(name)
+        with self._lock:
+            entry.in_use += 1
+        try:
+            yield self.get(name)
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+    def warmup(self, names: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+        """預先載入指定模型（預設全部），回傳各模型是否載入成功。"""
+        results = {}
+        for name in list(names) if names is not None else list(self._entries):
+            try:
+                self.get(name)
+                results[name] = True
+            except Exception:
+                results[name] = False
+        return results
+
+    def unload(self, name: str) -> bool:
+        """卸載模型並釋放記憶體；模型使用中時不卸載，回傳是否已卸載。"""
+        entry = self._entry(name)
+        with entry.lock:
+            with self._lock:
+                if entry.instance is None or entry.in_use > 0:
+                    return False
+                instance, entry.instance = entry.instance, None
+            entry.state = STATE_UNLOADED
+            entry.loaded_at = None
+            entry.memory_bytes = 0
+        if entry.unloader is not None:
+            try:
+                entry.unloader(instance)
+            except Exception as e:
+                print(f"⚠️ [ModelRegistry] 模型 {name} 卸載回呼失敗: {e}", flush=True)
+        del instance
+        gc.collect()
+        if TORCH_AVAILABLE and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        MODEL_LOADED.labels(model=name).set(0)
+        MODEL_MEMORY_BYTES.labels(model=name).set(0)
+        print(f"🧹 [ModelRegistry] 已卸載閒置模型 {name}", flush=True)
+        return True
+
+    def unload_idle(self, now: Optional[float] = None) -> List[str]:
+        """卸載超過閒置時間的模型，回傳被卸載的模型名稱。"""
+        now = now if now is not None else time.monotonic()
+        unloaded = []
+        for entry in list(self._entries.values()):
+            if not entry.idle_ttl_s or entry.instance is None or entry.last_used is None:
+                continue
+            if now - entry.last_used >= entry.idle_ttl_s and self.unload(entry.name):
+                unloaded.append(entry.name)
+        return unloaded
+
+    def start_idle_reaper(self, interval_s: float = 60.0) -> None:
+        """啟動背景執行緒定期卸載閒置模型。"""
+        if self._reaper is not None:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(interval_s)
+                try:
+                    self.unload_idle()
+                except Exception as e:
+                    print(f"⚠️ [ModelRegistry] 閒置卸載失敗: {e}", flush=True)
+
+        self._reaper = threading.Thread(target=_loop, name="model-idle-reaper", daemon=True)
+        self._reaper.start()
+
+    def status(self) -> Dict[str, Any]:
+        """各模型的載入狀態與記憶體，以及行程層級的記憶體用量。"""
+        now = time.monotonic()
+        models = {}
+        for entry in list(self._entries.values()):
+            models[entry.name] = {
+                "state": entry.state,
+                "in_use": entry.in_use,
+                "load_seconds": entry.load_seconds,
+                "loaded_at": entry.loaded_at,
+                "idle_seconds": (now - entry.last_used) if entry.last_used is not None else None,
+                "idle_ttl_s": entry.idle_ttl_s,
+                "memory_bytes": entry.memory_bytes,
+                "error": entry.error,
+            }
+        return {"models": models, "process": _process_memory()}
+
+
+# --- 預設模型 ---
+
+def _load_stt():
+    from stt_app.stt_service import STTService
+
+    return STTService()
+
+
+def _load_tts():
+    from tts_app.tts_service import TTSService
+
+    return TTSService()
+
+
+# --- 單例實例與工廠模式 ---
+_registry_instance: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """工廠函式，用於獲取整個行程共用的 ModelRegistry（已註冊 stt 與 tts）。"""
+    global _registry_instance
+    if _registry_instance is None:
+        with _registry_lock:
+            if _registry_instance is None:
+                idle_ttl_s = float(os.environ.get("AI_WORKER_MODEL_IDLE_TTL_S", 0)) or None
+                registry = ModelRegistry(default_idle_ttl_s=idle_ttl_s)
+                registry.register("stt", _load_stt, unloader=lambda service: service.close())
+                registry.register("tts", _load_tts, unloader=lambda service: service.close())
+                _registry_instance = registry
+    return _registry_instance
+
+
+def start_model_residency() -> ModelRegistry:
+    """
+    依環境變數設定啟動時的模型常駐行為，供各入口在啟動時呼叫：
+      AI_WORKER_WARMUP_MODELS     逗號分隔的模型名稱（例如 "stt,tts"），啟動時預先載入；預設延遲載入
+      AI_WORKER_MODEL_IDLE_TTL_S  > 0 時，閒置超過該秒數的模型會被卸載以釋放 GPU 記憶體
+    """
+    registry = get_model_registry()
+    warmup_models = [m.strip() for m in os.environ.get("AI_WORKER_WARMUP_MODELS", "").split(",") if m.strip()]
+    if warmup_models:
+        print(f"🔥 [ModelRegistry] 預熱模型: {registry.warmup(warmup_models)}", flush=True)
+    if registry.default_idle_ttl_s:
+        registry.start_idle_reaper(interval_s=min(60.0, registry.default_idle_ttl_s))
+    return registry
@@ -0,0 +1,20 @@
+from .checkpoints import StepCheckpoints, task_checkpoints
+from .stages import (
+    ALL_STAGES,
+    StagePipeline,
+    run_llm_step,
+    run_stt_step,
+    run_tts_step,
+    stage_queue_name,
+)
+
+__all__ = [
+    "ALL_STAGES",
+    "StagePipeline",
+    "StepCheckpoints",
+    "run_llm_step",
+    "run_stt_step",
+    "run_tts_step",
+    "stage_queue_name",
+    "task_checkpoints",
+]
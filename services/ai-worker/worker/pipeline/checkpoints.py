@@ -0,0 +1,82 @@
+"""
+Step checkpoints for inline retries
+
+The inline pipeline runs STT -> LLM -> TTS inside one handler call, and a
+retry redelivers the original message. Each completed step's result is stored
+in Redis under the message's retry key, so a retry after a TTS or publish
+failure reuses the transcript and the LLM reply instead of calling the model
+(and writing the conversation round) a second time.
+
+Checkpoints are best effort: without a retry key or Redis, or on a Redis
+error, the step simply runs again.
+"""
+
+import json
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from messaging.consumer import RETRY_KEY_FIELD
+
+# Optional import: without redis every lookup is a miss
+try:
+    import redis
+
+    REDIS_AVAILABLE = True
+except Exception:
+    redis = None
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class StepCheckpoints:
+    """Completed step results for one task, kept in the hash `ai:task:{retry_key}:steps`"""
+
+    def __init__(self, redis_client, retry_key: Optional[str], ttl_s: int = 24 * 3600):
+        self.redis = redis_client if retry_key else None
+        self.key = f"ai:task:{retry_key}:steps"
+        self.ttl_s = ttl_s
+
+    def get(self, step: str) -> Optional[Any]:
+        if self.redis is None:
+            return None
+        try:
+            value = self.redis.hget(self.key, step)
+        except Exception as e:
+            logger.warning(f"讀取步驟檢查點失敗，重新執行 {step}: {e}")
+            return None
+        if value is not None:
+            print(f" [↻] 重試沿用已完成的 {step} 步驟結果", flush=True)
+            return json.loads(value)
+        return None
+
+    def put(self, step: str, value: Any) -> None:
+        if self.redis is None:
+            return
+        try:
+            with self.redis.pipeline() as pipe:
+                pipe.hset(self.key, step, json.dumps(value, ensure_ascii=False))
+                pipe.expire(self.key, self.ttl_s)
+                pipe.execute()
+        except Exception as e:
+            logger.warning(f"寫入步驟檢查點失敗: {e}")
+
+
+@lru_cache(maxsize=1)
+def _redis_client():
+    return redis.Redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+
+
+def task_checkpoints(task_data: Dict[str, Any]) -> StepCheckpoints:
+    """
+    Checkpoints for a task message. AI_WORKER_CHECKPOINT_TTL_S (default one day)
+    must outlast the full retry schedule.
+    """
+    client = _redis_client() if REDIS_AVAILABLE else None
+    return StepCheckpoints(
+        client,
+        task_data.get(RETRY_KEY_FIELD),
+        ttl_s=int(os.environ.get("AI_WORKER_CHECKPOINT_TTL_S", 24 * 3600)),
+    )
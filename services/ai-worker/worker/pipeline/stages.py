@@ -0,0 +1,303 @@
+"""
+Stage-split AI pipeline
+
+Runs STT, LLM and TTS as separate RabbitMQ stages so each one can be scaled
+to its own bottleneck. The AITask domain object is serialized with to_dict()
+and handed from one stage queue to the next; the last stage publishes the
+notification payload.
+
+The step functions are shared with AIServiceRefactored so both the inline
+and the staged pipeline apply the same domain rules.
+"""
+
+import os
+import time
+from typing import Any, Callable, ContextManager, Dict, List, Optional
+
+from domain.ai_task import AITask, NotificationEvent, ProcessingStep, TaskStatus, TaskType
+from mappers.task_mapper import TaskMapper
+from messaging.retry import NonRetryableError
+from metrics import track_stage
+
+STT_STAGE = "stt"
+LLM_STAGE = "llm"
+TTS_STAGE = "tts"
+ALL_STAGES = (STT_STAGE, LLM_STAGE, TTS_STAGE)
+
+# Stage order per task type
+STAGE_ROUTES: Dict[TaskType, List[str]] = {
+    TaskType.TEXT_ONLY: [LLM_STAGE],
+    TaskType.AUDIO_STT_LLM_TTS: [STT_STAGE, LLM_STAGE, TTS_STAGE],
+    TaskType.AUDIO_STT_LLM: [STT_STAGE, LLM_STAGE],
+    TaskType.LLM_TTS: [LLM_STAGE, TTS_STAGE],
+}
+
+
+# --- Step functions (shared with AIServiceRefactored) ---
+#
+# A step that cannot succeed on retry (empty result, NonRetryableError) is
+# marked failed and returns. Any other exception is recorded on the step and
+# re-raised, so the consumer's RetryPolicy redelivers the stage message.
+
+def _fail_step_and_reraise(ai_task: AITask, step: ProcessingStep, label: str, error: Exception) -> None:
+    ai_task.fail_step(step, f"{label} processing failed: {str(error)}")
+    if not isinstance(error, NonRetryableError):
+        raise error
+
+def run_stt_step(ai_task: AITask, stt_service) -> None:
+    """Speech to text: fills ai_task.input_text"""
+    stt_step = ai_task.start_step(ProcessingStep.STT)
+    if not stt_step:
+        return
+
+    try:
+        with track_stage(STT_STAGE, ai_task.task_type.value):
+            transcript = stt_service.transcribe_audio(ai_task.audio_bucket, ai_task.audio_object)
+        if not transcript:
+            ai_task.fail_step(ProcessingStep.STT, "STT service returned empty transcript")
+            return
+
+        ai_task.complete_step(ProcessingStep.STT, transcript)
+
+    except Exception as e:
+        _fail_step_and_reraise(ai_task, ProcessingStep.STT, "STT", e)
+
+
+def run_llm_step(ai_task: AITask, llm_service) -> None:
+    """LLM processing: stores the reply in task_metadata['ai_response']"""
+    llm_step = ai_task.start_step(ProcessingStep.LLM)
+    if not llm_step:
+        return
+
+    try:
+        # Convert domain task to LLM service format
+        llm_task_data = convert_to_llm_format(ai_task)
+
+        # Generate AI response
+        with track_stage(LLM_STAGE, ai_task.task_type.value):
+            ai_response = llm_service.generate_response(llm_task_data)
+        if not ai_response:
+            ai_task.fail_step(ProcessingStep.LLM, "LLM service returned empty response")
+            return
+
+        # Store response with metadata
+        llm_metadata = {
+            "input_length": len(ai_task.input_text or ""),
+            "output_length": len(ai_response),
+            "model_used": "health_bot"  # Could be extracted from LLM service
+        }
+
+        ai_task.complete_step(ProcessingStep.LLM, ai_response, llm_metadata)
+
+    except Exception as e:
+        _fail_step_and_reraise(ai_task, ProcessingStep.LLM, "LLM", e)
+
+
+def run_tts_step(ai_task: AITask, tts_service) -> None:
+    """Text to speech: stores the uploaded object name in task_metadata['response_audio_url']"""
+    tts_step = ai_task.start_step(ProcessingStep.TTS)
+    if not tts_step:
+        return
+
+    try:
+        ai_response = ai_task.task_metadata.get('ai_response')
+        if not ai_response:
+            ai_task.fail_step(ProcessingStep.TTS, "No AI response available for TTS")
+            return
+
+        # Synthesize speech
+        with track_stage(TTS_STAGE, ai_task.task_type.value):
+            audio_url, duration_ms = tts_service.synthesize_text(ai_response)
+        if not audio_url:
+            ai_task.fail_step(ProcessingStep.TTS, "TTS service returned empty audio URL")
+            return
+
+        # Store TTS result with metadata
+        tts_metadata = {
+            "audio_duration_ms": duration_ms,
+            "text_length": len(ai_response)
+        }
+
+        ai_task.complete_step(ProcessingStep.TTS, audio_url, tts_metadata)
+
+    except Exception as e:
+        _fail_step_and_reraise(ai_task, ProcessingStep.TTS, "TTS", e)
+
+
+def convert_to_llm_format(ai_task: AITask) -> Dict[str, Any]:
+    """Convert domain AITask to LLM service format"""
+    llm_data = {
+        "patient_id": ai_task.patient_id,
+        "text": ai_task.input_text
+    }
+
+    if ai_task.line_user_id:
+        llm_data["line_user_id"] = ai_task.line_user_id
+
+    if ai_task.audio_object:
+        llm_data["object_name"] = ai_task.audio_object
+
+    return llm_data
+
+
+# --- Stage routing ---
+
+def stage_queue_name(stage: str) -> str:
+    """Queue name for a stage, overridable with AI_<STAGE>_QUEUE"""
+    return os.environ.get(f"AI_{stage.upper()}_QUEUE", f"ai_{stage}_queue")
+
+
+def stage_concurrency(stage: str) -> int:
+    """Worker count for a stage, overridable with AI_<STAGE>_CONCURRENCY"""
+    defaults = {STT_STAGE: 1, LLM_STAGE: 8, TTS_STAGE: 1}
+    return int(os.environ.get(f"AI_{stage.upper()}_CONCURRENCY", defaults[stage]))
+
+
+def next_stage(ai_task: AITask, current: Optional[str] = None) -> Optional[str]:
+    """Next stage for the task, or None when the pipeline is done"""
+    route = STAGE_ROUTES[ai_task.task_type]
+    if current is None:
+        return route[0]
+    index = route.index(current)
+    return route[index + 1] if index + 1 < len(route) else None
+
+
+def _stage_message_key(message: Dict[str, Any]) -> str:
+    return str((message.get("task") or {}).get("patient_id") or "unknown")
+
+
+class StagePipeline:
+    """
+    Dispatches tasks into stage queues and runs the stage handlers
+
+    Services are resolved lazily per stage, so a process that only runs the
+    LLM stage never loads the ASR or TTS models. `service_factories` maps a
+    stage to a callable returning a context manager that yields the service.
+
+    With `progressive=True` the transcript and the LLM reply are published as
+    partial notifications as soon as they exist, ahead of the final one.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[str, Dict[str, Any]], None],
+        notify: Callable[[Dict[str, Any], Any], None],
+        service_factories: Dict[str, Callable[[], ContextManager[Any]]],
+        progressive: bool = False,
+    ):
+        self.publish = publish
+        self.notify = notify
+        self.progressive = progressive
+        self.service_factories = service_factories
+
+    def _use_service(self, stage: str) -> ContextManager[Any]:
+        # Each factory returns a context manager that holds the service for the
+        # duration of the stage (model_registry.use() for STT/TTS), so the idle
+        # reaper cannot unload a model mid-call. No reference is kept afterwards.
+        return self.service_factories[stage]()
+
+    def dispatch(self, task_data: Dict[str, Any]) -> None:
+        """Entry point for raw task_queue messages: validate and route to the first stage"""
+        print(f"\n [x] 收到任務（分段管道）: {task_data}", flush=True)
+        try:
+            ai_task = TaskMapper.rabbitmq_to_domain(task_data)
+        except ValueError as e:
+            # Same as the inline handler: straight to the dead-letter queue, which
+            # also sends the failure notification
+            raise NonRetryableError(f"未知的任務格式: {e}") from e
+
+        validation_errors = ai_task.validate_input()
+        if validation_errors:
+            ai_task.fail_task(f"Validation failed: {'; '.join(validation_errors)}")
+            self._finish(ai_task)
+            return
+
+        ai_task.start_processing()
+        self._forward(ai_task, next_stage(ai_task))
+
+    def handle_stage(self, stage: str, message: Dict[str, Any]) -> None:
+        """Run one stage for a task received from that stage's queue"""
+        ai_task = AITask.from_dict(message["task"])
+        print(f" [*] [{stage}] 處理任務 {ai_task.task_id} (病患 {ai_task.patient_id})", flush=True)
+
+        step_runners = {
+            STT_STAGE: run_stt_step,
+            LLM_STAGE: run_llm_step,
+            TTS_STAGE: run_tts_step,
+        }
+        # Transient errors (including service construction) propagate to the
+        # consumer's RetryPolicy; the final error notification is sent by
+        # notify_dead_letter once the retries are exhausted.
+        with self._use_service(stage) as service:
+            step_runners[stage](ai_task, service)
+
+        if ai_task.status == TaskStatus.FAILED:
+            self._finish(ai_task)
+            return
+
+        upcoming = next_stage(ai_task, stage)
+        if self.progressive and upcoming is not None:
+            self._notify_progress(ai_task, stage)
+        self._forward(ai_task, upcoming)
+
+    def notify_dead_letter(self, message: Dict[str, Any], error: Exception) -> None:
+        """RetryPolicy.on_dead_letter for stage queues: publish the final error notification"""
+        if "task" not in message:
+            return
+        ai_task = AITask.from_dict(message["task"])
+        ai_task.fail_task(str(error))
+        self._finish(ai_task)
+
+    def _notify_progress(self, ai_task: AITask, stage: str) -> None:
+        events = {STT_STAGE: NotificationEvent.TRANSCRIPT, LLM_STAGE: NotificationEvent.REPLY}
+        if stage not in events:
+            return
+        try:
+            self.notify(ai_task.create_progress_payload(events[stage]), ai_task.patient_id)
+        except Exception as e:
+            # Partial notifications are best effort; the final one still goes out
+            print(f" [!] 任務 {ai_task.task_id} 的進度通知發送失敗: {e}", flush=True)
+
+    def _forward(self, ai_task: AITask, stage: Optional[str]) -> None:
+        if stage is None:
+            self._finish(ai_task)
+            return
+        self.publish(stage_queue_name(stage), {"task": ai_task.to_dict(), "forwarded_at": time.time()})
+
+    def _finish(self, ai_task: AITask) -> None:
+        if ai_task.status == TaskStatus.PROCESSING:
+            ai_task.complete_task()
+        payload = TaskMapper.domain_to_notification(ai_task)
+        self.notify(payload, ai_task.patient_id)
+        if ai_task.start_step(ProcessingStep.NOTIFICATION):
+            ai_task.complete_step(ProcessingStep.NOTIFICATION, "published")
+        print(f" [✔] 任務 {ai_task.task_id} 完成，狀態: {ai_task.status.value}", flush=True)
+
+    def stage_consumers(self, rabbitmq_host: str, stages: List[str], retry_policy=None):
+        """Build one concurrent consumer per stage, each with its own prefetch/concurrency"""
+        from messaging.consumer import ConcurrentTaskConsumer
+
+        consumers = []
+        for stage in stages:
+            concurrency = stage_concurrency(stage)
+            consumers.append(ConcurrentTaskConsumer(
+                rabbitmq_host=rabbitmq_host,
+                queue_name=stage_queue_name(stage),
+                handler=lambda message, stage=stage: self.handle_stage(stage, message),
+                prefetch_count=concurrency * 2,
+                max_workers=concurrency,
+                key_func=_stage_message_key,
+                task_type_func=TaskMapper.task_type_label,
+                retry_policy=retry_policy,
+            ))
+        return consumers
+
+
+def run_forever(consume: Callable[[], None], name: str) -> None:
+    """Keep a blocking consumer alive across connection failures"""
+    while True:
+        try:
+            consume()
+        except Exception as e:
+            print(f" [!] {name} 消費者中斷: {e}。5 秒後重試...", flush=True)
+            time.sleep(5)
@@ -0,0 +1,154 @@
+# 檔名: audio_decode.py
+# 說明: STT 前端的音訊解碼。MinIO 物件的內容以串流方式餵給 ffmpeg，
+#       直接輸出 16kHz 單聲道 float32，下載與解碼同時進行，不讀完整個物件也不寫暫存檔。
+#       沒有 ffmpeg 時改用 soundfile 在記憶體中解碼，重新採樣器依來源取樣率快取重用。
+
+import functools
+import io
+import shutil
+import subprocess
+import threading
+import time
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# 可選匯入：ffmpeg 不存在時的後備解碼器
+try:
+    import soundfile
+
+    SOUNDFILE_AVAILABLE = True
+except Exception:
+    soundfile = None
+    SOUNDFILE_AVAILABLE = False
+
+try:
+    import torch
+    import torchaudio
+
+    TORCHAUDIO_AVAILABLE = True
+except Exception:
+    torch = None
+    torchaudio = None
+    TORCHAUDIO_AVAILABLE = False
+
+TARGET_SAMPLE_RATE = 16000
+READ_CHUNK_BYTES = 64 * 1024
+FFMPEG_AVAILABLE = shutil.which("ffmpeg") is not None
+
+
+class DecodeError(RuntimeError):
+    """音訊無法解碼（格式不支援、內容損壞，或沒有可用的解碼器）。"""
+
+
+class TimedChunks:
+    """包住下載串流，累計等待下一塊資料（MinIO 讀取）的秒數；與解碼重疊、花在解碼上的時間不計入。"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        started = time.perf_counter()
+        try:
+            return next(self._chunks)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+def ffmpeg_decode_command(sample_rate: int = TARGET_SAMPLE_RATE) -> List[str]:
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "pipe:1",
+    ]
+
+
+def stream_decode(
+    chunks: Iterable[bytes],
+    sample_rate: int = TARGET_SAMPLE_RATE,
+    command: Optional[Sequence[str]] = None,
+) -> np.ndarray:
+    """
+    把 `chunks`（例如 MinIO 回應的 `stream()`）邊讀邊寫進解碼器 stdin，回傳單聲道 float32 波形。
+    寫入 stdin 與讀取 stderr 在背景執行緒進行，避免管線緩衝區塞滿造成互相等待。
+    """
+    process = subprocess.Popen(
+        list(command or ffmpeg_decode_command(sample_rate)),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stderr_chunks: List[bytes] = []
+    feed_errors: List[BaseException] = []
+
+    def _feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            pass  # 解碼器提早結束，錯誤由返回碼回報
+        except BaseException as e:
+            # 來源讀取失敗（例如連線中斷），停止解碼器並在主執行緒重新拋出
+            feed_errors.append(e)
+            process.kill()
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    def _drain_stderr():
+        stderr_chunks.append(process.stderr.read())
+
+    threads = [
+        threading.Thread(target=_feed, name="stt-decode-feed", daemon=True),
+        threading.Thread(target=_drain_stderr, name="stt-decode-stderr", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        pcm = process.stdout.read()
+    finally:
+        for thread in threads:
+            thread.join()
+        process.stdout.close()
+        process.wait()
+
+    if feed_errors:
+        raise feed_errors[0]
+    if process.returncode != 0:
+        message = b"".join(stderr_chunks).decode("utf-8", errors="replace").strip()
+        raise DecodeError(f"音訊解碼失敗 (exit {process.returncode}): {message[-500:]}")
+    usable = len(pcm) - len(pcm) % 4
+    return np.frombuffer(pcm[:usable], dtype="<f4").copy()
+
+
+@functools.lru_cache(maxsize=16)
+def get_resampler(orig_freq: int, new_freq: int = TARGET_SAMPLE_RATE):
+    """每組取樣率只建立一次 Resample（其 sinc 核心的計算成本不低），之後的請求共用。"""
+    return torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq)
+
+
+def resample(waveform: np.ndarray, orig_freq: int, new_freq: int = TARGET_SAMPLE_RATE) -> np.ndarray:
+    if orig_freq == new_freq:
+        return waveform
+    if not TORCHAUDIO_AVAILABLE:
+        raise DecodeError(f"需要 torchaudio 才能把 {orig_freq}Hz 重新採樣到 {new_freq}Hz")
+    with torch.no_grad():
+        resampled = get_resampler(orig_freq, new_freq)(torch.from_numpy(waveform).unsqueeze(0))
+    return resampled.squeeze(0).numpy()
+
+
+def decode_in_memory(data: bytes, sample_rate: int = TARGET_SAMPLE_RATE) -> np.ndarray:
+    """ffmpeg 不可用時的後備：以 soundfile 從記憶體解碼（支援 wav/flac/ogg 等），轉單聲道並重新採樣。"""
+    if not SOUNDFILE_AVAILABLE:
+        raise DecodeError("沒有可用的音訊解碼器（需要 ffmpeg 或 soundfile）")
+    try:
+        waveform, source_rate = soundfile.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except Exception as e:
+        raise DecodeError(f"soundfile 無法解碼音檔: {e}") from e
+    return resample(np.ascontiguousarray(waveform.mean(axis=1)), source_rate, sample_rate)
@@ -0,0 +1,82 @@
+# 檔名: decode_profiles.py
+# 說明: 依音訊長度選擇 ASR 解碼設定。流量以一兩秒的短句（「好」、「有」）為主，
+#       這些輸入不需要 30 秒分塊與時間戳記生成；只有長錄音才以分塊批次解碼並調整 stride。
+#         short   不分塊、不產生時間戳記
+#         medium  不分塊、產生時間戳記（供 VAD 片段接回原時間軸）
+#         long    以 chunk_length_s 分塊，stride_length_s 為相鄰分塊的重疊，分塊以 batch_size 一起解碼
+#       設定依「送進 ASR 的片段」長度選擇。啟用 VAD（預設）時片段已切成不超過 STT_VAD_MAX_CHUNK_S
+#       （預設 25 秒，小於 ASR_MEDIUM_MAX_S），不需要再分塊，因此 long 只在 VAD 關閉時才會用到。
+
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence
+
+from metrics import ASR_DECODE_SECONDS
+
+
+@dataclass(frozen=True)
+class DecodeProfile:
+    name: str
+    max_duration_s: float  # 不超過此長度的輸入使用這個設定；最後一個設定不設上限
+    pipeline_kwargs: Dict = field(default_factory=dict)
+
+
+def profiles_from_env() -> List[DecodeProfile]:
+    """
+    ASR_SHORT_MAX_S      短句上限秒數（預設 8）
+    ASR_MEDIUM_MAX_S     不分塊的上限秒數（預設 30，即 Whisper 的輸入視窗）
+    ASR_LONG_CHUNK_S     長錄音的分塊長度（預設 30）
+    ASR_LONG_STRIDE_S    分塊左右重疊秒數（預設 5）
+    ASR_LONG_BATCH_SIZE  長錄音的分塊批次大小（預設 8）
+    """
+    short_max = float(os.environ.get("ASR_SHORT_MAX_S", 8))
+    medium_max = float(os.environ.get("ASR_MEDIUM_MAX_S", 30))
+    return [
+        DecodeProfile("short", short_max, {"return_timestamps": False}),
+        DecodeProfile("medium", medium_max, {"return_timestamps": True}),
+        DecodeProfile(
+            "long",
+            float("inf"),
+            {
+                "chunk_length_s": float(os.environ.get("ASR_LONG_CHUNK_S", 30)),
+                "stride_length_s": float(os.environ.get("ASR_LONG_STRIDE_S", 5)),
+                "batch_size": int(os.environ.get("ASR_LONG_BATCH_SIZE", 8)),
+                "return_timestamps": True,
+                "ignore_warning": True,
+            },
+        ),
+    ]
+
+
+def select_profile(duration_s: float, profiles: Sequence[DecodeProfile]) -> DecodeProfile:
+    for profile in profiles:
+        if duration_s <= profile.max_duration_s:
+            return profile
+    return profiles[-1]
+
+
+def group_by_profile(
+    audio_inputs: Sequence, profiles: Sequence[DecodeProfile], sample_rate: int = 16000
+) -> List[tuple]:
+    """依長度把一批輸入分組，回傳 [(profile, [索引, ...]), ...]，組的順序與 `profiles` 相同。"""
+    groups: Dict[str, List[int]] = {}
+    for index, audio in enumerate(audio_inputs):
+        groups.setdefault(select_profile(len(audio) / sample_rate, profiles).name, []).append(index)
+    return [(profile, groups[profile.name]) for profile in profiles if profile.name in groups]
+
+
+def run_profiled(asr_pipe, audio_inputs: Sequence, profiles: Sequence[DecodeProfile], sample_rate: int = 16000) -> List[Dict]:
+    """
+    依長度分組後，每組以各自的設定呼叫一次 pipeline，回傳與輸入同順序的結果。
+    每組的解碼時間記錄在 ai_worker_asr_decode_seconds{profile}。
+    """
+    results: List[Dict] = [None] * len(audio_inputs)
+    for profile, indices in group_by_profile(audio_inputs, profiles, sample_rate):
+        kwargs = {"batch_size": len(indices), **profile.pipeline_kwargs}
+        started = time.perf_counter()
+        outputs = asr_pipe([audio_inputs[i] for i in indices], **kwargs)
+        ASR_DECODE_SECONDS.labels(profile=profile.name).observe(time.perf_counter() - started)
+        for index, output in zip(indices, outputs):
+            results[index] = output
+    return results
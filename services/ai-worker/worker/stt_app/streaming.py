@@ -0,0 +1,196 @@
+# 檔名: streaming.py
+# 說明: 串流 STT。錄音還在進行時就接收 16kHz 音訊片段，累積在滑動視窗中，
+#       一旦偵測到足夠長的停頓，就把停頓之前的音訊轉錄並提交為 partial（寫入 Redis 的語音片段緩衝），
+#       視窗只保留尚未提交的尾端。使用者停止說話時只剩最後一小段需要辨識，
+#       `handle_user_message(is_final=True)` 會把已緩衝的 partial 與這段尾端接成完整逐字稿。
+#       StreamSessions 以 (user_id, audio_id) 保存進行中的串流，供 voice_app 的分段上傳端點使用。
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Callable, ContextManager, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from stt_app.vad import detect_speech
+
+
+class StreamingTranscriber:
+    """
+    `transcribe(waveform) -> str` 辨識一段 16kHz 波形；`sink(text)` 接收每段提交的 partial。
+
+    提交規則：視窗至少 `min_commit_s` 秒，且最後一段語音之後（或兩段語音之間）有不短於
+    `commit_silence_ms` 的靜音，就在該靜音的中點切開並提交前半段。視窗超過 `max_window_s`
+    仍找不到停頓時，在最長的停頓處切開；完全沒有停頓則整段提交。
+    辨識在背景的單一執行緒依序進行，`feed()` 不會阻塞接收音訊的呼叫端，partial 的順序與錄音一致。
+    """
+
+    def __init__(
+        self,
+        transcribe: Callable[[np.ndarray], str],
+        sink: Callable[[str], None],
+        sample_rate: int = 16000,
+        commit_silence_ms: float = 600.0,
+        min_commit_s: float = 2.0,
+        max_window_s: float = 20.0,
+    ):
+        self.transcribe = transcribe
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.commit_silence = int(sample_rate * commit_silence_ms / 1000)
+        self.min_commit = int(sample_rate * min_commit_s)
+        self.max_window = int(sample_rate * max_window_s)
+        self.partials: List[str] = []
+        self._window = np.zeros(0, dtype=np.float32)
+        self._pending: List[Future] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt-stream")
+        self._lock = threading.Lock()
+        self._finished = False
+
+    @property
+    def buffered_seconds(self) -> float:
+        return len(self._window) / self.sample_rate
+
+    def _commit_point(self) -> Optional[int]:
+        window = self._window
+        if len(window) < self.min_commit:
+            return None
+        segments = detect_speech(window, self.sample_rate, pad_ms=100)
+        if not segments:
+            # 只有靜音：超過視窗上限就丟掉，只留一小段尾端銜接下一個片段
+            return len(window) - self.commit_silence if len(window) >= self.max_window else None
+
+        # 每段語音之後的靜音（最後一段以視窗結尾為界），依位置由後往前找夠長的停頓
+        ends = [end for _, end in segments]
+        next_starts = [start for start, _ in segments[1:]] + [len(window)]
+        gaps = list(zip(ends, next_starts))
+        for gap_start, gap_end in reversed(gaps):
+            if gap_end - gap_start >= self.commit_silence:
+                return (gap_start + gap_end) // 2
+        if len(window) < self.max_window:
+            return None
+        inner = gaps[:-1]
+        if inner:
+            gap_start, gap_end = max(inner, key=lambda gap: gap[1] - gap[0])
+            return (gap_start + gap_end) // 2
+        return len(window)
+
+    def _transcribe_and_emit(self, audio: np.ndarray) -> None:
+        text = (self.transcribe(audio) or "").strip()
+        if text:
+            self.partials.append(text)
+            self.sink(text)
+
+    def feed(self, samples: np.ndarray) -> None:
+        """加入新到的音訊；視窗中出現可提交的停頓時，把停頓前的音訊交給背景執行緒辨識。"""
+        with self._lock:
+            if self._finished:
+                raise RuntimeError("串流已結束，不能再加入音訊")
+            self._window = np.concatenate([self._window, np.asarray(samples, dtype=np.float32).reshape(-1)])
+            point = self._commit_point()
+            if point is None or point <= 0:
+                return
+            committed, self._window = self._window[:point], self._window[point:]
+            if detect_speech(committed, self.sample_rate):
+                self._pending.append(self._executor.submit(self._transcribe_and_emit, committed))
+
+    def finish(self) -> str:
+        """
+        錄音結束：等已提交的 partial 辨識完，再辨識視窗中剩下的尾端並回傳其文字（不寫入 sink）。
+        partial 辨識的錯誤會在這裡重新拋出。
+        """
+        with self._lock:
+            self._finished = True
+            tail, self._window = self._window, np.zeros(0, dtype=np.float32)
+        try:
+            for future in self._pending:
+                future.result()
+            return (self.transcribe(tail) or "").strip() if len(tail) else ""
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def close(self) -> None:
+        """放棄串流：不再辨識視窗中的音訊，尚未開始的 partial 辨識也取消。"""
+        with self._lock:
+            self._finished = True
+            self._window = np.zeros(0, dtype=np.float32)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def pcm16_to_float(data: bytes) -> np.ndarray:
+    """little-endian 16-bit PCM 轉成 [-1, 1) 的 float32 波形。"""
+    usable = len(data) - len(data) % 2
+    return np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+
+@dataclass
+class _Session:
+    transcriber: StreamingTranscriber
+    resources: ExitStack
+    last_seen: float
+
+
+class StreamSessions:
+    """
+    進行中的串流轉錄，以 (user_id, audio_id) 為鍵。第一次 `feed()` 時以 `open_service()` 取得
+    STT 服務（回傳 context manager，例如 model_registry.use("stt")），整段串流期間持有，
+    `finish()` 或閒置超過 `idle_timeout_s` 秒被回收時才釋放。
+    """
+
+    def __init__(
+        self,
+        open_service: Callable[[], ContextManager],
+        idle_timeout_s: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.open_service = open_service
+        self.idle_timeout_s = idle_timeout_s
+        self.clock = clock
+        self._sessions: Dict[Tuple[str, str], _Session] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def feed(self, user_id: str, audio_id: str, samples: np.ndarray) -> StreamingTranscriber:
+        self.expire_idle()
+        key = (user_id, audio_id)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                resources = ExitStack()
+                try:
+                    service = resources.enter_context(self.open_service())
+                    transcriber = service.open_stream(user_id, audio_id)
+                except BaseException:
+                    resources.close()
+                    raise
+                session = self._sessions[key] = _Session(transcriber, resources, self.clock())
+            session.last_seen = self.clock()
+        session.transcriber.feed(samples)
+        return session.transcriber
+
+    def finish(self, user_id: str, audio_id: str) -> str:
+        """結束串流並回傳尾端文字；沒有對應的串流（從未送出音訊或已逾時）時拋出 KeyError。"""
+        with self._lock:
+            session = self._sessions.pop((user_id, audio_id))
+        try:
+            return session.transcriber.finish()
+        finally:
+            session.resources.close()
+
+    def expire_idle(self) -> int:
+        """回收閒置過久的串流（用戶端斷線），回傳回收的數量。"""
+        now = self.clock()
+        with self._lock:
+            expired = [
+                key for key, session in self._sessions.items()
+                if now - session.last_seen > self.idle_timeout_s
+            ]
+            sessions = [self._sessions.pop(key) for key in expired]
+        for session in sessions:
+            session.transcriber.close()
+            session.resources.close()
+        return len(sessions)
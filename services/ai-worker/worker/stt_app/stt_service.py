@@ -1,35 +1,62 @@
-import io
 import logging
 import os
-import tempfile
+import time
 from typing import Optional
 
 import torch
 from minio import Minio
 from minio.error import S3Error
 
+from batching import MicroBatcher
+from metrics import STT_AUDIO_SECONDS, STT_CACHE_REQUESTS, observe_stage, track_stage
+from stt_app.audio_decode import (
+    FFMPEG_AVAILABLE,
+    READ_CHUNK_BYTES,
+    TARGET_SAMPLE_RATE,
+    TimedChunks,
+    decode_in_memory,
+    stream_decode,
+)
+from stt_app.cpu_backend import configure_cpu_threads_from_env, cpu_backend_from_env, prepare_cpu_model
+from stt_app.decode_profiles import profiles_from_env, run_profiled
+from stt_app.streaming import StreamingTranscriber
+from stt_app.transcript_cache import HashingStream, build_transcript_cache, etag_content_hash
+from stt_app.vad import detect_speech, plan_chunks, stitch_results
+
 # 可選匯入：若環境未安裝則保留為佔位 STT
 try:
-    import torchaudio
     from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor
     from transformers import pipeline as hf_pipeline
 
     TORCH_AVAILABLE = True
-    TORCHAUDIO_AVAILABLE = True
 except Exception:
     torch = None
-    torchaudio = None
     AutoModelForSpeechSeq2Seq = None
     AutoProcessor = None
     hf_pipeline = None
     TORCH_AVAILABLE = False
-    TORCHAUDIO_AVAILABLE = False
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def build_asr_pipeline(model, processor, device: str, torch_dtype):
+    """
+    以已載入的模型建立 ASR pipeline（STTService 與 benchmarks/asr_cpu_bench.py 共用同一組參數）。
+    分塊、時間戳記與批次大小依輸入長度在每次呼叫時決定，見 decode_profiles.py。
+    """
+    return hf_pipeline(
+        "automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+        max_new_tokens=128,
+        torch_dtype=torch_dtype,
+        device=device,
+    )
+
+
 class STTService:
     def __init__(self):
         self.minio_client = Minio(
@@ -45,11 +72,22 @@ class STTService:
         )
         self.device: Optional[str] = None
         self.torch_dtype = None
+        self.cpu_backend: Optional[str] = None
         self.asr_pipe = None
         self.model = None
         self.processor = None
+        self.asr_batcher: Optional[MicroBatcher] = None
+        self.decode_profiles = profiles_from_env()
+
+        # 語音活動偵測：裁掉靜音，並在停頓處把長錄音切成不超過 STT_VAD_MAX_CHUNK_S 的片段
+        self.vad_enabled = os.environ.get("STT_VAD_ENABLED", "true").lower() == "true"
+        self.vad_max_chunk_s = float(os.environ.get("STT_VAD_MAX_CHUNK_S", 25))
 
         self._maybe_load_asr()
+        self._maybe_start_batcher()
+
+        # 轉錄快取：相同內容（MD5）的音檔直接回傳先前的轉錄；佔位 STT 不需要快取，須在載入模型之後建立
+        self.transcript_cache = build_transcript_cache(self.asr_model_name) if self.asr_pipe is not None else None
 
     def _maybe_load_asr(self) -> None:
         """載入 Hugging Face ASR 模型，支援 GPU 加速"""
@@ -76,26 +114,102 @@ class STTService:
                 use_safetensors=True,
             )
             self.model.to(self.device)
+            if self.device == "cpu":
+                # 沒有 GPU 時依 ASR_CPU_BACKEND 轉換模型（int8 動態量化），並設定執行緒數
+                threads = configure_cpu_threads_from_env()
+                self.cpu_backend = cpu_backend_from_env()
+                self.model = prepare_cpu_model(self.model, self.cpu_backend)
+                logger.info(f"ASR CPU 後端: {self.cpu_backend}, 執行緒數: {threads}")
             self.processor = AutoProcessor.from_pretrained(self.asr_model_name)
 
             # 建立 pipeline
-            self.asr_pipe = hf_pipeline(
-                "automatic-speech-recognition",
-                model=self.model,
-                tokenizer=self.processor.tokenizer,
-                feature_extractor=self.processor.feature_extractor,
-                max_new_tokens=128,
-                chunk_length_s=30,
-                batch_size=4,
-                return_timestamps=True,
-                torch_dtype=self.torch_dtype,
-                device=self.device,
-            )
+            self.asr_pipe = build_asr_pipeline(self.model, self.processor, self.device, self.torch_dtype)
             logger.info("ASR 模型載入成功！")
         except Exception as exc:
             logger.error(f"ASR 模型載入失敗，改用佔位 STT：{exc}")
             self.asr_pipe = None
 
+    def _maybe_start_batcher(self) -> None:
+        """
+        併發的轉錄請求在 ASR_BATCH_WINDOW_MS 內合併成一批（最多 ASR_BATCH_MAX_SIZE 筆）送進模型。
+        ASR_BATCH_WINDOW_MS=0 時停用，每筆請求各自呼叫 pipeline。
+        """
+        window_ms = float(os.environ.get("ASR_BATCH_WINDOW_MS", 15))
+        if self.asr_pipe is None or window_ms <= 0:
+            return
+        self.asr_batcher = MicroBatcher(
+            self._recognize_batch,
+            max_batch_size=int(os.environ.get("ASR_BATCH_MAX_SIZE", 4)),
+            max_wait_ms=window_ms,
+            name="asr",
+        )
+        logger.info(
+            f"ASR 微批次已啟用: 最多 {self.asr_batcher.max_batch_size} 筆, 等待 {window_ms:g}ms"
+        )
+
+    def _recognize_batch(self, audio_inputs: list) -> list:
+        """
+        一次辨識多段 16kHz 波形：依長度分成 short / medium / long 各自的解碼設定，
+        同一組內由特徵擷取器把不同長度的輸入補齊成同一批。
+        """
+        return run_profiled(self.asr_pipe, audio_inputs, self.decode_profiles, TARGET_SAMPLE_RATE)
+
+    def _recognize_many(self, audio_inputs: list) -> list:
+        if self.asr_batcher is not None:
+            # 同一段錄音的片段一起送進批次器，與其他請求的片段合併辨識
+            futures = [self.asr_batcher.submit(audio) for audio in audio_inputs]
+            return [future.result() for future in futures]
+        return self._recognize_batch(audio_inputs)
+
+    def _speech_chunks(self, audio_input) -> list:
+        if not self.vad_enabled:
+            return [(0, len(audio_input))]
+        segments = detect_speech(audio_input, TARGET_SAMPLE_RATE)
+        return plan_chunks(segments, TARGET_SAMPLE_RATE, max_chunk_s=self.vad_max_chunk_s)
+
+    def transcribe_waveform(self, audio_input) -> dict:
+        """
+        辨識 16kHz 單聲道波形，回傳 {"text", "chunks"}；chunks 的時間戳記以原錄音為準。
+        啟用 VAD 時只有語音片段會送進 ASR，整段皆為靜音時直接回傳空文字。
+        """
+        chunks = self._speech_chunks(audio_input)
+        STT_AUDIO_SECONDS.labels(kind="decoded").inc(len(audio_input) / TARGET_SAMPLE_RATE)
+        STT_AUDIO_SECONDS.labels(kind="speech").inc(
+            sum(end - start for start, end in chunks) / TARGET_SAMPLE_RATE
+        )
+        if not chunks:
+            return {"text": "", "chunks": []}
+        results = self._recognize_many([audio_input[start:end] for start, end in chunks])
+        return stitch_results(chunks, results, TARGET_SAMPLE_RATE)
+
+    def open_stream(self, user_id: str, audio_id: str, sink=None) -> StreamingTranscriber:
+        """
+        開始一段串流轉錄：以 `feed()` 送入錄音中的 16kHz 單聲道片段，遇到停頓就辨識並把 partial
+        寫入 `audio:{user_id}:{audio_id}:buf`（與 handle_user_message(is_final=False) 相同的緩衝）。
+        錄音結束時 `finish()` 回傳尾端文字，交給 handle_user_message(is_final=True) 與 partial 合併。
+        """
+        if self.asr_pipe is None:
+            raise RuntimeError("ASR 模型不可用，無法進行串流轉錄")
+        if sink is None:
+            from llm_app.toolkits.redis_store import append_audio_segment  # 延遲載入，STT 不需要先載入 LLM 模組
+
+            def sink(text: str) -> None:
+                append_audio_segment(user_id, audio_id, text)
+
+        return StreamingTranscriber(
+            lambda audio: self.transcribe_waveform(audio)["text"],
+            sink,
+            sample_rate=TARGET_SAMPLE_RATE,
+            commit_silence_ms=float(os.environ.get("STT_STREAM_COMMIT_SILENCE_MS", 600)),
+            max_window_s=float(os.environ.get("STT_STREAM_MAX_WINDOW_S", 20)),
+        )
+
+    def close(self) -> None:
+        """停止批次執行緒；模型卸載時由 model_registry 呼叫。"""
+        if self.asr_batcher is not None:
+            self.asr_batcher.close()
+            self.asr_batcher = None
+
     def list_audio_files(self, bucket_name: str) -> list:
         """列出指定 bucket 中的所有音檔"""
         try:
@@ -123,13 +237,12 @@ class STTService:
     def get_file_hash(self, bucket_name: str, object_name: str) -> str:
         """獲取檔案的 MD5 雜湊值"""
         try:
-            import hashlib
-
             obj = self.minio_client.get_object(bucket_name, object_name)
             try:
-                audio_bytes = obj.read()
-                md5_hash = hashlib.md5(audio_bytes).hexdigest()
-                return md5_hash
+                stream = HashingStream(obj.stream(READ_CHUNK_BYTES))
+                for _ in stream:
+                    pass
+                return stream.hexdigest()
             finally:
                 obj.close()
                 obj.release_conn()
@@ -137,119 +250,83 @@ class STTService:
             logger.error(f"計算檔案雜湊值時發生錯誤: {e}")
             return "error"
 
-    def _load_audio_robust(self, audio_bytes: bytes, filename: str = "audio"):
+    def _fetch_and_decode(self, bucket_name: str, object_name: str):
         """
-        強化的音檔載入方法，支援多種格式
+        從 MinIO 串流讀取物件並解碼成 16kHz 單聲道 float32 波形，回傳 (波形, 內容 MD5)。
+        有 ffmpeg 時邊下載邊解碼；否則讀入記憶體後以 soundfile 解碼。兩者都不寫暫存檔，
+        MD5 在同一次下載中一併計算。
+        開啟物件與等待每塊資料的時間另外記錄為 minio_download 階段（包含在 audio_decode 之內）。
         """
-        # 方法1: 直接使用 torchaudio
-        if TORCHAUDIO_AVAILABLE:
-            try:
-                waveform, sample_rate = torchaudio.load(io.BytesIO(audio_bytes))
-                logger.info("✅ 使用 torchaudio 直接載入成功")
-                return waveform, sample_rate
-            except Exception as e:
-                logger.debug(f"torchaudio 直接載入失敗: {str(e)}")
-
-        # 方法2: 儲存為臨時檔案後載入
-        if TORCHAUDIO_AVAILABLE:
-            try:
-                # 根據檔名判斷副檔名
-                if filename.lower().endswith((".m4a", ".mp3", ".wav")):
-                    suffix = os.path.splitext(filename)[1]
-                else:
-                    suffix = ".m4a"
-
-                with tempfile.NamedTemporaryFile(
-                    suffix=suffix, delete=False
-                ) as temp_file:
-                    temp_file.write(audio_bytes)
-                    temp_path = temp_file.name
-
-                try:
-                    waveform, sample_rate = torchaudio.load(temp_path)
-                    logger.info(f"✅ 使用臨時檔案載入成功: {suffix}")
-                    return waveform, sample_rate
-                finally:
-                    try:
-                        os.unlink(temp_path)
-                    except:
-                        pass
-
-            except Exception as e:
-                logger.debug(f"臨時檔案載入失敗: {str(e)}")
-
-        # 如果都失敗，拋出異常
-        raise Exception(
-            f"無法載入音檔，已嘗試所有可用方法。檔案大小: {len(audio_bytes)} bytes"
-        )
+        started = time.perf_counter()
+        status = "ok"
+        chunks = None
+        try:
+            obj = self.minio_client.get_object(bucket_name, object_name)
+        except BaseException:
+            observe_stage("minio_download", time.perf_counter() - started, status="error")
+            raise
+        open_s = time.perf_counter() - started
+        try:
+            chunks = TimedChunks(obj.stream(READ_CHUNK_BYTES))
+            stream = HashingStream(chunks)
+            if FFMPEG_AVAILABLE:
+                audio_input = stream_decode(stream, TARGET_SAMPLE_RATE)
+            else:
+                audio_input = decode_in_memory(b"".join(stream), TARGET_SAMPLE_RATE)
+            return audio_input, stream.hexdigest()
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            obj.close()
+            obj.release_conn()
+            observe_stage("minio_download", open_s + (chunks.seconds if chunks else 0.0), status=status)
 
-    def transcribe_audio(self, bucket_name: str, object_name: str) -> str:
+    def transcribe_audio(self, bucket_name: str, object_name: str, bypass_cache: bool = False) -> str:
         """
-        從 MinIO 下載音檔並進行轉錄，支援 GPU 加速
+        從 MinIO 串流下載並解碼音檔後進行轉錄，支援 GPU 加速。
+        下載+解碼與辨識分別記錄在 audio_decode / stt_inference 兩個階段，
+        其中等待 MinIO 的時間另外記錄為 minio_download。
+
+        轉錄快取以內容 MD5 為鍵：單次上傳的物件以 ETag 在下載前查詢；
+        multipart 物件則在下載時算出 MD5，於 ASR 之前查詢。`bypass_cache=True` 時略過快取。
         """
         try:
-            logger.info(f"從 MinIO 下載檔案: {bucket_name}/{object_name}")
-
-            # 下載完整物件至記憶體
-            obj = self.minio_client.get_object(bucket_name, object_name)
-            try:
-                audio_bytes = obj.read()
-            finally:
-                obj.close()
-                obj.release_conn()
-
             # 若沒有可用的 ASR，回傳佔位文字
             if self.asr_pipe is None:
                 transcribed_text = f"transcribed_{object_name}"
                 logger.info(f"ASR 依賴不可用，回傳佔位轉錄: {transcribed_text}")
                 return transcribed_text
 
-            transcript_text: Optional[str] = None
-
-            # 嘗試以 torchaudio 從 bytes 直接解碼
-            if TORCHAUDIO_AVAILABLE:
-                try:
-                    waveform, sample_rate = self._load_audio_robust(
-                        audio_bytes, object_name
-                    )
-
-                    # 轉單聲道
-                    if waveform.dim() > 1 and waveform.size(0) > 1:
-                        waveform = waveform.mean(dim=0, keepdim=True)
-
-                    # 重新採樣到 16kHz (如果需要)
-                    target_sample_rate = 16000
-                    if sample_rate != target_sample_rate and TORCHAUDIO_AVAILABLE:
-                        resampler = torchaudio.transforms.Resample(
-                            orig_freq=sample_rate, new_freq=target_sample_rate
-                        )
-                        waveform = resampler(waveform)
-
-                    audio_input = waveform.squeeze().numpy()
-                    result = self.asr_pipe(audio_input)
-                    transcript_text = (result.get("text", "") or "").strip()
-                    logger.info("✅ 使用 torchaudio 進行辨識成功")
-                except Exception as e:
-                    logger.warning(f"torchaudio 載入失敗，改用暫存檔推論：{e}")
-
-            # 若 torchaudio 不可用或失敗，將 bytes 寫入暫存檔供 pipeline 使用
-            if transcript_text is None:
-                suffix = os.path.splitext(object_name)[1] or ".m4a"
-                with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-                    tmp.write(audio_bytes)
-                    tmp_path = tmp.name
-                try:
-                    result = self.asr_pipe(tmp_path)
-                    transcript_text = (result.get("text", "") or "").strip()
-                    logger.info("✅ 使用暫存檔進行辨識成功")
-                finally:
-                    try:
-                        os.unlink(tmp_path)
-                    except Exception:
-                        pass
-
-            transcript_text = transcript_text or ""
+            cache = self.transcript_cache
+            if cache is not None and bypass_cache:
+                STT_CACHE_REQUESTS.labels(result="bypass").inc()
+                cache = None
+
+            etag_hash = None
+            if cache is not None:
+                etag_hash = etag_content_hash(self.minio_client.stat_object(bucket_name, object_name).etag)
+                cached = cache.lookup(etag_hash)
+                if cached is not None:
+                    logger.info(f"轉錄快取命中 ({etag_hash}): {cached[:80]}...")
+                    return cached
+
+            logger.info(f"從 MinIO 串流解碼檔案: {bucket_name}/{object_name}")
+            with track_stage("audio_decode"):
+                audio_input, content_hash = self._fetch_and_decode(bucket_name, object_name)
+            logger.info(f"音檔解碼完成: {len(audio_input) / TARGET_SAMPLE_RATE:.2f}s")
+
+            if cache is not None and etag_hash is None:
+                cached = cache.lookup(content_hash)
+                if cached is not None:
+                    logger.info(f"轉錄快取命中 ({content_hash}): {cached[:80]}...")
+                    return cached
+
+            with track_stage("stt_inference"):
+                transcript_text = self.transcribe_waveform(audio_input)["text"]
             logger.info(f"ASR 轉錄完成: {transcript_text[:80]}...")
+            if cache is not None:
+                cache.store(content_hash, transcript_text)
             return transcript_text
 
         except S3Error as exc:
@@ -260,12 +337,11 @@ class STTService:
             raise
 
 
-_stt_service_instance = STTService()
-
-
 def get_stt_service() -> STTService:
-    """Factory function to get the STTService instance."""
-    return _stt_service_instance
+    """Factory function to get the process-wide STTService (loaded once via the model registry)."""
+    from model_registry import get_model_registry
+
+    return get_model_registry().get("stt")
 
 
 if __name__ == "__main__":
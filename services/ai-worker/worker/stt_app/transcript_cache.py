@@ -0,0 +1,104 @@
+# 檔名: transcript_cache.py
+# 說明: 以音檔內容雜湊為鍵的轉錄快取。LINE 重送與使用者轉傳同一則語音時，位元組完全相同，
+#       直接回傳先前的轉錄，不再跑解碼與 ASR。快取存在 Redis 並設定 TTL：
+#         {prefix}:{model}:{md5}   轉錄文字
+#       內容雜湊在下載串流時一邊計算（HashingStream），不需要第二次讀取物件。
+#       快取是盡力而為：Redis 錯誤一律視為未命中，不影響轉錄。
+
+import hashlib
+import logging
+import os
+import re
+from typing import Iterable, Iterator, Optional
+
+from metrics import STT_CACHE_REQUESTS
+
+# 可選匯入：未安裝 redis 時停用快取
+try:
+    import redis
+
+    REDIS_AVAILABLE = True
+except Exception:
+    redis = None
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_MD5_HEX = re.compile(r"^[0-9a-f]{32}$")
+
+
+def etag_content_hash(etag: Optional[str]) -> Optional[str]:
+    """
+    單次上傳（非 multipart）物件的 ETag 即為內容 MD5，可在下載前查快取；
+    multipart 的 ETag 形如 "<md5>-<parts>"，不是內容雜湊，回傳 None。
+    """
+    value = (etag or "").strip('"').lower()
+    return value if _MD5_HEX.match(value) else None
+
+
+class HashingStream:
+    """包住下載串流的 chunk 迭代器，邊傳遞邊更新 MD5；讀完後 `hexdigest()` 即為內容雜湊。"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = chunks
+        self._md5 = hashlib.md5()
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._chunks:
+            self._md5.update(chunk)
+            yield chunk
+
+    def hexdigest(self) -> str:
+        return self._md5.hexdigest()
+
+
+class TranscriptCache:
+    """
+    `redis_client` 需以 decode_responses=True 建立。鍵包含 ASR 模型名稱，換模型後舊轉錄自然失效。
+    空字串（整段靜音）也會被快取，重送同一段靜音不必再解碼。
+    """
+
+    def __init__(self, redis_client, model_name: str, ttl_s: int = 7 * 24 * 3600, key_prefix: str = "stt:transcript"):
+        self.redis = redis_client
+        self.ttl_s = ttl_s
+        self.key_prefix = f"{key_prefix}:{hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:12]}"
+
+    def _key(self, content_hash: str) -> str:
+        return f"{self.key_prefix}:{content_hash}"
+
+    def lookup(self, content_hash: Optional[str]) -> Optional[str]:
+        if not content_hash:
+            return None
+        try:
+            transcript = self.redis.get(self._key(content_hash))
+        except Exception as e:
+            logger.warning(f"轉錄快取查詢失敗，視為未命中: {e}")
+            STT_CACHE_REQUESTS.labels(result="error").inc()
+            return None
+        STT_CACHE_REQUESTS.labels(result="hit" if transcript is not None else "miss").inc()
+        return transcript
+
+    def store(self, content_hash: str, transcript: str) -> None:
+        try:
+            self.redis.set(self._key(content_hash), transcript, ex=self.ttl_s)
+        except Exception as e:
+            logger.warning(f"轉錄快取寫入失敗: {e}")
+
+
+def build_transcript_cache(model_name: str) -> Optional[TranscriptCache]:
+    """
+    依環境變數建立快取，停用或缺少 redis 套件時回傳 None：
+      STT_TRANSCRIPT_CACHE_ENABLED  預設 true；設為 false 時完全繞過快取
+      STT_TRANSCRIPT_CACHE_TTL_S    轉錄保留秒數（預設 7 天）
+    """
+    if os.environ.get("STT_TRANSCRIPT_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    if not REDIS_AVAILABLE:
+        logger.warning("未安裝 redis 套件，停用轉錄快取")
+        return None
+    client = redis.Redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+    return TranscriptCache(
+        client,
+        model_name,
+        ttl_s=int(os.environ.get("STT_TRANSCRIPT_CACHE_TTL_S", 7 * 24 * 3600)),
+    )
@@ -0,0 +1,124 @@
+# 檔名: vad.py
+# 說明: 以 CPU 做的語音活動偵測（短時能量 + 自適應門檻）。
+#       去掉錄音前後與中間過長的靜音，再在停頓處把長錄音切成不超過 ASR 視窗的片段，
+#       各片段一起以批次辨識後，依片段的起點把時間戳記接回原錄音的時間軸。
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Segment = Tuple[int, int]  # [start, end) 樣本索引
+
+
+def _frame_energy_db(waveform: np.ndarray, frame: int) -> np.ndarray:
+    num_frames = len(waveform) // frame
+    frames = waveform[: num_frames * frame].reshape(num_frames, frame).astype(np.float64)
+    return 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+
+
+def detect_speech(
+    waveform: np.ndarray,
+    sample_rate: int = 16000,
+    frame_ms: float = 30.0,
+    margin_db: float = 12.0,
+    floor_db: float = -60.0,
+    dynamic_range_db: float = 30.0,
+    min_speech_ms: float = 200.0,
+    min_silence_ms: float = 500.0,
+    pad_ms: float = 200.0,
+) -> List[Segment]:
+    """
+    回傳語音區段（樣本索引）。門檻為背景雜訊（能量第 10 百分位）加上 `margin_db`，
+    但不高於峰值減 `dynamic_range_db`（幾乎沒有停頓的錄音不會被整段判為靜音），也不低於 `floor_db`。
+    間隔短於 `min_silence_ms` 的區段合併，短於 `min_speech_ms` 的區段丟棄，最後前後各保留 `pad_ms`。
+    """
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    if len(waveform) < frame:
+        return []
+    energy = _frame_energy_db(waveform, frame)
+    noise = np.percentile(energy, 10)
+    threshold = max(min(noise + margin_db, energy.max() - dynamic_range_db), floor_db)
+    active = energy > threshold
+
+    # 找出連續的有聲 frame 區段
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], active.astype(np.int8), [0]])))
+    runs = list(zip(edges[::2], edges[1::2]))
+    if not runs:
+        return []
+
+    min_gap = int(min_silence_ms / frame_ms)
+    merged = [list(runs[0])]
+    for start, end in runs[1:]:
+        if start - merged[-1][1] < min_gap:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    min_frames = max(1, int(min_speech_ms / frame_ms))
+    pad = int(sample_rate * pad_ms / 1000)
+    segments: List[Segment] = []
+    for start, end in merged:
+        if end - start < min_frames:
+            continue
+        begin = max(0, start * frame - pad)
+        finish = min(len(waveform), end * frame + pad)
+        if segments and begin <= segments[-1][1]:
+            segments[-1] = (segments[-1][0], finish)
+        else:
+            segments.append((begin, finish))
+    return segments
+
+
+def plan_chunks(
+    segments: Sequence[Segment],
+    sample_rate: int = 16000,
+    max_chunk_s: float = 25.0,
+    max_gap_s: float = 1.0,
+) -> List[Segment]:
+    """
+    把相鄰語音區段組成不超過 `max_chunk_s` 的辨識片段。間隔不超過 `max_gap_s` 的區段併入同一片段
+    （保留自然停頓，減少片段數），更長的靜音則成為切點而不送進 ASR；單一區段過長時直接等長切開。
+    """
+    limit = int(max_chunk_s * sample_rate)
+    max_gap = int(max_gap_s * sample_rate)
+    chunks: List[Segment] = []
+    for start, end in segments:
+        if chunks and start - chunks[-1][1] <= max_gap and end - chunks[-1][0] <= limit:
+            chunks[-1] = (chunks[-1][0], end)
+            continue
+        while end - start > limit:
+            chunks.append((start, start + limit))
+            start += limit
+        chunks.append((start, end))
+    return chunks
+
+
+def _join(left: str, right: str) -> str:
+    if not left or not right:
+        return left or right
+    # 英數字之間補空白，中文直接相接
+    if left[-1].isascii() and left[-1].isalnum() and right[0].isascii() and right[0].isalnum():
+        return f"{left} {right}"
+    return left + right
+
+
+def stitch_results(chunks: Sequence[Segment], results: Sequence[Dict], sample_rate: int = 16000) -> Dict:
+    """
+    合併各片段的 ASR pipeline 輸出：文字依序相接，`chunks` 內的時間戳記加上片段起點，
+    回傳與 pipeline 相同形式的 {"text", "chunks"}，時間以原錄音為準。
+    """
+    text = ""
+    stitched: List[Dict] = []
+    for (start, _), result in zip(chunks, results):
+        offset = start / sample_rate
+        text = _join(text, (result.get("text", "") or "").strip())
+        for item in result.get("chunks") or []:
+            begin, finish = item.get("timestamp") or (None, None)
+            stitched.append(
+                {"text": item.get("text", ""), "timestamp": (_shift(begin, offset), _shift(finish, offset))}
+            )
+    return {"text": text, "chunks": stitched}
+
+
+def _shift(value: Optional[float], offset: float) -> Optional[float]:
+    return None if value is None else round(value + offset, 3)
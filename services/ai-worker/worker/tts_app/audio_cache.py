@@ -0,0 +1,232 @@
+# 檔名: audio_cache.py
+# 說明: 以內容定址的 TTS 音訊快取。相同的（正規化文字, 聲音, 語速, 模型, 取樣率, 編碼設定）
+#       對應到同一個 MinIO 物件，命中時直接回傳物件名稱與長度，不經過模型。索引存在 Redis：
+#         {prefix}:entry:{key}   hash: object_name / duration_ms / size_bytes / created_at
+#         {prefix}:lru           sorted set: key -> 最後使用時間，用於淘汰
+#         {prefix}:bytes         目前快取物件的總大小
+#         {prefix}:stats         hash: hits / misses / evictions（跨行程累計）
+#       淘汰只移除 Redis 索引，不刪除 MinIO 物件：物件的 URL 可能已經發送給使用者，
+#       物件由 bucket 的 lifecycle 規則（tts-cache/ 前綴，TTS_CACHE_OBJECT_EXPIRY_DAYS）到期刪除，
+#       索引項目的有效期短於物件，命中的物件一定還在。
+#       快取是盡力而為：Redis 錯誤一律視為未命中，不影響合成。
+
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from typing import Optional, Tuple
+
+from metrics import TTS_CACHE_BYTES, TTS_CACHE_EVICTIONS, TTS_CACHE_REQUESTS
+
+# 可選匯入：未安裝 redis 時停用快取
+try:
+    import redis
+
+    REDIS_AVAILABLE = True
+except Exception:
+    redis = None
+    REDIS_AVAILABLE = False
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """NFKC 正規化並合併空白，讓全形/半形與多餘空白不影響快取鍵。"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def cache_key(
+    text: str,
+    voice: str,
+    speed_rate: float,
+    model_id: str = "",
+    sample_rate: int = 0,
+    encoding: str = "",
+) -> str:
+    """換模型、取樣率或編碼設定（例如 ffmpeg 指令）時鍵會改變，不會回傳舊格式的音訊。"""
+    material = "\x1f".join(
+        [voice, f"{speed_rate:.3f}", model_id, str(sample_rate), encoding, normalize_text(text)]
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class TTSAudioCache:
+    """
+    `redis_client` 需以 decode_responses=True 建立。
+    `lookup()` 命中時更新最後使用時間；`store()` 寫入索引後，若總大小超過 `max_bytes`，
+    從最久未使用的項目開始把索引移除（MinIO 物件保留，由 lifecycle 規則到期刪除）。
+    `entry_ttl_s` 為索引項目自寫入起的有效秒數，需短於物件的 lifecycle 期限；None 表示不過期。
+    只有不超過 `max_text_chars` 字的文字會被快取（固定問候語、拒答等短句）。
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_text_chars: int = 200,
+        entry_ttl_s: Optional[float] = None,
+        key_prefix: str = "tts:cache",
+        object_prefix: str = "tts-cache/",
+    ):
+        self.redis = redis_client
+        self.max_bytes = max_bytes
+        self.entry_ttl_s = entry_ttl_s
+        self.max_text_chars = max_text_chars
+        self.key_prefix = key_prefix
+        self.object_prefix = object_prefix
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.key_prefix}:entry:{key}"
+
+    @property
+    def _lru_key(self) -> str:
+        return f"{self.key_prefix}:lru"
+
+    @property
+    def _bytes_key(self) -> str:
+        return f"{self.key_prefix}:bytes"
+
+    @property
+    def _stats_key(self) -> str:
+        return f"{self.key_prefix}:stats"
+
+    def cacheable(self, text: str) -> bool:
+        return 0 < len(normalize_text(text)) <= self.max_text_chars
+
+    def object_name(self, key: str) -> str:
+        return f"{self.object_prefix}{key}.m4a"
+
+    def lookup(self, key: str) -> Optional[Tuple[str, int]]:
+        """回傳 (object_name, duration_ms)，未命中時回傳 None。"""
+        try:
+            entry = self.redis.hgetall(self._entry_key(key))
+            # 另一個行程剛 hsetnx、尚未寫完其餘欄位時也視為未命中
+            hit = "duration_ms" in entry
+            if hit and self._expired(entry):
+                # 物件快要被 lifecycle 規則刪除：移除索引，重新合成後會覆寫同名物件並重新計時
+                self._drop(key)
+                hit = False
+            pipe = self.redis.pipeline(transaction=False)
+            if hit:
+                pipe.zadd(self._lru_key, {key: time.time()})
+            pipe.hincrby(self._stats_key, "hits" if hit else "misses", 1)
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [TTS Cache] 查詢失敗，視為未命中: {e}", flush=True)
+            TTS_CACHE_REQUESTS.labels(result="error").inc()
+            return None
+        TTS_CACHE_REQUESTS.labels(result="hit" if hit else "miss").inc()
+        if not hit:
+            return None
+        return entry["object_name"], int(entry["duration_ms"])
+
+    def store(self, key: str, object_name: str, duration_ms: int, size_bytes: int) -> None:
+        """登記已上傳的快取物件，必要時淘汰舊項目。"""
+        try:
+            # 同一鍵併發合成時只登記一次，避免重複累計大小
+            if not self.redis.hsetnx(self._entry_key(key), "object_name", object_name):
+                return
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.hset(
+                self._entry_key(key),
+                mapping={"duration_ms": duration_ms, "size_bytes": size_bytes, "created_at": time.time()},
+            )
+            pipe.zadd(self._lru_key, {key: time.time()})
+            pipe.incrby(self._bytes_key, size_bytes)
+            total = pipe.execute()[-1]
+            if total > self.max_bytes:
+                total = self._evict(total)
+            TTS_CACHE_BYTES.set(total)
+        except Exception as e:
+            print(f"⚠️ [TTS Cache] 寫入索引失敗: {e}", flush=True)
+
+    def _expired(self, entry: dict) -> bool:
+        if self.entry_ttl_s is None or "created_at" not in entry:
+            return False
+        return time.time() - float(entry["created_at"]) >= self.entry_ttl_s
+
+    def _drop(self, key: str) -> Optional[int]:
+        """移除一個索引項目並扣除其大小，回傳新的總大小；項目已不存在時回傳 None。"""
+        entry = self.redis.hgetall(self._entry_key(key))
+        if not entry:
+            self.redis.zrem(self._lru_key, key)
+            return None
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(self._entry_key(key))
+        pipe.zrem(self._lru_key, key)
+        pipe.decrby(self._bytes_key, int(entry.get("size_bytes", 0)))
+        return pipe.execute()[-1]
+
+    def _evict(self, total: int) -> int:
+        # 只移除索引：已發送給使用者的 URL 仍然有效，物件由 lifecycle 規則到期刪除
+        while total > self.max_bytes:
+            oldest = self.redis.zrange(self._lru_key, 0, 0)
+            if not oldest:
+                break
+            remaining = self._drop(oldest[0])
+            if remaining is None:
+                continue
+            total = remaining
+            self.redis.hincrby(self._stats_key, "evictions", 1)
+            TTS_CACHE_EVICTIONS.inc()
+        return total
+
+    def stats(self) -> dict:
+        raw = {k: int(v) for k, v in self.redis.hgetall(self._stats_key).items()}
+        hits, misses = raw.get("hits", 0), raw.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": raw.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": self.redis.zcard(self._lru_key),
+            "bytes": int(self.redis.get(self._bytes_key) or 0),
+            "max_bytes": self.max_bytes,
+        }
+
+
+def ensure_object_expiry(minio_client, bucket_name: str, prefix: str, days: int) -> None:
+    """在 bucket 的 lifecycle 設定中加入（或更新）快取物件的到期規則，保留其他規則。"""
+    from minio.commonconfig import ENABLED, Filter
+    from minio.lifecycleconfig import Expiration, LifecycleConfig, Rule
+
+    rule_id = "tts-cache-expiry"
+    config = minio_client.get_bucket_lifecycle(bucket_name)
+    rules = [rule for rule in (config.rules if config else []) if rule.rule_id != rule_id]
+    rules.append(
+        Rule(ENABLED, rule_filter=Filter(prefix=prefix), rule_id=rule_id, expiration=Expiration(days=days))
+    )
+    minio_client.set_bucket_lifecycle(bucket_name, LifecycleConfig(rules))
+
+
+def build_tts_cache(minio_client, bucket_name: str) -> Optional[TTSAudioCache]:
+    """
+    依環境變數建立快取，停用或缺少 redis 套件時回傳 None：
+      TTS_CACHE_ENABLED              預設 true
+      TTS_CACHE_MAX_BYTES            快取索引涵蓋的物件總大小上限（預設 512MiB）
+      TTS_CACHE_MAX_TEXT_CHARS       超過此字數的文字不快取（預設 200）
+      TTS_CACHE_OBJECT_EXPIRY_DAYS   tts-cache/ 物件的 lifecycle 到期天數（預設 30）；
+                                     索引項目提早一天失效。設為 0 時不設定規則，物件永久保留
+    """
+    if os.environ.get("TTS_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    if not REDIS_AVAILABLE:
+        print("⚠️ [TTS Cache] 未安裝 redis 套件，停用 TTS 快取", flush=True)
+        return None
+    expiry_days = int(os.environ.get("TTS_CACHE_OBJECT_EXPIRY_DAYS", 30))
+    entry_ttl_s = None
+    if expiry_days > 0:
+        try:
+            ensure_object_expiry(minio_client, bucket_name, "tts-cache/", expiry_days)
+        except Exception as e:
+            # 沒有到期規則時物件不會被刪除，索引仍照常過期
+            print(f"⚠️ [TTS Cache] 設定 lifecycle 規則失敗: {e}", flush=True)
+        entry_ttl_s = max(expiry_days - 1, 0.5) * 24 * 3600
+    client = redis.Redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+    return TTSAudioCache(
+        client,
+        max_bytes=int(os.environ.get("TTS_CACHE_MAX_BYTES", 512 * 1024 * 1024)),
+        max_text_chars=int(os.environ.get("TTS_CACHE_MAX_TEXT_CHARS", 200)),
+        entry_ttl_s=entry_ttl_s,
+    )
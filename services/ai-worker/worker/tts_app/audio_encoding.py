@@ -0,0 +1,116 @@
+# 檔名: audio_encoding.py
+# 說明: 在記憶體中把 TTS 波形編碼為 m4a 並串流上傳，不經過暫存檔。
+#       float32 PCM 經 stdin 餵給 ffmpeg，編碼後的位元組從 stdout 直接交給上傳函式（MinIO put_object）。
+#       輸出為 fragmented MP4（AAC），因為非 seekable 的管線無法回寫一般 MP4 的 moov。
+#       串流合成的 HLS 片段則編碼為 MPEG-TS：每段各自獨立，時間戳以 offset 接續前一段。
+
+import subprocess
+import threading
+from typing import BinaryIO, Callable, List, Optional, Sequence
+
+import numpy as np
+
+SAMPLE_RATE = 24000
+_PCM_CHUNK_BYTES = 64 * 1024
+
+
+class EncodeError(RuntimeError):
+    """編碼器失敗；此時上傳的內容不完整，呼叫端應刪除該物件。"""
+
+
+def samples_to_ms(num_samples: int, sample_rate: int = SAMPLE_RATE) -> int:
+    return int(num_samples / sample_rate * 1000)
+
+
+def ffmpeg_m4a_command(sample_rate: int = SAMPLE_RATE, bitrate: str = "64k") -> List[str]:
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "f32le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        "-c:a", "aac", "-b:a", bitrate,
+        "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-f", "mp4", "pipe:1",
+    ]
+
+
+def ffmpeg_ts_command(offset_s: float, sample_rate: int = SAMPLE_RATE, bitrate: str = "64k") -> List[str]:
+    """HLS 媒體片段：AAC in MPEG-TS，`offset_s` 為此段在整段音訊中的起點。"""
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "f32le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        "-c:a", "aac", "-b:a", bitrate,
+        "-output_ts_offset", f"{offset_s:.3f}",
+        "-f", "mpegts", "pipe:1",
+    ]
+
+
+class _CountingReader:
+    """包住編碼器 stdout，記錄實際上傳的位元組數。"""
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def stream_encoded_upload(
+    waveform: np.ndarray,
+    upload: Callable[[BinaryIO], None],
+    sample_rate: int = SAMPLE_RATE,
+    command: Optional[Sequence[str]] = None,
+) -> int:
+    """
+    把單聲道 float 波形餵給編碼器，並以 `upload(stream)` 消費編碼輸出，回傳上傳的位元組數。
+    寫入 stdin 與讀取 stderr 在背景執行緒進行，避免管線緩衝區塞滿造成互相等待。
+    """
+    pcm = np.ascontiguousarray(waveform, dtype="<f4").tobytes()
+    process = subprocess.Popen(
+        list(command or ffmpeg_m4a_command(sample_rate)),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stderr_chunks: List[bytes] = []
+
+    def _feed():
+        try:
+            view = memoryview(pcm)
+            for offset in range(0, len(view), _PCM_CHUNK_BYTES):
+                process.stdin.write(view[offset : offset + _PCM_CHUNK_BYTES])
+        except (BrokenPipeError, ValueError):
+            pass  # 編碼器提早結束，錯誤由返回碼回報
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    def _drain_stderr():
+        stderr_chunks.append(process.stderr.read())
+
+    threads = [
+        threading.Thread(target=_feed, name="tts-encode-feed", daemon=True),
+        threading.Thread(target=_drain_stderr, name="tts-encode-stderr", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    reader = _CountingReader(process.stdout)
+    try:
+        upload(reader)
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+        process.stdout.close()
+        process.wait()
+
+    if process.returncode != 0:
+        message = b"".join(stderr_chunks).decode("utf-8", errors="replace").strip()
+        raise EncodeError(f"音訊編碼失敗 (exit {process.returncode}): {message[-500:]}")
+    return reader.bytes_read
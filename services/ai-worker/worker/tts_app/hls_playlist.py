@@ -0,0 +1,36 @@
+# 檔名: hls_playlist.py
+# 說明: 串流合成的 HLS 媒體播放清單（RFC 8216）。片段為各自獨立的 MPEG-TS，不需要 #EXT-X-MAP；
+#       生成中的清單為 EVENT 類型（只會在尾端追加），結束時補上 #EXT-X-ENDLIST。
+
+import math
+from typing import List, Sequence, Tuple
+
+HLS_VERSION = 3
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+SEGMENT_CONTENT_TYPE = "video/mp2t"
+
+
+def target_duration(segment_ms: Sequence[int], floor_s: int = 1) -> int:
+    """#EXT-X-TARGETDURATION：任何片段四捨五入後的長度都不可超過此值。"""
+    longest = max(segment_ms, default=0) / 1000
+    return max(floor_s, math.ceil(longest))
+
+
+def media_playlist(entries: List[Tuple[str, int]], target_duration_s: int, ended: bool = False) -> str:
+    """
+    `entries` 為 (片段 URI, 長度毫秒)，URI 相對於播放清單所在目錄。
+    生成過程中 target_duration_s 應保持不變（播放器只讀一次），由呼叫端依片段長度上限決定。
+    """
+    lines = [
+        "#EXTM3U",
+        f"#EXT-X-VERSION:{HLS_VERSION}",
+        f"#EXT-X-TARGETDURATION:{target_duration_s}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+    ]
+    for uri, duration_ms in entries:
+        lines.append(f"#EXTINF:{duration_ms / 1000:.3f},")
+        lines.append(uri)
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
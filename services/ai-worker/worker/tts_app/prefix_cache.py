@@ -0,0 +1,76 @@
+# 檔名: prefix_cache.py
+# 說明: 固定提示前綴的 KV 快取。每個 Orpheus 提示都以 start-of-human token 與 "<voice>:" 開頭，
+#       這段前綴的 past key/values 對同一個聲音永遠相同：每個聲音只計算一次，
+#       之後每次 generate 都以快取的副本開始，只需要對使用者文字做 prefill。
+#       只用於未編譯（eager）的單句生成：編譯版本使用綁在模型上的靜態快取，無法接續 DynamicCache，
+#       需要前綴快取時以 TTS_COMPILE=false 停用編譯。
+
+import copy
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+import torch
+from transformers import DynamicCache
+
+
+def configured_voices(default_voice: str) -> List[str]:
+    """預設聲音加上 TTS_VOICES（逗號分隔）列出的其他聲音，去除重複並保持順序。"""
+    voices = [default_voice] + os.environ.get("TTS_VOICES", "").split(",")
+    return list(dict.fromkeys(voice.strip() for voice in voices if voice and voice.strip()))
+
+
+class PrefixKVCache:
+    """
+    以前綴 token 序列為鍵保存 DynamicCache（批次大小 1），最多保留 `max_entries` 個，超過時淘汰最久未用的。
+    `generate()` 會複製快取再交給模型，生成過程對快取的寫入不會影響下一次請求。
+    """
+
+    def __init__(self, model, max_entries: int = 8):
+        self.model = model
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, ...], DynamicCache]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _compute(self, prefix_ids: torch.Tensor) -> DynamicCache:
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=prefix_ids,
+                attention_mask=torch.ones_like(prefix_ids),
+                past_key_values=DynamicCache(),
+                use_cache=True,
+            )
+        return outputs.past_key_values
+
+    def cache_for(self, prefix_ids: torch.Tensor) -> DynamicCache:
+        """回傳前綴 KV 快取的副本；第一次遇到該前綴時計算並保存。"""
+        key = tuple(prefix_ids.reshape(-1).tolist())
+        with self._lock:
+            cache = self._entries.get(key)
+            if cache is None:
+                cache = self._compute(prefix_ids)
+                self._entries[key] = cache
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            return copy.deepcopy(cache)
+
+    def generate(self, prefix_ids: torch.Tensor, suffix_ids: torch.Tensor, **generate_kwargs) -> torch.Tensor:
+        """
+        以 `prefix_ids + suffix_ids`（皆為 (1, n)）生成；前綴部分直接取自快取，
+        回傳值與不使用快取時相同，包含完整的提示與新 token。
+        """
+        past_key_values = self.cache_for(prefix_ids)
+        input_ids = torch.cat([prefix_ids, suffix_ids], dim=1)
+        with torch.no_grad():
+            return self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past_key_values,
+                **generate_kwargs,
+            )
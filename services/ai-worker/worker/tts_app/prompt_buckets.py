@@ -0,0 +1,47 @@
+# 檔名: prompt_buckets.py
+# 說明: 提示長度分桶。torch.compile 後的模型遇到新的輸入形狀會重新編譯，
+#       把提示左側補齊到固定的幾種長度，啟動時逐一預熱，上線後就不會在請求路徑上編譯。
+
+import os
+from typing import List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (32, 64, 128, 256)
+# 單句合成與串流合成的生成上限；分段合成另由 TTS_SEGMENT_MAX_NEW_TOKENS 設定
+DEFAULT_MAX_NEW_TOKENS = 1200
+
+
+def parse_buckets(spec: str) -> List[int]:
+    """解析 "32,64,128" 形式的設定，回傳排序後的正整數列表；空字串代表停用分桶。"""
+    return sorted({int(part) for part in spec.split(",") if part.strip() and int(part) > 0})
+
+
+def buckets_from_env() -> List[int]:
+    spec = os.environ.get("TTS_PROMPT_BUCKETS")
+    if spec is None:
+        return list(DEFAULT_BUCKETS)
+    return parse_buckets(spec)
+
+
+def warmup_batch_sizes() -> Tuple[int, ...]:
+    """
+    預熱的批次大小。預設為 1..TTS_SEGMENT_BATCH_SIZE：分段合成每批最多 TTS_SEGMENT_BATCH_SIZE 段，
+    最後一批可能是其中任何大小，單句合成則是 1。TTS_WARMUP_BATCH_SIZES 可明確指定。
+    """
+    spec = os.environ.get("TTS_WARMUP_BATCH_SIZES")
+    if spec:
+        return tuple(parse_buckets(spec)) or (1,)
+    max_batch = max(1, int(os.environ.get("TTS_SEGMENT_BATCH_SIZE", 4)))
+    return tuple(range(1, max_batch + 1))
+
+
+def segment_max_new_tokens() -> int:
+    """分段合成的生成上限；編譯版本的靜態 KV 快取長度由它決定，預熱與正式請求需讀同一個值。"""
+    return int(os.environ.get("TTS_SEGMENT_MAX_NEW_TOKENS", DEFAULT_MAX_NEW_TOKENS))
+
+
+def bucket_length(length: int, buckets: Sequence[int]) -> int:
+    """回傳不小於 length 的最小桶長度；超過最大桶時維持原長度（此時可能觸發重新編譯）。"""
+    for bucket in buckets:
+        if length <= bucket:
+            return bucket
+    return length
@@ -0,0 +1,194 @@
+# 檔名: snac_codes.py
+# 說明: 把 Orpheus 產生的 token 轉成 SNAC 三層 codes。
+#       每個音訊 frame 由 7 個 token 組成，依固定順序分配到三層：
+#         layer_1: [0]    layer_2: [1, 4]    layer_3: [2, 3, 5, 6]
+#       第 k 個位置的 token 帶有 k * 4096 的偏移，需先減去。
+
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+import torch
+
+START_OF_AUDIO_TOKEN = 128257
+END_OF_SPEECH_TOKEN = 128258
+AUDIO_TOKEN_OFFSET = 128266
+CODEBOOK_SIZE = 4096
+FRAME_SIZE = 7
+# snac_24khz 每個第一層 code（即每個 frame）對應的樣本數，約 85ms
+SAMPLES_PER_FRAME = 2048
+
+_POSITION_OFFSETS = torch.arange(FRAME_SIZE, dtype=torch.long) * CODEBOOK_SIZE
+_LAYER_2_POSITIONS = [1, 4]
+_LAYER_3_POSITIONS = [2, 3, 5, 6]
+
+
+def redistribute_codes(generated_ids: torch.Tensor) -> List[Optional[List[torch.Tensor]]]:
+    """
+    以張量運算把一批生成結果 (batch, seq_len) 轉成每列的 SNAC codes。
+
+    每列只取最後一個 START_OF_AUDIO_TOKEN 之後的 token，去掉 END_OF_SPEECH_TOKEN，
+    截到 7 的倍數後 reshape 成 (frames, 7) 再分層，不需要逐 token 呼叫 `.item()`。
+    回傳每列 `[layer_1, layer_2, layer_3]`（int32，形狀 (1, n)），沒有完整 frame 時為 None。
+    """
+    if generated_ids.dim() == 1:
+        generated_ids = generated_ids.unsqueeze(0)
+    generated_ids = generated_ids.to(torch.long)
+    seq_len = generated_ids.size(1)
+
+    # 每列最後一個起始 token 的位置（沒有時為 -1），整批一次算出
+    is_start = generated_ids == START_OF_AUDIO_TOKEN
+    last_from_end = is_start.flip(1).to(torch.int8).argmax(dim=1)
+    last_start = torch.where(
+        is_start.any(dim=1), seq_len - 1 - last_from_end, torch.full_like(last_from_end, -1)
+    )
+    positions = torch.arange(seq_len, device=generated_ids.device)
+    keep = (positions.unsqueeze(0) > last_start.unsqueeze(1)) & (generated_ids != END_OF_SPEECH_TOKEN)
+
+    results: List[Optional[List[torch.Tensor]]] = []
+    for row, row_keep in zip(generated_ids, keep):
+        codes = row[row_keep]
+        num_frames = codes.numel() // FRAME_SIZE
+        results.append(_split_layers(codes[: num_frames * FRAME_SIZE]) if num_frames else None)
+    return results
+
+
+def _split_layers(tokens: torch.Tensor) -> List[torch.Tensor]:
+    """把 7 的倍數個音訊 token 轉成三層 codes（int32，形狀 (1, n)）。"""
+    num_frames = tokens.numel() // FRAME_SIZE
+    offsets = _POSITION_OFFSETS.to(tokens.device)
+    frames = (tokens.to(torch.long) - AUDIO_TOKEN_OFFSET).view(num_frames, FRAME_SIZE) - offsets
+    layers = [
+        frames[:, 0],
+        frames[:, _LAYER_2_POSITIONS].reshape(-1),
+        frames[:, _LAYER_3_POSITIONS].reshape(-1),
+    ]
+    return [layer.to(torch.int32).unsqueeze(0) for layer in layers]
+
+
+def decode_batch(
+    decode: Callable[[List[torch.Tensor]], torch.Tensor],
+    items: List[List[torch.Tensor]],
+    samples_per_frame: int = SAMPLES_PER_FRAME,
+) -> List[torch.Tensor]:
+    """
+    把多個請求的 codes 合成一批呼叫一次 `decode`，再切回各自的波形 (1, 1, frames * samples_per_frame)。
+    長度不同時，較短者以最後一個 frame 重複補齊到批次內最長，輸出再裁掉補齊的部分。
+    """
+    if len(items) == 1:
+        return [decode(items[0])]
+    lengths = [codes[0].shape[1] for codes in items]
+    longest = max(lengths)
+    layers = []
+    for layer_index, ratio in enumerate((1, 2, 4)):
+        rows = []
+        for codes, length in zip(items, lengths):
+            layer = codes[layer_index]
+            missing = (longest - length) * ratio
+            if missing:
+                layer = torch.cat([layer, layer[:, -ratio:].repeat(1, missing // ratio)], dim=1)
+            rows.append(layer)
+        layers.append(torch.cat(rows, dim=0))
+    audio = decode(layers)
+    return [
+        audio[row : row + 1, :, : length * samples_per_frame]
+        for row, length in enumerate(lengths)
+    ]
+
+
+class WindowedSnacDecoder:
+    """
+    生成過程中逐步解碼：`feed()` 接收新產生的 token，累積到 `window_frames` 個新 frame 就解碼一次。
+
+    每次解碼時往左多帶 `context_frames` 個已輸出的 frame、右邊保留 `lookahead_frames` 個 frame
+    等下一批再輸出，只取中間那段的樣本，讓相鄰片段在接縫處的波形連續。
+    `decode(codes)` 為 SNAC 的 decode，回傳 (1, 1, frames * samples_per_frame) 的張量。
+    """
+
+    def __init__(
+        self,
+        decode: Callable[[List[torch.Tensor]], torch.Tensor],
+        window_frames: int = 12,
+        context_frames: int = 2,
+        lookahead_frames: int = 1,
+        samples_per_frame: int = SAMPLES_PER_FRAME,
+    ):
+        self.decode = decode
+        self.window_frames = max(1, window_frames)
+        self.context_frames = max(0, context_frames)
+        self.lookahead_frames = max(0, lookahead_frames)
+        self.samples_per_frame = samples_per_frame
+        self._tokens: List[int] = []
+        self._started = False
+        self._finished = False
+        self._emitted_frames = 0
+
+    @property
+    def num_frames(self) -> int:
+        return len(self._tokens) // FRAME_SIZE
+
+    def _push(self, token_ids: Iterable[int]) -> None:
+        for token in token_ids:
+            if self._finished:
+                return
+            if token == START_OF_AUDIO_TOKEN:
+                # 與批次版本相同：以最後一個起始 token 之後的內容為準
+                self._tokens, self._started, self._emitted_frames = [], True, 0
+            elif token == END_OF_SPEECH_TOKEN:
+                self._finished = self._started
+            elif self._started:
+                self._tokens.append(int(token))
+
+    def _decode_frames(self, end: int) -> Optional[np.ndarray]:
+        start = self._emitted_frames
+        if end <= start:
+            return None
+        left = max(0, start - self.context_frames)
+        tokens = torch.tensor(self._tokens[left * FRAME_SIZE : end * FRAME_SIZE], dtype=torch.long)
+        audio = self.decode(_split_layers(tokens)).reshape(-1)
+        skip = (start - left) * self.samples_per_frame
+        samples = audio[skip : skip + (end - start) * self.samples_per_frame]
+        self._emitted_frames = end
+        return samples.detach().cpu().numpy()
+
+    def feed(self, token_ids: Iterable[int]) -> List[np.ndarray]:
+        """加入新 token，回傳可以輸出的音訊片段（可能為空）。"""
+        self._push(token_ids)
+        ready = self.num_frames - self.lookahead_frames
+        if ready - self._emitted_frames < self.window_frames:
+            return []
+        segment = self._decode_frames(ready)
+        return [segment] if segment is not None else []
+
+    def flush(self) -> List[np.ndarray]:
+        """生成結束後輸出剩下的所有 frame。"""
+        segment = self._decode_frames(self.num_frames)
+        return [segment] if segment is not None else []
+
+
+def redistribute_codes_loop(generated_ids: torch.Tensor) -> List[Optional[List[torch.Tensor]]]:
+    """原本逐 token 的 Python 實作，保留作為等價性測試與效能比較的基準。"""
+    results: List[Optional[List[torch.Tensor]]] = []
+    for row in generated_ids:
+        token_indices = (row == START_OF_AUDIO_TOKEN).nonzero(as_tuple=True)[0]
+        last_occurrence_idx = token_indices[-1].item() if len(token_indices) > 0 else -1
+        cropped_tensor = row[last_occurrence_idx + 1 :]
+        masked_row = cropped_tensor[cropped_tensor != END_OF_SPEECH_TOKEN]
+        new_length = (masked_row.size(0) // 7) * 7
+        code_list = [t.item() - AUDIO_TOKEN_OFFSET for t in masked_row[:new_length]]
+        if not code_list:
+            results.append(None)
+            continue
+        layer_1, layer_2, layer_3 = [], [], []
+        for i in range(len(code_list) // 7):
+            base = 7 * i
+            layer_1.append(code_list[base])
+            layer_2.append(code_list[base + 1] - 4096)
+            layer_3.append(code_list[base + 2] - (2 * 4096))
+            layer_3.append(code_list[base + 3] - (3 * 4096))
+            layer_2.append(code_list[base + 4] - (4 * 4096))
+            layer_3.append(code_list[base + 5] - (5 * 4096))
+            layer_3.append(code_list[base + 6] - (6 * 4096))
+        results.append(
+            [torch.tensor(layer, dtype=torch.int32).unsqueeze(0) for layer in [layer_1, layer_2, layer_3]]
+        )
+    return results
@@ -0,0 +1,95 @@
+# 檔名: synthesis_plan.py
+# 說明: 長文字的合成規劃。依中文句讀把回覆切成多段，各段一起以批次送進 TTS 模型，
+#       再以短交叉淡化接回一段音訊。每段長度有上限，生成成本與 max_new_tokens 截斷都只受單段影響。
+
+import re
+from typing import Callable, List, Sequence, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# 句末標點（含全形與半形），切在標點之後
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;…\n])")
+# 句子過長時的次要切點
+_CLAUSE_END = re.compile(r"(?<=[，,、：:])")
+
+
+def _pack(pieces: Sequence[str], max_chars: int) -> List[str]:
+    """把相鄰的小片段合併，每段盡量接近但不超過 max_chars。"""
+    segments: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            segments.append(current)
+            current = ""
+        current += piece
+    if current:
+        segments.append(current)
+    return segments
+
+
+def split_sentences(text: str, max_chars: int = 60, min_chars: int = 8) -> List[str]:
+    """
+    依句末標點切段；超過 max_chars 的句子再依逗號等切分，仍過長時硬切。
+    短於 min_chars 的段落併入前一段，避免合成極短、語調不自然的片段。
+    """
+    text = (text or "").strip()
+    if not text:
+        return []
+
+    pieces: List[str] = []
+    for sentence in filter(None, (s.strip() for s in _SENTENCE_END.split(text))):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in _pack([c for c in _CLAUSE_END.split(sentence) if c], max_chars):
+            pieces.extend(clause[i : i + max_chars] for i in range(0, len(clause), max_chars))
+
+    segments = _pack(pieces, max_chars)
+    merged: List[str] = []
+    for segment in segments:
+        if merged and len(segment) < min_chars and len(merged[-1]) + len(segment) <= max_chars + min_chars:
+            merged[-1] += segment
+        else:
+            merged.append(segment)
+    return merged
+
+
+def crossfade_concat(
+    waveforms: Sequence[np.ndarray], sample_rate: int, crossfade_ms: float = 30.0
+) -> np.ndarray:
+    """以等功率交叉淡化依序接起各段波形；重疊長度不超過相鄰兩段中較短者的一半。"""
+    waveforms = [np.asarray(w, dtype=np.float32).reshape(-1) for w in waveforms if w is not None and len(w)]
+    if not waveforms:
+        return np.zeros(0, dtype=np.float32)
+
+    result = waveforms[0]
+    fade = int(sample_rate * crossfade_ms / 1000)
+    for waveform in waveforms[1:]:
+        overlap = min(fade, len(result) // 2, len(waveform) // 2)
+        if overlap <= 0:
+            result = np.concatenate([result, waveform])
+            continue
+        t = np.linspace(0.0, np.pi / 2, overlap, dtype=np.float32)
+        mixed = result[-overlap:] * np.cos(t) + waveform[:overlap] * np.sin(t)
+        result = np.concatenate([result[:-overlap], mixed, waveform[overlap:]])
+    return result
+
+
+def pipelined(batches: Sequence[T], start: Callable[[T], Callable[[], List[R]]]) -> List[R]:
+    """
+    依序對每批呼叫 `start(batch)`：它同步執行 generate、送出解碼，回傳收取結果的 `finish()`。
+    前一批的結果等下一批送出之後才收取，解碼因此與下一批的 generate 重疊；結果維持原順序。
+    """
+    results: List[R] = []
+    pending = None
+    for batch in batches:
+        started = start(batch)
+        if pending is not None:
+            results.extend(pending())
+        pending = started
+    if pending is not None:
+        results.extend(pending())
+    return results
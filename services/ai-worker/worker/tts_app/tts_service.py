@@ -1,12 +1,17 @@
 # 檔名: tts_service.py
 # 說明: 此檔案整合了 TTS 模型引擎與 MinIO 上傳服務，提供一個完整的文字轉語音服務。
 
+import io
 import os
+import queue
 import subprocess
-import tempfile
+import threading
+import time
 import uuid
+from concurrent.futures import Future
+from contextlib import nullcontext
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
 import pyrubberband as pyrb
@@ -16,11 +21,44 @@ import soundfile as sf
 import torch
 from minio import Minio
 from minio.error import S3Error
-from mutagen import File
 from opencc import OpenCC
-from pydub import AudioSegment
 from snac import SNAC
 from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+from transformers import StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+
+from batching import MicroBatcher
+from metrics import TTS_COMPILE_SECONDS, TTS_RECOMPILES, track_stage
+from tts_app.audio_cache import build_tts_cache, cache_key
+from tts_app.audio_encoding import (
+    SAMPLE_RATE,
+    EncodeError,
+    ffmpeg_m4a_command,
+    ffmpeg_ts_command,
+    samples_to_ms,
+    stream_encoded_upload,
+)
+from tts_app.hls_playlist import (
+    PLAYLIST_CONTENT_TYPE,
+    SEGMENT_CONTENT_TYPE,
+    media_playlist,
+    target_duration,
+)
+from tts_app.prefix_cache import PrefixKVCache, configured_voices
+from tts_app.prompt_buckets import (
+    DEFAULT_MAX_NEW_TOKENS,
+    bucket_length,
+    buckets_from_env,
+    segment_max_new_tokens,
+    warmup_batch_sizes,
+)
+from tts_app.snac_codes import (
+    SAMPLES_PER_FRAME,
+    WindowedSnacDecoder,
+    decode_batch,
+    redistribute_codes,
+)
+from tts_app.synthesis_plan import crossfade_concat, pipelined, split_sentences
 
 # --- Hugging Face CLI 登入 ---
 # 在 Docker 環境中，.env 的變數由 docker-compose 的 env_file 直接注入，
@@ -52,6 +90,44 @@ else:
     print(">>> 未提供 Hugging Face Token，將以匿名方式進行操作。", flush=True)
 
 
+class _TokenQueueStreamer(BaseStreamer):
+    """把 generate() 逐步產生的 token 放進佇列；第一次 put 是提示本身，略過。"""
+
+    def __init__(self):
+        self.tokens: "queue.Queue[Optional[List[int]]]" = queue.Queue()
+        self._prompt_seen = False
+
+    def put(self, value):
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        self.tokens.put(value.reshape(-1).tolist())
+
+    def end(self):
+        self.tokens.put(None)
+
+
+class _StopAfter(StoppingCriteria):
+    """預熱用：只跑前幾步就停，但 max_new_tokens 與正式請求相同，靜態快取的形狀才一致。"""
+
+    def __init__(self, steps: int, prompt_length: int):
+        self.max_length = prompt_length + steps
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = input_ids.shape[1] >= self.max_length
+        return torch.full((input_ids.shape[0],), done, dtype=torch.bool, device=input_ids.device)
+
+
+def _compiled_graph_count() -> int:
+    """torch.compile 目前已編譯的圖數量；用來偵測請求路徑上的重新編譯。"""
+    try:
+        from torch._dynamo.utils import counters
+
+        return int(counters["stats"]["unique_graphs"])
+    except Exception:
+        return 0
+
+
 # --- TTS 核心引擎 (原 optimized_inference_engine.py) ---
 class OptimizedOrpheusTTS:
     """
@@ -87,22 +163,75 @@ class OptimizedOrpheusTTS:
             model_id, quantization_config=quantization_config, device_map="auto"
         )
 
-        print(">>> 正在使用 torch.compile() 編譯模型以獲取極致性能...", flush=True)
-        try:
-            self.model = torch.compile(
-                self.model, mode="reduce-overhead", fullgraph=True
-            )
-            print("✅ 模型編譯成功。", flush=True)
-        except Exception as e:
-            print(f"⚠️ 模型編譯失敗，將使用未編譯版本。錯誤: {e}", flush=True)
+        # 編譯 forward 而不是整個模型：generate() 走的是原模型的 forward，包一層 OptimizedModule 不會生效。
+        # 搭配靜態 KV 快取與提示長度分桶，輸入形狀只有固定幾種，啟動時預熱完就不會再編譯。
+        # TTS_COMPILE=false 時改用未編譯版本，此時單句生成可使用聲音前綴 KV 快取
+        self.prompt_buckets = buckets_from_env()
+        self.compiled = False
+        self._eager_forward = self.model.forward
+        if os.environ.get("TTS_COMPILE", "true").lower() == "true":
+            print(">>> 正在使用 torch.compile() 編譯模型以獲取極致性能...", flush=True)
+            try:
+                self.model.forward = torch.compile(
+                    self.model.forward, mode="reduce-overhead", fullgraph=True
+                )
+                self.compiled = True
+                print(f"✅ 模型編譯設定完成，提示長度分桶: {self.prompt_buckets}", flush=True)
+            except Exception as e:
+                print(f"⚠️ 模型編譯失敗，將使用未編譯版本。錯誤: {e}", flush=True)
+        else:
+            print(">>> TTS_COMPILE=false，使用未編譯版本", flush=True)
+        self._warmed_up = False
+        # 編譯版本共用模型上的靜態 KV 快取與 CUDA graph，同一時間只能有一個 generate
+        self._compiled_generate_lock = threading.Lock()
 
         # 不再需要傳遞 token 參數
         self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_id)
         self.snac_model = SNAC.from_pretrained(snac_id).cpu()
+        # SNAC 解碼在獨立執行緒上進行：併發請求的 codes 合併成一批解碼，
+        # 呼叫端的執行緒等待解碼時，其他請求的 generate 可以繼續使用 GPU
+        self.snac_batcher = MicroBatcher(
+            self._decode_codes_batch,
+            max_batch_size=int(os.environ.get("TTS_SNAC_BATCH_SIZE", 8)),
+            max_wait_ms=float(os.environ.get("TTS_SNAC_BATCH_WINDOW_MS", 5)),
+            name="snac",
+        )
         self.cc = OpenCC("t2s.json")
 
+        # 每個聲音的固定前綴（start-of-human + "<voice>:"）只計算一次 KV；
+        # 編譯版本使用靜態快取與分桶補齊，前綴快取只用於未編譯的單句生成
+        self.prefix_cache = (
+            PrefixKVCache(
+                self.model,
+                max_entries=max(8, len(configured_voices(os.environ.get("TTS_DEFAULT_VOICE", "")))),
+            )
+            if os.environ.get("TTS_PREFIX_CACHE", "true").lower() == "true"
+            else None
+        )
+        self._voice_prefixes: Dict[str, torch.Tensor] = {}
+
         print("✅ Orpheus TTS 引擎已成功載入並優化。", flush=True)
 
+    def _voice_prefix(self, voice: str) -> torch.Tensor:
+        """提示中與聲音相關的固定前綴 token：start-of-human、BOS 與 "<voice>:"。"""
+        prefix = self._voice_prefixes.get(voice)
+        if prefix is None:
+            voice_ids = self.tokenizer(f"{voice}:", return_tensors="pt").input_ids
+            prefix = torch.cat([torch.tensor([[128259]], dtype=torch.long), voice_ids], dim=1)
+            self._voice_prefixes[voice] = prefix
+        return prefix
+
+    def prime_prefix_cache(self, voices: List[str]) -> None:
+        """預先計算各聲音前綴的 KV 快取；編譯版本不使用前綴快取，直接略過。"""
+        if self.prefix_cache is None:
+            return
+        if self.compiled:
+            print("ℹ️ [TTS] 編譯版本不使用聲音前綴 KV 快取（需要時設定 TTS_COMPILE=false）", flush=True)
+            return
+        for voice in voices:
+            self.prefix_cache.cache_for(self._voice_prefix(voice).to(self.model.device))
+        print(f"✅ [TTS] 已預先計算聲音前綴 KV 快取: {voices}", flush=True)
+
     def _prepare_prompts_for_batch(
         self, prompts: List[str], voice: str
     ) -> Tuple[torch.Tensor, torch.Tensor]:
@@ -115,7 +244,10 @@ class OptimizedOrpheusTTS:
             input_ids = self.tokenizer(p, return_tensors="pt").input_ids
             modified_ids = torch.cat([start_token, input_ids, end_tokens], dim=1)
             all_modified_input_ids.append(modified_ids)
+        # 分桶只為了讓編譯版本的輸入形狀固定；未編譯時照原本補齊到批次內最長
         max_length = max(ids.shape[1] for ids in all_modified_input_ids)
+        if self.compiled:
+            max_length = bucket_length(max_length, self.prompt_buckets)
         all_padded_tensors, all_attention_masks = [], []
         padding_token_id = 128263
         for ids in all_modified_input_ids:
@@ -140,85 +272,261 @@ class OptimizedOrpheusTTS:
             all_attention_masks, dim=0
         )
 
-    def _decode_and_redistribute(
-        self, generated_ids_batch: torch.Tensor
-    ) -> List[torch.Tensor]:
-        token_to_find, token_to_remove = 128257, 128258
-        code_lists = []
-        for row in generated_ids_batch:
-            token_indices = (row == token_to_find).nonzero(as_tuple=True)[0]
-            last_occurrence_idx = (
-                token_indices[-1].item() if len(token_indices) > 0 else -1
+    def _decode_codes_batch(self, items: List[List[torch.Tensor]]) -> List[torch.Tensor]:
+        with torch.no_grad():
+            return decode_batch(self.snac_model.decode, items)
+
+    def _submit_decode(self, generated_ids_batch: torch.Tensor) -> List[Optional[Future]]:
+        """把每個樣本的 codes 送進 SNAC 解碼執行緒，立即回傳；沒有有效 codes 的樣本為 None。"""
+        return [
+            self.snac_batcher.submit(codes) if codes is not None else None
+            for codes in redistribute_codes(generated_ids_batch)
+        ]
+
+    def close(self) -> None:
+        """停止 SNAC 解碼執行緒。"""
+        self.snac_batcher.close()
+
+    def _generate(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        max_new_tokens: int,
+        prefix_ids: Optional[torch.Tensor] = None,
+        **kwargs,
+    ) -> torch.Tensor:
+        """
+        所有 generate 呼叫的共同入口：套用取樣參數，並在預熱後偵測重新編譯。
+        單句、未補齊且以 `prefix_ids` 開頭的輸入改由前綴 KV 快取接續生成。
+        編譯版本的 generate 以鎖序列化：靜態快取與 CUDA graph 綁在共用的模型上，
+        併發呼叫會互相覆寫，因此併發請求在此依序等待。
+        """
+        kwargs.update(
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=0.33,
+            top_p=0.43,
+            repetition_penalty=1.5,
+            eos_token_id=128258,
+            pad_token_id=128263,
+        )
+        if self.compiled:
+            kwargs.setdefault("cache_implementation", "static")
+            guard = self._compiled_generate_lock
+        elif self._can_use_prefix_cache(input_ids, attention_mask, prefix_ids):
+            prefix_len = prefix_ids.shape[1]
+            return self.prefix_cache.generate(
+                input_ids[:, :prefix_len], input_ids[:, prefix_len:], **kwargs
             )
-            cropped_tensor = row[last_occurrence_idx + 1 :]
-            masked_row = cropped_tensor[cropped_tensor != token_to_remove]
-            new_length = (masked_row.size(0) // 7) * 7
-            trimmed_row = masked_row[:new_length]
-            final_codes = [t.item() - 128266 for t in trimmed_row]
-            code_lists.append(final_codes)
-        output_waveforms = []
-        for code_list in code_lists:
-            if not code_list:
-                output_waveforms.append(torch.tensor([]))
-                continue
-            layer_1, layer_2, layer_3 = [], [], []
-            num_frames = len(code_list) // 7
-            for i in range(num_frames):
-                base = 7 * i
-                layer_1.append(code_list[base])
-                layer_2.append(code_list[base + 1] - 4096)
-                layer_3.append(code_list[base + 2] - (2 * 4096))
-                layer_3.append(code_list[base + 3] - (3 * 4096))
-                layer_2.append(code_list[base + 4] - (4 * 4096))
-                layer_3.append(code_list[base + 5] - (5 * 4096))
-                layer_3.append(code_list[base + 6] - (6 * 4096))
-            codes = [
-                torch.tensor(layer, dtype=torch.int32).unsqueeze(0)
-                for layer in [layer_1, layer_2, layer_3]
-            ]
+        else:
+            guard = nullcontext()
+        with guard:
+            graphs_before = _compiled_graph_count()
             with torch.no_grad():
-                audio_hat = self.snac_model.decode(codes)
-            output_waveforms.append(audio_hat)
-        return output_waveforms
+                generated_ids = self.model.generate(
+                    input_ids=input_ids, attention_mask=attention_mask, **kwargs
+                )
+            recompiled = _compiled_graph_count() > graphs_before
+        if self._warmed_up and recompiled:
+            shape = f"{input_ids.shape[0]}x{input_ids.shape[1]}"
+            TTS_RECOMPILES.labels(shape=shape).inc()
+            print(f"⚠️ [TTS] 請求路徑上發生重新編譯，輸入形狀 {shape}", flush=True)
+        return generated_ids
+
+    def _can_use_prefix_cache(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        prefix_ids: Optional[torch.Tensor],
+    ) -> bool:
+        if self.prefix_cache is None or prefix_ids is None or input_ids.shape[0] != 1:
+            return False
+        prefix_len = prefix_ids.shape[1]
+        return (
+            input_ids.shape[1] > prefix_len
+            and bool(attention_mask.all())
+            and torch.equal(input_ids[0, :prefix_len].cpu(), prefix_ids[0])
+        )
 
-    def synthesize(
-        self, prompt: str, voice: str, output_path: str, speed_rate: float = 1.0
-    ):
-        print(f"\n>>> 正在合成: '{prompt}'", flush=True)
-        input_ids, attention_mask = self._prepare_prompts_for_batch([prompt], voice)
+    def warmup(
+        self,
+        voice: str,
+        batch_sizes: Tuple[int, ...] = (1,),
+        max_new_tokens: int = 1200,
+        steps: int = 8,
+    ) -> Dict[str, float]:
+        """
+        對每個（批次大小, 提示長度桶）跑一次短生成，讓編譯發生在啟動時而不是第一個請求。
+        回傳各形狀的耗時（秒）；預熱失敗代表編譯版本無法執行，改回未編譯的 forward。
+        """
+        if not self.compiled:
+            self._warmed_up = True
+            return {}
+        prompt_ids = self.tokenizer(f"{voice}: 你好", return_tensors="pt").input_ids
+        compile_seconds: Dict[str, float] = {}
+        for batch_size in batch_sizes:
+            for bucket in self.prompt_buckets:
+                if prompt_ids.shape[1] + 3 > bucket:
+                    continue
+                ids = torch.cat(
+                    [
+                        torch.tensor([[128259]]),
+                        prompt_ids,
+                        torch.tensor([[128009, 128260]]),
+                    ],
+                    dim=1,
+                )
+                padding = bucket - ids.shape[1]
+                input_ids = torch.cat(
+                    [torch.full((1, padding), 128263, dtype=torch.long), ids], dim=1
+                ).repeat(batch_size, 1)
+                attention_mask = torch.cat(
+                    [torch.zeros((1, padding), dtype=torch.long), torch.ones_like(ids)], dim=1
+                ).repeat(batch_size, 1)
+                shape = f"{batch_size}x{bucket}"
+                started = time.perf_counter()
+                try:
+                    self._generate(
+                        input_ids.to(self.model.device),
+                        attention_mask.to(self.model.device),
+                        max_new_tokens,
+                        stopping_criteria=StoppingCriteriaList(
+                            [_StopAfter(steps, bucket)]
+                        ),
+                    )
+                except Exception as e:
+                    print(f"⚠️ [TTS] 預熱 {shape} 失敗，改用未編譯版本: {e}", flush=True)
+                    self.model.forward = self._eager_forward
+                    self.compiled = False
+                    self._warmed_up = True
+                    return compile_seconds
+                compile_seconds[shape] = time.perf_counter() - started
+                TTS_COMPILE_SECONDS.labels(shape=shape).set(compile_seconds[shape])
+                print(f"🔥 [TTS] 預熱 {shape} 完成，耗時 {compile_seconds[shape]:.1f}s", flush=True)
+        self._warmed_up = True
+        return compile_seconds
+
+    def start_waveforms(
+        self,
+        prompts: List[str],
+        voice: str,
+        speed_rate: float = 1.0,
+        max_new_tokens: int = 1200,
+    ) -> Callable[[], List[Optional[np.ndarray]]]:
+        """
+        以一次 generate 合成多段文字（左側補齊成同一批），送出 SNAC 解碼後立即返回，
+        回傳的函式等待解碼完成並依序回傳各段 24kHz float32 波形；沒有產生有效音訊的段落為 None。
+        解碼在獨立執行緒上進行，呼叫端可以在收取結果之前先發出下一批 generate。
+        """
+        print(f"\n>>> 正在合成 {len(prompts)} 段: {prompts}", flush=True)
+        input_ids, attention_mask = self._prepare_prompts_for_batch(prompts, voice)
         input_ids, attention_mask = input_ids.to(self.model.device), attention_mask.to(
             self.model.device
         )
 
-        with torch.no_grad():
-            generated_ids = self.model.generate(
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                max_new_tokens=1200,
-                do_sample=True,
-                temperature=0.33,
-                top_p=0.43,
-                repetition_penalty=1.5,
-                eos_token_id=128258,
-            )
-
-        output_samples = self._decode_and_redistribute(generated_ids.to("cpu"))
+        generated_ids = self._generate(
+            input_ids,
+            attention_mask,
+            max_new_tokens,
+            prefix_ids=self._voice_prefix(voice) if len(prompts) == 1 else None,
+        )
+        futures = self._submit_decode(generated_ids.to("cpu"))
+
+        def finish() -> List[Optional[np.ndarray]]:
+            waveforms: List[Optional[np.ndarray]] = []
+            for future in futures:
+                sample = future.result() if future is not None else torch.tensor([])
+                if sample.numel() == 0:
+                    waveforms.append(None)
+                    continue
+                audio_numpy = sample.squeeze().numpy()
+                if speed_rate != 1.0:
+                    print(f"   >>> 正在調整語速為: {speed_rate}x", flush=True)
+                    audio_numpy = pyrb.time_stretch(y=audio_numpy, sr=SAMPLE_RATE, rate=speed_rate)
+                waveforms.append(audio_numpy)
+            return waveforms
+
+        return finish
+
+    def generate_waveforms(
+        self,
+        prompts: List[str],
+        voice: str,
+        speed_rate: float = 1.0,
+        max_new_tokens: int = 1200,
+    ) -> List[Optional[np.ndarray]]:
+        """同 `start_waveforms`，但等待解碼完成後才返回。"""
+        return self.start_waveforms(prompts, voice, speed_rate, max_new_tokens)()
+
+    def generate_waveform(
+        self, prompt: str, voice: str, speed_rate: float = 1.0
+    ) -> Optional[np.ndarray]:
+        """合成單句並回傳 24kHz float32 波形；沒有產生有效音訊時回傳 None。"""
+        return self.generate_waveforms([prompt], voice, speed_rate)[0]
+
+    def stream_waveform(
+        self,
+        prompt: str,
+        voice: str,
+        window_frames: int = 12,
+        context_frames: int = 2,
+    ) -> Iterator[np.ndarray]:
+        """
+        邊生成邊解碼：每累積 `window_frames` 個 SNAC frame（每個約 85ms）就輸出一段 24kHz 波形，
+        第一段音訊在生成約一秒後即可取得，而不是等整句生成結束。串流模式不支援語速調整。
+        """
+        print(f"\n>>> 正在串流合成: '{prompt}'", flush=True)
+        input_ids, attention_mask = self._prepare_prompts_for_batch([prompt], voice)
+        input_ids, attention_mask = input_ids.to(self.model.device), attention_mask.to(
+            self.model.device
+        )
+        streamer = _TokenQueueStreamer()
+        errors: List[BaseException] = []
 
-        if output_samples and output_samples[0].numel() > 0:
-            audio_numpy = output_samples[0].squeeze().numpy()
-            if speed_rate != 1.0:
-                print(f"   >>> 正在調整語速為: {speed_rate}x", flush=True)
-                audio_numpy = pyrb.time_stretch(
-                    y=audio_numpy, sr=24000, rate=speed_rate
+        def _generate():
+            try:
+                self._generate(
+                    input_ids,
+                    attention_mask,
+                    1200,
+                    prefix_ids=self._voice_prefix(voice),
+                    streamer=streamer,
                 )
+            except BaseException as e:
+                errors.append(e)
+                streamer.end()
 
-            sf.write(output_path, audio_numpy, 24000)
+        decoder = WindowedSnacDecoder(
+            self.snac_batcher, window_frames=window_frames, context_frames=context_frames
+        )
+        thread = threading.Thread(target=_generate, name="tts-generate", daemon=True)
+        thread.start()
+        while True:
+            tokens = streamer.tokens.get()
+            if tokens is None:
+                break
+            yield from decoder.feed(tokens)
+        thread.join()
+        if errors:
+            raise errors[0]
+        yield from decoder.flush()
+
+    def synthesize(
+        self, prompt: str, voice: str, output_path: str, speed_rate: float = 1.0
+    ):
+        audio_numpy = self.generate_waveform(prompt, voice, speed_rate)
+        if audio_numpy is not None:
+            sf.write(output_path, audio_numpy, SAMPLE_RATE)
             print(f"✅ 音訊已成功儲存至: {output_path}", flush=True)
         else:
             print("⚠️ 警告：未生成有效音訊。", flush=True)
 
 
 # --- 整合後的 TTS 服務 ---
+# 串流上傳時長度未知，MinIO 以分段上傳處理（每段至少 5MiB）
+UPLOAD_PART_SIZE = 5 * 1024 * 1024
+
+
 class TTSService:
     def __init__(self):
         # MinIO 客戶端設定
@@ -230,11 +538,14 @@ class TTSService:
         )
         self.bucket_name = os.environ.get("MINIO_BUCKET_NAME", "audio-bucket")
         self._ensure_bucket_exists()
+        # 固定語句（主動關懷問候、拒答等）的合成結果以內容定址快取，命中時不經過模型
+        self.audio_cache = build_tts_cache(self.minio_client, self.bucket_name)
 
         # TTS 引擎設定 (從 .env 讀取)
         MODEL_ID = os.environ.get("TTS_MODEL_ID")
         TOKENIZER_ID = os.environ.get("TTS_TOKENIZER_ID")
         self.default_voice = os.environ.get("TTS_DEFAULT_VOICE")
+        self.model_id = MODEL_ID
 
         # 檢查必要的設定是否存在，若否則拋出錯誤
         if not all([MODEL_ID, TOKENIZER_ID, self.default_voice]):
@@ -246,6 +557,20 @@ class TTSService:
         self.tts_engine = OptimizedOrpheusTTS(
             model_id=MODEL_ID, tokenizer_id=TOKENIZER_ID
         )
+        # 啟動時依提示長度分桶預熱編譯，批次大小與生成上限都與分段合成相同
+        if os.environ.get("TTS_COMPILE_WARMUP", "true").lower() == "true":
+            segment_tokens = segment_max_new_tokens()
+            self.tts_engine.warmup(
+                self.default_voice,
+                batch_sizes=warmup_batch_sizes(),
+                max_new_tokens=segment_tokens,
+            )
+            if segment_tokens != DEFAULT_MAX_NEW_TOKENS:
+                # 單句與串流合成以預設上限生成，批次大小 1 另外預熱這個長度
+                self.tts_engine.warmup(
+                    self.default_voice, batch_sizes=(1,), max_new_tokens=DEFAULT_MAX_NEW_TOKENS
+                )
+        self.tts_engine.prime_prefix_cache(configured_voices(self.default_voice))
 
     def _ensure_bucket_exists(self):
         """確保 MinIO bucket 存在。"""
@@ -268,98 +593,179 @@ class TTSService:
         speed_rate = 1.0
         voice = self.default_voice
 
-        temp_audio_file = None
-        temp_m4a_file = None  # <<-- 修改處 2: 為 m4a 檔案預留變數
-        try:
-            # 1. 建立一個臨時檔案來儲存合成的音訊 (WAV)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-                temp_audio_file = tmp.name
-
-            # 2. 合成音訊並儲存到臨時 WAV 檔案
-            self.tts_engine.synthesize(
-                prompt=text,
-                voice=voice,
-                output_path=temp_audio_file,
-                speed_rate=speed_rate,
+        key = None
+        if self.audio_cache is not None and self.audio_cache.cacheable(text):
+            key = cache_key(
+                text,
+                voice,
+                speed_rate,
+                model_id=self.model_id,
+                sample_rate=SAMPLE_RATE,
+                encoding=" ".join(ffmpeg_m4a_command(SAMPLE_RATE)),
             )
+            cached = self.audio_cache.lookup(key)
+            if cached is not None:
+                print(f"TTS 快取命中: {cached[0]}", flush=True)
+                return cached
+
+        # 1. 合成波形（留在記憶體中），長度由取樣數計算
+        waveform = self._synthesize_planned(text, voice, speed_rate)
+        if waveform is None or waveform.size == 0:
+            raise ValueError("TTS 引擎未能產出有效的音訊。")
+        duration_ms = samples_to_ms(len(waveform), SAMPLE_RATE)
+
+        # 2. 邊編碼邊上傳：ffmpeg 的輸出直接串流進 MinIO，不落地暫存檔
+        object_name = (
+            self.audio_cache.object_name(key) if key else f"{uuid.uuid4()}.m4a"
+        )
+        print(f"Uploading {object_name} to bucket {self.bucket_name}...", flush=True)
 
-            # 3. 獲取音訊元數據 (從原始 WAV 檔案)
-            if (
-                not os.path.exists(temp_audio_file)
-                or os.path.getsize(temp_audio_file) == 0
-            ):
-                raise ValueError("TTS 引擎未能產出有效的音訊檔案。")
-
-            metadata = {}
-            duration_ms = 0
+        try:
+            audio_data_len = self._upload_waveform(object_name, waveform, duration_ms)
+        except EncodeError:
+            # 編碼中途失敗時已上傳的物件不完整，刪除後再拋出
             try:
-                with sf.SoundFile(temp_audio_file) as f:
-                    duration_ms = int(len(f) / f.samplerate * 1000)
-                    metadata["duration-ms"] = str(duration_ms)
-            except Exception as e:
-                print(f"無法讀取音訊元數據: {e}", flush=True)
-
-            # <<-- 修改處 3: 新增 WAV 到 M4A 的轉換步驟 -->>
-            print(f"開始將 {temp_audio_file} 轉換為 M4A 格式...", flush=True)
-            temp_m4a_file = temp_audio_file.replace(".wav", ".m4a")
-            # 從 WAV 載入音訊
-            audio = AudioSegment.from_wav(temp_audio_file)
-            # 匯出為 M4A 格式 (AAC 編碼)
-            audio.export(temp_m4a_file, format="mp4", codec="aac")
-            print(f"成功轉換檔案至: {temp_m4a_file}", flush=True)
-            # <<------------------------------------>>
-
-            # 4. 準備上傳 M4A 檔案
-            object_name = f"{uuid.uuid4()}.m4a"
-            audio_data_len = os.path.getsize(
-                temp_m4a_file
-            )  # <<-- 修改處 4: 取得 m4a 的檔案大小
-
-            print(
-                f"Uploading {object_name} to bucket {self.bucket_name}...", flush=True
+                self.minio_client.remove_object(self.bucket_name, object_name)
+            except S3Error:
+                pass
+            raise
+        except Exception as e:
+            print(f"在 TTS 合成或上傳過程中發生錯誤: {e}", flush=True)
+            raise
+
+        print(f"成功上傳 {object_name}, 長度: {duration_ms}ms.", flush=True)
+        if key:
+            self.audio_cache.store(key, object_name, duration_ms, audio_data_len)
+        return object_name, duration_ms
+
+
+    def _synthesize_planned(
+        self, text: str, voice: str, speed_rate: float
+    ) -> Optional[np.ndarray]:
+        """
+        長回覆依句讀切段（每段最多 TTS_SEGMENT_MAX_CHARS 字），每 TTS_SEGMENT_BATCH_SIZE 段
+        一起送進模型，再以 TTS_CROSSFADE_MS 的交叉淡化接回一段；短回覆維持單次合成。
+        """
+        segments = split_sentences(
+            text, max_chars=int(os.environ.get("TTS_SEGMENT_MAX_CHARS", 60))
+        )
+        if len(segments) <= 1:
+            return self.tts_engine.generate_waveform(
+                prompt=text, voice=voice, speed_rate=speed_rate
             )
 
-            # 使用轉換後的 M4A 檔案進行上傳
-            with open(
-                temp_m4a_file, "rb"
-            ) as audio_file_data:  # <<-- 修改處 5: 開啟 m4a 檔案
-                self.minio_client.put_object(
-                    self.bucket_name,
+        batch_size = max(1, int(os.environ.get("TTS_SEGMENT_BATCH_SIZE", 4)))
+        max_new_tokens = segment_max_new_tokens()
+        print(f"長文字切為 {len(segments)} 段合成（每批 {batch_size} 段）", flush=True)
+        # 前一批在 SNAC 執行緒上解碼的同時，下一批已經開始 generate
+        waveforms = pipelined(
+            [segments[start : start + batch_size] for start in range(0, len(segments), batch_size)],
+            lambda batch: self.tts_engine.start_waveforms(
+                batch, voice, speed_rate=speed_rate, max_new_tokens=max_new_tokens
+            ),
+        )
+        missing = [segments[i] for i, w in enumerate(waveforms) if w is None]
+        if missing:
+            print(f"⚠️ 警告：{len(missing)} 段未生成有效音訊: {missing}", flush=True)
+        return crossfade_concat(
+            waveforms, SAMPLE_RATE, float(os.environ.get("TTS_CROSSFADE_MS", 30))
+        )
+
+    def synthesize_stream(
+        self, text: str, upload_segments: bool = False, playlist: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        串流合成：每產生一段音訊就 yield 一次
+        {"index", "waveform", "offset_ms", "duration_ms"}，可邊生成邊播放。
+
+        upload_segments=True 時每段各自編碼為 MPEG-TS 上傳到 tts-stream/<id>/seg-XXXX.ts（"object_name"）；
+        playlist=True 時另外維護同目錄下的 HLS 媒體播放清單 playlist.m3u8（"playlist"），每上傳一段就更新一次。
+        """
+        voice = self.default_voice
+        window_frames = int(os.environ.get("TTS_STREAM_WINDOW_FRAMES", 12))
+        prefix = f"tts-stream/{uuid.uuid4()}"
+        playlist_name = f"{prefix}/playlist.m3u8"
+        # 每段最多 window_frames 個 frame 再加上保留的一個 lookahead frame
+        target_s = target_duration(
+            [samples_to_ms((window_frames + 1) * SAMPLES_PER_FRAME, SAMPLE_RATE)]
+        )
+        entries: List[Tuple[str, int]] = []
+        offset_ms = 0
+
+        for index, waveform in enumerate(
+            self.tts_engine.stream_waveform(text, voice, window_frames=window_frames)
+        ):
+            duration_ms = samples_to_ms(len(waveform), SAMPLE_RATE)
+            segment = {
+                "index": index,
+                "waveform": waveform,
+                "offset_ms": offset_ms,
+                "duration_ms": duration_ms,
+            }
+            if upload_segments or playlist:
+                object_name = f"{prefix}/seg-{index:04d}.ts"
+                self._upload_waveform(
                     object_name,
-                    audio_file_data,
-                    length=audio_data_len,
-                    content_type="audio/m4a",  # content_type 現在與檔案內容一致
-                    metadata=metadata,
+                    waveform,
+                    duration_ms,
+                    command=ffmpeg_ts_command(offset_ms / 1000, SAMPLE_RATE),
+                    content_type=SEGMENT_CONTENT_TYPE,
                 )
+                segment["object_name"] = object_name
+                entries.append((object_name.rsplit("/", 1)[-1], duration_ms))
+                if playlist:
+                    target_s = max(target_s, target_duration([duration_ms]))
+                    self._put_playlist(playlist_name, media_playlist(entries, target_s))
+                    segment["playlist"] = playlist_name
+            offset_ms += duration_ms
+            yield segment
+
+        if playlist and entries:
+            self._put_playlist(playlist_name, media_playlist(entries, target_s, ended=True))
+
+    def _upload_waveform(
+        self,
+        object_name: str,
+        waveform: np.ndarray,
+        duration_ms: int,
+        command: Optional[List[str]] = None,
+        content_type: str = "audio/m4a",
+    ) -> int:
+        def upload(stream):
+            self.minio_client.put_object(
+                self.bucket_name,
+                object_name,
+                stream,
+                length=-1,
+                part_size=UPLOAD_PART_SIZE,
+                content_type=content_type,
+                metadata={"duration-ms": str(duration_ms)},
+            )
 
-            print(f"成功上傳 {object_name}, 長度: {duration_ms}ms.", flush=True)
-            return object_name, duration_ms
-
-        except Exception as e:
-            print(f"在 TTS 合成或上傳過程中發生錯誤: {e}", flush=True)
-            raise
-        finally:
-            # 5. 清理所有臨時檔案
-            if temp_audio_file and os.path.exists(temp_audio_file):
-                os.remove(temp_audio_file)
-                print(f"已刪除臨時 WAV 檔案: {temp_audio_file}", flush=True)
+        with track_stage("minio_upload"):
+            return stream_encoded_upload(waveform, upload, SAMPLE_RATE, command=command)
+
+    def _put_playlist(self, playlist_name: str, playlist: str) -> None:
+        data = playlist.encode("utf-8")
+        self.minio_client.put_object(
+            self.bucket_name,
+            playlist_name,
+            io.BytesIO(data),
+            length=len(data),
+            content_type=PLAYLIST_CONTENT_TYPE,
+        )
 
-            if temp_m4a_file and os.path.exists(temp_m4a_file):
-                os.remove(temp_m4a_file)
-                print(f"已刪除臨時 M4A 檔案: {temp_m4a_file}", flush=True)
+    def close(self) -> None:
+        """模型卸載時由 model_registry 呼叫，停止引擎的背景執行緒。"""
+        self.tts_engine.close()
 
 
 # --- 單例實例與工廠模式 ---
-_tts_service_instance: Optional[TTSService] = None
-
-
 def get_tts_service() -> TTSService:
-    """工廠函式，用於獲取 TTSService 的單例。"""
-    global _tts_service_instance
-    if _tts_service_instance is None:
-        print("首次初始化 TTSService...", flush=True)
-        _tts_service_instance = TTSService()
-    return _tts_service_instance
+    """工廠函式，用於獲取 TTSService 的單例（由模型常駐管理統一載入）。"""
+    from model_registry import get_model_registry
+
+    return get_model_registry().get("tts")
 
 
 # --- 更新後的測試區塊 ---
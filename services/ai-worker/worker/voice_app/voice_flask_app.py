@@ -46,6 +46,8 @@ def _maybe_start_worker_in_api_process():
 
 @app.before_first_request
 def initialize_worker():
+    from model_registry import start_model_residency
+    start_model_residency()
     _maybe_start_worker_in_api_process()
 
 @app.route('/')
@@ -62,6 +64,7 @@ def health_check():
     """整體健康檢查"""
     try:
         worker_status = "healthy" if voice_worker and voice_worker.connection else "unhealthy"
+        from model_registry import get_model_registry
         
         return jsonify({
             "status": "healthy" if worker_status == "healthy" else "degraded",
@@ -70,7 +73,8 @@ def health_check():
             "components": {
                 "voice_worker": worker_status,
                 "rabbitmq": worker_status  # worker狀態反映rabbitmq狀態
-            }
+            },
+            "models": get_model_registry().status()
         })
     except Exception as e:
         logger.error("Health check failed: %s", e)
@@ -101,9 +105,9 @@ def process_stt():
         import sys
         import os
         sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-        from stt_app.stt_service import get_stt_service
-        stt_service = get_stt_service()
-        transcription = stt_service.transcribe_audio(bucket_name, object_name)
+        from model_registry import get_model_registry
+        with get_model_registry().use("stt") as stt_service:
+            transcription = stt_service.transcribe_audio(bucket_name, object_name)
         
         return jsonify({
             'transcription': transcription,
@@ -118,6 +122,97 @@ def process_stt():
             'error': f'STT processing failed: {str(e)}'
         }), 500
 
+_stt_streams = None
+_stt_streams_lock = threading.Lock()
+
+def _get_stt_streams():
+    """行程共用的串流轉錄 sessions；每段串流期間持有 STT 模型（model_registry.use("stt")）"""
+    global _stt_streams
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from model_registry import get_model_registry
+    from stt_app.streaming import StreamSessions
+    with _stt_streams_lock:
+        if _stt_streams is None:
+            _stt_streams = StreamSessions(
+                lambda: get_model_registry().use("stt"),
+                idle_timeout_s=float(os.getenv("STT_STREAM_IDLE_TIMEOUT_S", 60)),
+            )
+        return _stt_streams
+
+@app.route('/voice/stt/stream/<audio_id>/chunk', methods=['POST'])
+def process_stt_stream_chunk(audio_id):
+    """
+    串流STT：錄音進行中逐段上傳音訊（16kHz 單聲道 16-bit little-endian PCM，request body 為原始位元組）
+    遇到停頓時 partial 逐字稿即寫入該 audio_id 的語音片段緩衝
+    """
+    try:
+        patient_id = request.args.get('patient_id')
+        if not patient_id:
+            return jsonify({
+                'error': 'Missing required query parameter: patient_id'
+            }), 400
+
+        from stt_app.streaming import pcm16_to_float
+        samples = pcm16_to_float(request.get_data())
+        transcriber = _get_stt_streams().feed(patient_id, audio_id, samples)
+
+        return jsonify({
+            'audio_id': audio_id,
+            'buffered_seconds': transcriber.buffered_seconds,
+            'partials': len(transcriber.partials),
+            'patient_id': patient_id
+        })
+
+    except Exception as e:
+        logger.error("STT stream chunk error: %s", e)
+        return jsonify({
+            'error': f'STT stream chunk failed: {str(e)}'
+        }), 500
+
+@app.route('/voice/stt/stream/<audio_id>/finish', methods=['POST'])
+def process_stt_stream_finish(audio_id):
+    """
+    串流STT結束：辨識剩下的尾端，交給 LLM（handle_user_message is_final=True，audio_id 相同）
+    與已緩衝的 partial 合併成完整逐字稿後回覆
+    """
+    try:
+        data = request.get_json() or {}
+        patient_id = data.get('patient_id')
+        if not patient_id:
+            return jsonify({
+                'error': 'Missing required field: patient_id'
+            }), 400
+
+        streams = _get_stt_streams()
+        try:
+            tail_text = streams.finish(patient_id, audio_id)
+        except KeyError:
+            return jsonify({
+                'error': f'No open STT stream for audio_id {audio_id}'
+            }), 404
+
+        from llm_app.llm_service import get_llm_service
+        ai_response_text = get_llm_service().generate_response({
+            'patient_id': patient_id,
+            'line_user_id': data.get('line_user_id'),
+            'text': tail_text,
+            'object_name': audio_id,
+        })
+
+        return jsonify({
+            'audio_id': audio_id,
+            'tail_transcription': tail_text,
+            'ai_response_text': ai_response_text,
+            'patient_id': patient_id
+        })
+
+    except Exception as e:
+        logger.error("STT stream finish error: %s", e)
+        return jsonify({
+            'error': f'STT stream finish failed: {str(e)}'
+        }), 500
+
 @app.route('/voice/tts', methods=['POST'])
 def process_tts():
     """
@@ -143,9 +238,9 @@ def process_tts():
         import sys
         import os
         sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-        from tts_app.tts_service import get_tts_service
-        tts_service = get_tts_service()
-        object_name, duration_ms = tts_service.synthesize_text(text)
+        from model_registry import get_model_registry
+        with get_model_registry().use("tts") as tts_service:
+            object_name, duration_ms = tts_service.synthesize_text(text)
         
         return jsonify({
             'object_name': object_name,
@@ -159,6 +254,69 @@ def process_tts():
             'error': f'TTS processing failed: {str(e)}'
         }), 500
 
+@app.route('/voice/tts/stream', methods=['POST'])
+def process_tts_stream():
+    """
+    串流TTS：邊生成邊上傳 HLS 片段，第一段上傳後立即回傳播放清單
+    其餘片段在背景繼續生成，播放清單結束時帶有 #EXT-X-ENDLIST
+    """
+    try:
+        data = request.get_json()
+        if not data or 'text' not in data:
+            return jsonify({
+                'error': 'Missing required field: text'
+            }), 400
+
+        text = data['text']
+        patient_id = data.get('patient_id', 'anonymous')
+
+        if not text.strip():
+            return jsonify({
+                'error': 'Text content cannot be empty'
+            }), 400
+
+        import sys
+        import os
+        sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+        from model_registry import get_model_registry
+
+        first_segment = {}
+        ready = threading.Event()
+
+        def _stream():
+            try:
+                # 整段生成期間持有模型，避免被閒置回收
+                with get_model_registry().use("tts") as tts_service:
+                    for segment in tts_service.synthesize_stream(text, playlist=True):
+                        if not ready.is_set():
+                            first_segment.update(segment)
+                            ready.set()
+            except Exception as e:
+                logger.error("TTS stream error: %s", e)
+                first_segment.setdefault('error', str(e))
+            finally:
+                ready.set()
+
+        threading.Thread(target=_stream, daemon=True).start()
+        if not ready.wait(timeout=float(os.getenv("TTS_STREAM_FIRST_SEGMENT_TIMEOUT_S", 30))):
+            return jsonify({
+                'error': 'TTS stream did not produce audio in time'
+            }), 504
+        if 'playlist' not in first_segment:
+            raise RuntimeError(first_segment.get('error', 'no audio generated'))
+
+        return jsonify({
+            'playlist': first_segment['playlist'],
+            'first_segment': first_segment['object_name'],
+            'patient_id': patient_id
+        })
+
+    except Exception as e:
+        logger.error("TTS stream processing error: %s", e)
+        return jsonify({
+            'error': f'TTS stream processing failed: {str(e)}'
+        }), 500
+
 @app.route('/voice/chat', methods=['POST'])
 def process_voice_chat():
     """
@@ -181,17 +339,16 @@ def process_voice_chat():
         import sys
         import os
         sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-        from stt_app.stt_service import get_stt_service
-        stt_service = get_stt_service()
-        user_transcription = stt_service.transcribe_audio(bucket_name, object_name)
+        from model_registry import get_model_registry
+        with get_model_registry().use("stt") as stt_service:
+            user_transcription = stt_service.transcribe_audio(bucket_name, object_name)
         
         # Step 2: LLM
         ai_response_text = generate_llm_response(user_transcription, patient_id, conversation_id)
         
         # Step 3: TTS
-        from tts_app.tts_service import get_tts_service
-        tts_service = get_tts_service()
-        ai_audio_object, duration_ms = tts_service.synthesize_text(ai_response_text)
+        with get_model_registry().use("tts") as tts_service:
+            ai_audio_object, duration_ms = tts_service.synthesize_text(ai_response_text)
         
         return jsonify({
             'user_transcription': user_transcription,
@@ -7,6 +7,7 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from stt_app.stt_service import get_stt_service
 from tts_app.tts_service import get_tts_service
 from llm_app.llm_service import get_llm_service
+from model_registry import get_model_registry, start_model_residency
 
 # 配置日誌
 logging.basicConfig(
@@ -22,16 +23,24 @@ class VoiceWorker:
         self.connection = None
         self.channel = None
         
-        # 服務實例
-        self.stt_service = get_stt_service()
-        self.tts_service = get_tts_service()
-        self.llm_service = get_llm_service()
-        
         # 隊列名稱
         self.stt_queue = os.environ.get("VOICE_STT_QUEUE", "voice_stt_queue")
         self.tts_queue = os.environ.get("VOICE_TTS_QUEUE", "voice_tts_queue")
         self.chat_queue = os.environ.get("VOICE_CHAT_QUEUE", "voice_chat_queue")
     
+    # 服務實例：由模型常駐管理統一載入，每次使用時取得，避免重複載入模型
+    @property
+    def stt_service(self):
+        return get_stt_service()
+
+    @property
+    def tts_service(self):
+        return get_tts_service()
+
+    @property
+    def llm_service(self):
+        return get_llm_service()
+
     def connect(self):
         """連接到RabbitMQ"""
         try:
@@ -66,7 +75,8 @@ class VoiceWorker:
             patient_id = task_data.get('patient_id', 'anonymous')
             
             # 執行語音轉文字
-            transcription = self.stt_service.transcribe_audio(bucket_name, object_name)
+            with get_model_registry().use("stt") as stt_service:
+                transcription = stt_service.transcribe_audio(bucket_name, object_name)
             
             # 構建回應
             response = {
@@ -102,7 +112,8 @@ class VoiceWorker:
             patient_id = task_data.get('patient_id', 'anonymous')
             
             # 執行文字轉語音
-            object_name, duration_ms = self.tts_service.synthesize_text(text)
+            with get_model_registry().use("tts") as tts_service:
+                object_name, duration_ms = tts_service.synthesize_text(text)
             
             # 構建回應
             response = {
@@ -140,7 +151,8 @@ class VoiceWorker:
             
             # Step 1: STT - 語音轉文字
             logger.info("開始STT處理: %s", object_name)
-            user_transcription = self.stt_service.transcribe_audio(bucket_name, object_name)
+            with get_model_registry().use("stt") as stt_service:
+                user_transcription = stt_service.transcribe_audio(bucket_name, object_name)
             logger.info("STT完成: %s", user_transcription)
             
             # Step 2: LLM - 生成AI回應
@@ -155,7 +167,8 @@ class VoiceWorker:
             
             # Step 3: TTS - 文字轉語音
             logger.info("開始TTS處理")
-            ai_audio_object, duration_ms = self.tts_service.synthesize_text(ai_response_text)
+            with get_model_registry().use("tts") as tts_service:
+                ai_audio_object, duration_ms = tts_service.synthesize_text(ai_response_text)
             logger.info("TTS完成: %s", ai_audio_object)
             
             # 構建回應
@@ -271,6 +284,7 @@ def get_voice_worker():
 
 def main():
     """主函數"""
+    start_model_residency()
     worker = get_voice_worker()
     worker.start_consuming()
 
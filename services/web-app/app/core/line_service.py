@@ -85,8 +85,8 @@ class LineService:
             try:
                 # 取得 RabbitMQ 服務
                 rabbitmq_service = get_rabbitmq_service()
-                # 從環境變數讀取任務隊列名稱，預設為 'task_queue'
-                task_queue_name = os.environ.get("RABBITMQ_QUEUE", "task_queue")
+                # 文字任務走獨立的優先 lane，不會排在語音任務的積壓之後
+                task_queue_name = os.environ.get("RABBITMQ_TEXT_QUEUE", "text_task_queue")
                 # 發布一個任務到 RabbitMQ，讓後端 worker 進行非同步處理
                 rabbitmq_service.publish_message(
                     queue_name=task_queue_name,
@@ -5,13 +5,48 @@ import json # 用於解析 JSON 格式的訊息
 import threading # 用於在背景執行緒中運行監聽器，避免阻塞主程式
 import time # 用於在重試連線時暫停
 import logging # 用於記錄錯誤日誌
+from collections import OrderedDict # 用於記錄已處理過的通知事件（有上限的 LRU）
 from functools import partial # 用於包裝回呼函式，傳遞額外參數
 from app.extensions import db, socketio
 from app.models.models import UserAlert
 
+# ai-worker 的通知事件：transcript / reply 為 TTS 完成前的進度事件，final 為最終結果
+EVENT_TRANSCRIPT = "transcript"
+EVENT_REPLY = "reply"
+EVENT_FINAL = "final"
+
+# 已處理過的 (task_id, event)，用來忽略重新投遞的訊息並避免重複推播文字
+_DELIVERED_EVENTS_MAX = 4096
+_delivered_events = OrderedDict()
+_delivered_lock = threading.Lock()
+
+
+def _was_delivered(task_id, event):
+    if not task_id:
+        return False
+    with _delivered_lock:
+        return (task_id, event) in _delivered_events
+
+
+def _mark_delivered(task_id, event):
+    if not task_id:
+        return
+    with _delivered_lock:
+        _delivered_events[(task_id, event)] = True
+        _delivered_events.move_to_end((task_id, event))
+        while len(_delivered_events) > _DELIVERED_EVENTS_MAX:
+            _delivered_events.popitem(last=False)
+
+
 def message_callback(ch, method, properties, body, app):
     """
     處理從 RabbitMQ 收到的聊天通知訊息。
+
+    訊息帶有 task_id 與 event 時可重複投遞而不會重複推播：
+    - transcript：只推送到 Web 前端。
+    - reply：先把文字回覆推到 LINE，不必等語音合成完成。
+    - final：推送最終結果；若同一任務的 reply 已送出，LINE 只補送音訊。
+    舊格式（沒有 event）視為 final 處理。
     """
     # 確保在 Flask 的應用程式上下文 (app_context) 中執行，以便能使用 Flask 的擴展功能
     with app.app_context():
@@ -22,10 +57,27 @@ def message_callback(ch, method, properties, body, app):
 
             patient_id = message.get("patient_id") # 獲取使用者 ID
             ai_response = message.get("ai_response") # 獲取 AI 回應內容
+            task_id = message.get("task_id")
+            event = message.get("event") or EVENT_FINAL
+
+            if _was_delivered(task_id, event):
+                print(f" [=] 通知 {task_id}/{event} 已處理過，略過", flush=True)
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
+
+            if not patient_id:
+                raise ValueError("通知訊息缺少 'patient_id' 欄位。")
+
+            if event == EVENT_TRANSCRIPT:
+                # 逐字稿只更新 Web 前端，LINE 端等回覆出來再推送
+                socketio.emit('notification', message, room=str(patient_id))
+                _mark_delivered(task_id, event)
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
 
             # 檢查必要欄位是否存在
-            if not patient_id or not ai_response:
-                raise ValueError("通知訊息缺少 'patient_id' 或 'ai_response' 欄位。")
+            if not ai_response:
+                raise ValueError("通知訊息缺少 'ai_response' 欄位。")
 
             # --- 1. 透過 WebSocket 將通知推播到 Web 前端 ---
             print(f" [>] 正在透過 WebSocket 發送通知: {message}", flush=True)
@@ -38,11 +90,17 @@ def message_callback(ch, method, properties, body, app):
             from .line_service import get_line_service
             line_service = get_line_service()
 
+            # 文字回覆已經以 reply 事件送出時，final 不再重複推送文字
+            reply_sent = event == EVENT_FINAL and _was_delivered(task_id, EVENT_REPLY)
+
             # 根據通知內容決定要傳送文字還是音訊
             response_audio_url = message.get("response_audio_url")
-            if response_audio_url:
-                # 如果有音訊 URL，則先傳送一段引導文字，再傳送音訊
+            if event == EVENT_REPLY:
                 line_service.push_text_message(user_id=patient_id, text=ai_response)
+            elif response_audio_url:
+                # 如果有音訊 URL，則先傳送一段引導文字，再傳送音訊
+                if not reply_sent:
+                    line_service.push_text_message(user_id=patient_id, text=ai_response)
 
                 # 直接從訊息中獲取由 ai-worker 計算好的音訊時長
                 duration_ms = message.get("audio_duration_ms", 60000) # 若無提供，預設為 60 秒
@@ -52,10 +110,12 @@ def message_callback(ch, method, properties, body, app):
                     object_name=response_audio_url,
                     duration=duration_ms
                 )
-            else:
+            elif not reply_sent:
                 # 如果沒有音訊 URL，只傳送文字回應
                 line_service.push_text_message(user_id=patient_id, text=ai_response)
 
+            _mark_delivered(task_id, event)
+
         except (json.JSONDecodeError, ValueError) as e:
             # 處理 JSON 解析錯誤或數值錯誤
             logging.error(f"無效的訊息格式或 JSON 解碼失敗: {e}")
@@ -1,6 +1,10 @@
 import pika
 import os
 import json
+import time
+
+# ai-worker 以此 header 計算任務在佇列中的等待時間
+ENQUEUED_AT_HEADER = 'x-enqueued-at-ms'
 
 class RabbitMQService:
     def __init__(self, rabbitmq_url: str):
@@ -30,6 +34,7 @@ class RabbitMQService:
                 body=message,
                 properties=pika.BasicProperties(
                     delivery_mode=2,  # make message persistent
+                    headers={ENQUEUED_AT_HEADER: int(time.time() * 1000)},
                 ))
             print(f" [x] Sent {message} to queue '{queue_name}'")
         except Exception as e: